@@ -0,0 +1,727 @@
+import os
+import re
+import sys
+import json
+import time
+import platform
+import statistics
+import tracemalloc
+import typing as ty
+import tempfile
+import logging
+import subprocess as sp
+from functools import lru_cache
+from contextlib import contextmanager
+from fnmatch import fnmatchcase
+from pathlib import Path
+from datetime import datetime
+from collections import defaultdict
+import attrs
+import yaml
+
+logger = logging.getLogger(__name__)
+
+# Script run in a fresh interpreter to time a single import and measure the growth of
+# the peak resident memory of the process caused by it
+IMPORT_SCRIPT = """
+import sys
+import time
+import json
+import resource
+from importlib import import_module
+
+before = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+start = time.perf_counter()
+import_module(sys.argv[1])
+elapsed = time.perf_counter() - start
+after = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+print(json.dumps({"time": elapsed, "maxrss": after - before}))
+"""
+
+IMPORTTIME_RE = re.compile(
+    r"^import time:\s+(\d+)\s+\|\s+(\d+)\s+\|(\s*)([\w\.]+)\s*$", flags=re.MULTILINE
+)
+
+
+@attrs.define
+class ImportBenchmark:
+    """The cost of importing a single module of a converted package
+
+    Parameters
+    ----------
+    module : str
+        the name of the imported module
+    cold_time : float
+        the time (s) taken to import the module without any cached bytecode
+    warm_time : float
+        the shortest time (s) taken to import the module once its bytecode is cached
+    memory : float
+        the increase in peak resident memory (MB) of the process caused by the import
+    dependencies : dict[str, float]
+        the time (s) spent importing each top-level package (excluding the time spent
+        in the packages they import in turn), as reported by `python -X importtime`
+    """
+
+    module: str = attrs.field()
+    cold_time: float = attrs.field()
+    warm_time: float = attrs.field()
+    memory: float = attrs.field()
+    dependencies: ty.Dict[str, float] = attrs.field(factory=dict)
+
+    def top_dependencies(self, n: int = 5) -> ty.List[ty.Tuple[str, float]]:
+        return sorted(self.dependencies.items(), key=lambda d: -d[1])[:n]
+
+
+def find_package_modules(
+    package_root: Path, package_name: ty.Optional[str] = None
+) -> ty.List[str]:
+    """Finds the names of the package and all its (non-test) modules within a
+    converted package repository
+
+    Parameters
+    ----------
+    package_root : Path
+        the root directory of the converted package repository
+    package_name : str, optional
+        the name of the package, e.g. 'pydra.tasks.fsl'. If not provided the sole
+        package found under 'pydra/tasks' is used
+
+    Returns
+    -------
+    list[str]
+        the names of the package and its modules, package first
+    """
+    if package_name is None:
+        candidates = [
+            p
+            for p in (package_root / "pydra" / "tasks").glob("*/__init__.py")
+            if not p.parent.name.startswith(("_", "."))
+        ]
+        if len(candidates) != 1:
+            raise ValueError(
+                f"Could not find a single package under {package_root}/pydra/tasks "
+                f"({candidates}), please specify it explicitly"
+            )
+        package_name = "pydra.tasks." + candidates[0].parent.name
+    package_dir = package_root.joinpath(*package_name.split("."))
+    if not (package_dir / "__init__.py").exists():
+        raise ValueError(f"Could not find package '{package_name}' in {package_root}")
+    modules = []
+    for fspath in sorted(package_dir.rglob("*.py")):
+        rel_parts = fspath.relative_to(package_dir).with_suffix("").parts
+        if any(p in ("tests", "conftest") or p.startswith("test_") for p in rel_parts):
+            continue
+        if rel_parts[-1] == "__init__":
+            rel_parts = rel_parts[:-1]
+        modules.append(".".join((package_name,) + rel_parts))
+    return sorted(modules, key=lambda m: (m != package_name, m))
+
+
+def parse_importtime(stderr: str) -> ty.Dict[str, float]:
+    """Attributes the import time reported by `python -X importtime` to the top-level
+    packages that were imported
+
+    Parameters
+    ----------
+    stderr : str
+        the standard error of the process run with `-X importtime`
+
+    Returns
+    -------
+    dict[str, float]
+        the time (s) spent importing the modules of each top-level package
+    """
+    self_times = defaultdict(float)
+    for self_us, _, _, module in IMPORTTIME_RE.findall(stderr):
+        self_times[module.split(".")[0]] += int(self_us) / 1e6
+    return dict(self_times)
+
+
+def benchmark_import(
+    module: str,
+    package_root: Path,
+    repeat: int = 3,
+    python: str = sys.executable,
+) -> ImportBenchmark:
+    """Benchmarks the import of a module in isolated subprocesses, once without any
+    cached bytecode (cold) and then `repeat` times with it (warm)
+
+    Parameters
+    ----------
+    module : str
+        the name of the module to import
+    package_root : Path
+        the root directory of the converted package repository, prepended to the
+        PYTHONPATH of the subprocesses
+    repeat : int
+        the number of warm imports to take the fastest of
+    python : str
+        the Python executable to run the imports with
+
+    Returns
+    -------
+    ImportBenchmark
+        the benchmark of the module import
+    """
+    env = dict(os.environ)
+    env["PYTHONPATH"] = os.pathsep.join(
+        [str(package_root)] + [p for p in [env.get("PYTHONPATH")] if p]
+    )
+    # Divisor to convert ru_maxrss to MB, which is in bytes on macOS and KB elsewhere
+    maxrss_scale = 1024**2 if sys.platform == "darwin" else 1024
+
+    def run(importtime: bool) -> ty.Tuple[dict, str]:
+        cmd = [python]
+        if importtime:
+            cmd += ["-X", "importtime"]
+        result = sp.run(
+            cmd + ["-c", IMPORT_SCRIPT, module],
+            env=env,
+            stdout=sp.PIPE,
+            stderr=sp.PIPE,
+            text=True,
+        )
+        if result.returncode:
+            raise RuntimeError(f"Could not import '{module}':\n{result.stderr}")
+        return json.loads(result.stdout.splitlines()[-1]), result.stderr
+
+    with tempfile.TemporaryDirectory() as pycache_prefix:
+        # A fresh bytecode cache means the first import has to compile everything
+        env["PYTHONPYCACHEPREFIX"] = pycache_prefix
+        cold, _ = run(importtime=False)
+        warm = [run(importtime=False)[0] for _ in range(repeat)]
+        _, importtime_stderr = run(importtime=True)
+    return ImportBenchmark(
+        module=module,
+        cold_time=cold["time"],
+        warm_time=min(w["time"] for w in warm),
+        memory=cold["maxrss"] / maxrss_scale,
+        dependencies=parse_importtime(importtime_stderr),
+    )
+
+
+@lru_cache(maxsize=None)
+def measure_import_time(module: str, python: str = sys.executable) -> float:
+    """Measures the time taken to import a module in a fresh interpreter. The result is
+    cached so each module is only measured once per process
+
+    Parameters
+    ----------
+    module : str
+        the name of the module to import
+    python : str
+        the Python executable to run the import with
+
+    Returns
+    -------
+    float
+        the time (s) taken to import the module, 0.0 if it could not be imported
+    """
+    result = sp.run(
+        [python, "-c", IMPORT_SCRIPT, module], stdout=sp.PIPE, stderr=sp.PIPE, text=True
+    )
+    if result.returncode:
+        logger.warning(
+            "Could not import '%s' to measure its import time:\n%s",
+            module,
+            result.stderr,
+        )
+        return 0.0
+    return json.loads(result.stdout.splitlines()[-1])["time"]
+
+
+def load_import_budget(budget_file: Path) -> ty.Dict[str, ty.Dict[str, float]]:
+    """Loads a budget file, which maps module names (or glob patterns of them) to the
+    maximum 'cold_time', 'warm_time' (s) and/or 'memory' (MB) allowed for their import,
+    e.g.
+
+        pydra.tasks.fsl:
+          warm_time: 0.5
+        pydra.tasks.fsl.*:
+          memory: 50
+    """
+    with open(budget_file) as f:
+        budget = yaml.safe_load(f) or {}
+    for pattern, limits in budget.items():
+        unrecognised = set(limits) - {"cold_time", "warm_time", "memory"}
+        if unrecognised:
+            raise ValueError(
+                f"Unrecognised limits {unrecognised} for '{pattern}' in {budget_file}"
+            )
+    return budget
+
+
+def check_import_budget(
+    results: ty.List[ImportBenchmark], budget: ty.Dict[str, ty.Dict[str, float]]
+) -> ty.List[str]:
+    """Returns descriptions of each of the budget limits that were exceeded"""
+    exceeded = []
+    for result in results:
+        for pattern, limits in budget.items():
+            if not fnmatchcase(result.module, pattern):
+                continue
+            for metric, limit in limits.items():
+                value = getattr(result, metric)
+                if value > limit:
+                    exceeded.append(
+                        f"{result.module}: {metric} {value:.3f} exceeds budget of "
+                        f"{limit} ('{pattern}')"
+                    )
+    return exceeded
+
+
+def format_import_report(results: ty.List[ImportBenchmark], n_deps: int = 3) -> str:
+    """Formats the benchmarks into a report ranked by cold import time"""
+    name_width = max([len(r.module) for r in results] + [6])
+    lines = [
+        f"{'module':<{name_width}}  {'cold (s)':>9}  {'warm (s)':>9}  "
+        f"{'mem (MB)':>9}  heaviest dependencies"
+    ]
+    for result in sorted(results, key=lambda r: -r.cold_time):
+        deps = ", ".join(f"{n} {t:.3f}s" for n, t in result.top_dependencies(n_deps))
+        lines.append(
+            f"{result.module:<{name_width}}  {result.cold_time:>9.3f}  "
+            f"{result.warm_time:>9.3f}  {result.memory:>9.1f}  {deps}"
+        )
+    return "\n".join(lines)
+
+
+def peak_rss() -> ty.Optional[float]:
+    """Returns the peak resident memory (MB) of the current process so far, or None
+    on platforms where it can't be measured"""
+    try:
+        import resource
+    except ImportError:  # Windows
+        return None
+    maxrss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return maxrss / (1024**2 if sys.platform == "darwin" else 1024)
+
+
+@attrs.define
+class StageMemory:
+    """The memory used by a stage of the conversion
+
+    Parameters
+    ----------
+    stage : str
+        the name of the stage
+    peak_rss : float, optional
+        the peak resident memory (MB) of the process at the end of the stage
+    rss_growth : float, optional
+        the increase in peak resident memory (MB) of the process during the stage
+    traced_peak : float, optional
+        the peak memory (MB) allocated by Python during the stage, as traced by
+        tracemalloc
+    top_allocations : list[tuple[str, float]]
+        the source lines that allocated the most memory (MB) still held at the end of
+        the stage
+    """
+
+    stage: str = attrs.field()
+    peak_rss: ty.Optional[float] = attrs.field(default=None)
+    rss_growth: ty.Optional[float] = attrs.field(default=None)
+    traced_peak: ty.Optional[float] = attrs.field(default=None)
+    top_allocations: ty.List[ty.Tuple[str, float]] = attrs.field(factory=list)
+
+
+@attrs.define
+class MemoryProfile:
+    """Records the peak resident memory of the process, and optionally the peak and
+    top allocations traced by tracemalloc, over each stage of a conversion, e.g.
+
+        profile = MemoryProfile()
+        converter.write(package_root, memory_profile=profile)
+        print(profile.report())
+
+    Parameters
+    ----------
+    trace : bool
+        whether to trace allocations with tracemalloc, which slows the conversion down
+        considerably
+    n_top : int
+        the number of top allocations to record for each stage
+    stages : list[StageMemory]
+        the memory used by each stage recorded so far
+    """
+
+    trace: bool = attrs.field(default=True)
+    n_top: int = attrs.field(default=10)
+    stages: ty.List[StageMemory] = attrs.field(factory=list)
+
+    @contextmanager
+    def stage(self, name: str):
+        """Context manager that records the memory used by the code run within it"""
+        started_tracing = False
+        if self.trace:
+            if not tracemalloc.is_tracing():
+                tracemalloc.start()
+                started_tracing = True
+            elif hasattr(tracemalloc, "reset_peak"):  # Python >= 3.9
+                tracemalloc.reset_peak()
+        rss_before = peak_rss()
+        try:
+            yield
+        finally:
+            memory = StageMemory(stage=name, peak_rss=peak_rss())
+            if rss_before is not None:
+                memory.rss_growth = memory.peak_rss - rss_before
+            if self.trace:
+                memory.traced_peak = tracemalloc.get_traced_memory()[1] / 1024**2
+                snapshot = tracemalloc.take_snapshot().filter_traces(
+                    [
+                        tracemalloc.Filter(False, tracemalloc.__file__),
+                        tracemalloc.Filter(False, __file__),
+                    ]
+                )
+                memory.top_allocations = [
+                    (str(stat.traceback[0]), stat.size / 1024**2)
+                    for stat in snapshot.statistics("lineno")[: self.n_top]
+                ]
+                if started_tracing:
+                    tracemalloc.stop()
+            self.stages.append(memory)
+            logger.debug("Peak RSS at end of '%s' stage: %s MB", name, memory.peak_rss)
+
+    def report(self, n_top: int = 3) -> str:
+        """Formats the recorded stages into a report"""
+
+        def fmt(value):
+            return f"{value:>10.1f}" if value is not None else f"{'-':>10}"
+
+        name_width = max([len(s.stage) for s in self.stages] + [5])
+        lines = [
+            f"{'stage':<{name_width}}  {'peak RSS':>10}  {'RSS growth':>10}  "
+            f"{'traced':>10}  (MB)"
+        ]
+        for memory in self.stages:
+            lines.append(
+                f"{memory.stage:<{name_width}}  {fmt(memory.peak_rss)}  "
+                f"{fmt(memory.rss_growth)}  {fmt(memory.traced_peak)}"
+            )
+            for location, size in memory.top_allocations[:n_top]:
+                lines.append(f"    {size:>8.1f} MB  {location}")
+        return "\n".join(lines)
+
+
+# Modules of nipype whose source code is used as the input to the microbenchmarks
+MICRO_BENCHMARK_MODULES = (
+    "nipype.interfaces.fsl.preprocess",
+    "nipype.interfaces.fsl.model",
+    "nipype.interfaces.afni.preprocess",
+)
+
+
+@attrs.define
+class ConversionBenchmark:
+    """The times taken by repeated runs of a stage of the conversion
+
+    Parameters
+    ----------
+    name : str
+        the name of the benchmark, e.g. 'write.interfaces.shell' or
+        'micro.extract_args'
+    setup : callable
+        called (untimed) before each repeat to reset any caches and prepare the inputs,
+        returning the zero-argument function to time
+    times : list[float]
+        the times (s) taken by each repeat
+    error : str, optional
+        the error raised by the benchmarked function, if it failed
+    """
+
+    name: str = attrs.field()
+    setup: ty.Callable[[], ty.Callable[[], ty.Any]] = attrs.field(repr=False, eq=False)
+    times: ty.List[float] = attrs.field(factory=list)
+    error: ty.Optional[str] = attrs.field(default=None)
+
+    @property
+    def best(self) -> ty.Optional[float]:
+        return min(self.times) if self.times else None
+
+    @property
+    def median(self) -> ty.Optional[float]:
+        return statistics.median(self.times) if self.times else None
+
+    def run(self, repeat: int = 3, warmup: int = 1) -> "ConversionBenchmark":
+        """Runs the benchmark, recording the time taken by each repeat. Errors are
+        recorded instead of being raised so the remaining benchmarks can still run
+
+        Parameters
+        ----------
+        repeat : int
+            the number of timed runs
+        warmup : int
+            the number of untimed runs before them, to import the modules used and
+            populate the caches that aren't reset by the setup
+
+        Returns
+        -------
+        ConversionBenchmark
+            the benchmark itself
+        """
+        self.times = []
+        self.error = None
+        try:
+            for i in range(warmup + repeat):
+                func = self.setup()
+                start = time.perf_counter()
+                func()
+                elapsed = time.perf_counter() - start
+                if i >= warmup:
+                    self.times.append(elapsed)
+        except Exception as e:
+            logger.warning("Benchmark '%s' failed: %s", self.name, e)
+            self.times = []
+            self.error = f"{type(e).__name__}: {e}"
+        return self
+
+    def to_dict(self) -> ty.Dict[str, ty.Any]:
+        return {
+            "times": self.times,
+            "best": self.best,
+            "median": self.median,
+            "error": self.error,
+        }
+
+
+def clear_conversion_caches():
+    """Clears the caches that are populated during a conversion, so that repeated
+    benchmark runs each start from the same state"""
+    from nipype2pydra.utils.symbols import (
+        UsedSymbols,
+        get_module_statements,
+        _get_local_constants,
+    )
+
+    UsedSymbols._cache.clear()
+    get_module_statements.cache_clear()
+    _get_local_constants.cache_clear()
+
+
+def conversion_benchmarks(
+    specs_dir: Path, work_dir: Path, batch_size: int = 20
+) -> ty.List[ConversionBenchmark]:
+    """Creates the benchmarks of the conversion of the example specs, end-to-end
+    through `PackageConverter.write` (named 'write.*'), and of the utilities the
+    conversion spends most of its time in (named 'micro.*')
+
+    Parameters
+    ----------
+    specs_dir : Path
+        the 'example-specs' directory of the nipype2pydra repository
+    work_dir : Path
+        the directory to write the converted packages to
+    batch_size : int
+        the number of interface specs to convert in the interface batches
+
+    Returns
+    -------
+    list[ConversionBenchmark]
+        the benchmarks, which are yet to be run
+    """
+    import inspect
+    from importlib import import_module
+    from nipype2pydra.package import PackageConverter
+    from nipype2pydra.statements import ImportStatement, parse_imports
+    from nipype2pydra.utils import (
+        UsedSymbols,
+        extract_args,
+        replace_undefined,
+        split_source_into_statements,
+    )
+
+    run_count = iter(range(sys.maxsize))
+
+    def write_setup(load_converter):
+        def setup():
+            clear_conversion_caches()
+            converter = load_converter()
+            package_root = work_dir / f"run{next(run_count)}"
+            return lambda: converter.write(package_root)
+
+        return setup
+
+    def interface_batch(pattern):
+        def load_converter():
+            converter = PackageConverter(
+                name="pydra.tasks.bench", nipype_name="nipype", interface_only=True
+            )
+            for fspath in sorted(specs_dir.glob(pattern))[:batch_size]:
+                with open(fspath) as f:
+                    spec = yaml.safe_load(f)
+                converter.add_interface_from_spec(
+                    spec=spec,
+                    callables_file=fspath.parent / (fspath.stem + "_callables.py"),
+                )
+            if not converter.interfaces:
+                raise FileNotFoundError(
+                    f"No interface specs match {specs_dir}/{pattern}"
+                )
+            return converter
+
+        return load_converter
+
+    benchmarks = [
+        ConversionBenchmark(
+            f"write.workflow.{name}",
+            write_setup(
+                lambda name=name: PackageConverter.from_specs_dir(
+                    specs_dir / "workflow" / name
+                )[0]
+            ),
+        )
+        for name in ("mriqc", "niworkflows")
+    ]
+    benchmarks.append(
+        ConversionBenchmark(
+            "write.interfaces.shell",
+            write_setup(interface_batch("interface/nipype/fsl/*.yaml")),
+        )
+    )
+    benchmarks.append(
+        ConversionBenchmark(
+            "write.interfaces.function",
+            write_setup(interface_batch("interface/function/*.yaml")),
+        )
+    )
+
+    @lru_cache(maxsize=None)
+    def micro_inputs():
+        modules = [import_module(m) for m in MICRO_BENCHMARK_MODULES]
+        sources = [inspect.getsource(m) for m in modules]
+        statements = [split_source_into_statements(src) for src in sources]
+        imports = [
+            (module, [s.strip() for s in stmts if re.match(r"\s*(from|import) ", s)])
+            for module, stmts in zip(modules, statements)
+        ]
+        methods = [
+            (module, method)
+            for module in modules
+            for klass in vars(module).values()
+            if inspect.isclass(klass) and klass.__module__ == module.__name__
+            for method in vars(klass).values()
+            if inspect.isfunction(method)
+        ]
+        method_sources = [inspect.getsource(m) for _, m in methods]
+        return {
+            "sources": sources,
+            "calls": [s for stmts in statements for s in stmts if "(" in s],
+            "imports": imports,
+            "parsed_imports": [
+                s
+                for module, stmts in imports
+                for s in parse_imports(stmts, relative_to=module)
+            ],
+            "methods": methods,
+            "undefined": [s for s in method_sources if "isdefined" in s],
+        }
+
+    def micro(name, func):
+        def setup():
+            clear_conversion_caches()
+            inputs = micro_inputs()
+            return lambda: func(inputs)
+
+        return ConversionBenchmark(f"micro.{name}", setup)
+
+    benchmarks.extend(
+        [
+            micro(
+                "split_source_into_statements",
+                lambda i: [split_source_into_statements(s) for s in i["sources"]],
+            ),
+            micro("extract_args", lambda i: [extract_args(s) for s in i["calls"]]),
+            micro(
+                "parse_imports",
+                lambda i: [parse_imports(s, relative_to=m) for m, s in i["imports"]],
+            ),
+            micro(
+                "UsedSymbols.find",
+                lambda i: [
+                    UsedSymbols.find(module, [method])
+                    for module, method in i["methods"]
+                ],
+            ),
+            micro(
+                "ImportStatement.collate",
+                lambda i: ImportStatement.collate(i["parsed_imports"]),
+            ),
+            micro(
+                "replace_undefined",
+                lambda i: [replace_undefined(s) for s in i["undefined"]],
+            ),
+        ]
+    )
+    return benchmarks
+
+
+def run_conversion_benchmarks(
+    benchmarks: ty.List[ConversionBenchmark], repeat: int = 3
+) -> ty.Dict[str, ty.Any]:
+    """Runs the benchmarks and returns their results along with metadata describing
+    the environment they were run in, in a form that can be saved as JSON and compared
+    by `compare_benchmarks`"""
+    from nipype2pydra import __version__
+
+    return {
+        "metadata": {
+            "nipype2pydra": __version__,
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "timestamp": datetime.now().isoformat(timespec="seconds"),
+            "repeat": repeat,
+        },
+        "benchmarks": {b.name: b.run(repeat=repeat).to_dict() for b in benchmarks},
+    }
+
+
+def compare_benchmarks(
+    baseline: ty.Dict[str, ty.Any],
+    current: ty.Dict[str, ty.Any],
+    threshold: float = 0.1,
+) -> ty.Tuple[str, ty.List[str]]:
+    """Compares the median times of two sets of benchmark results
+
+    Parameters
+    ----------
+    baseline : dict
+        the results to compare against, as returned by `run_conversion_benchmarks`
+    current : dict
+        the results to compare
+    threshold : float
+        the fractional increase in the median time that is considered a regression
+
+    Returns
+    -------
+    report : str
+        a table of the baseline and current median times of each benchmark
+    regressions : list[str]
+        descriptions of the benchmarks that have regressed, or that succeeded in the
+        baseline but failed in the current results
+    """
+    names = sorted(set(baseline["benchmarks"]) | set(current["benchmarks"]))
+    name_width = max([len(n) for n in names] + [9])
+    lines = [f"{'benchmark':<{name_width}}  {'base (s)':>9}  {'curr (s)':>9}  ratio"]
+    regressions = []
+
+    def fmt(value):
+        return f"{value:>9.4f}" if value is not None else f"{'-':>9}"
+
+    for name in names:
+        base = baseline["benchmarks"].get(name, {}).get("median")
+        curr = current["benchmarks"].get(name, {}).get("median")
+        if base and curr:
+            ratio = curr / base
+            status = f"{ratio:.2f}"
+            if ratio > 1 + threshold:
+                status += " REGRESSION"
+                regressions.append(f"{name}: {curr:.4f}s vs {base:.4f}s ({ratio:.2f}x)")
+        elif base and name in current["benchmarks"]:
+            status = "FAILED"
+            regressions.append(
+                f"{name}: failed ({current['benchmarks'][name]['error']})"
+            )
+        else:
+            status = "-"
+        lines.append(f"{name:<{name_width}}  {fmt(base)}  {fmt(curr)}  {status}")
+    return "\n".join(lines), regressions
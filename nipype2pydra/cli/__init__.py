@@ -1,3 +1,6 @@
 from .base import cli  # noqa: F401
 from .convert import convert  # noqa: F401
 from .pkg_gen import pkg_gen  # noqa: F401
+from .bench_import import bench_import  # noqa: F401
+from .bench_convert import bench_convert, bench_compare  # noqa: F401
+from .convert_batch import convert_batch  # noqa: F401
@@ -0,0 +1,120 @@
+from pathlib import Path
+import json
+import typing as ty
+import tempfile
+from fnmatch import fnmatchcase
+import click
+from nipype2pydra.benchmark import (
+    conversion_benchmarks,
+    run_conversion_benchmarks,
+    compare_benchmarks,
+)
+from nipype2pydra.cli.base import cli
+
+EXAMPLE_SPECS_DIR = Path(__file__).parent.parent.parent / "example-specs"
+
+
+@cli.command(
+    name="bench-convert",
+    help="""Benchmarks the throughput of the converter, timing `PackageConverter.write`
+end-to-end on the mriqc and niworkflows workflow examples and on batches of shell and
+function interface examples ('write.*'), along with the utilities the conversion spends
+most of its time in ('micro.*'). Caches are cleared between runs so each one does the
+full amount of work. Benchmarks that fail (e.g. because the packages being converted
+aren't installed) are reported and recorded in the results with their error.
+""",
+)
+@click.option(
+    "--specs-dir",
+    type=click.Path(path_type=Path, exists=True, file_okay=False),
+    default=EXAMPLE_SPECS_DIR,
+    help="The 'example-specs' directory to take the benchmark inputs from",
+)
+@click.option(
+    "--filter",
+    "filters",
+    type=str,
+    multiple=True,
+    help="Glob pattern(s) of the names of the benchmarks to run, e.g. 'micro.*'",
+)
+@click.option(
+    "--repeat",
+    type=int,
+    default=3,
+    help="The number of timed runs of each benchmark",
+)
+@click.option(
+    "--batch-size",
+    type=int,
+    default=20,
+    help="The number of interface specs converted in each of the interface batches",
+)
+@click.option(
+    "--json",
+    "json_file",
+    type=click.Path(path_type=Path),
+    default=None,
+    help="Path to write the benchmark results to in JSON format, which can be "
+    "compared against a baseline with `bench-compare`",
+)
+def bench_convert(
+    specs_dir: Path,
+    filters: ty.Sequence[str],
+    repeat: int,
+    batch_size: int,
+    json_file: ty.Optional[Path],
+) -> None:
+    with tempfile.TemporaryDirectory() as work_dir:
+        benchmarks = [
+            b
+            for b in conversion_benchmarks(specs_dir, Path(work_dir), batch_size)
+            if not filters or any(fnmatchcase(b.name, f) for f in filters)
+        ]
+        results = run_conversion_benchmarks(benchmarks, repeat=repeat)
+    name_width = max([len(n) for n in results["benchmarks"]] + [9])
+    click.echo(f"{'benchmark':<{name_width}}  {'best (s)':>9}  {'median (s)':>10}")
+    for name, result in results["benchmarks"].items():
+        if result["error"]:
+            click.echo(f"{name:<{name_width}}  failed: {result['error']}")
+        else:
+            click.echo(
+                f"{name:<{name_width}}  {result['best']:>9.4f}  "
+                f"{result['median']:>10.4f}"
+            )
+    if json_file:
+        with open(json_file, "w") as f:
+            json.dump(results, f, indent=2)
+
+
+@cli.command(
+    name="bench-compare",
+    help="""Compares the results of two `bench-convert` runs, exiting with an error if
+the median time of any benchmark has increased by more than the threshold, or if a
+benchmark that succeeded in the baseline has failed.
+
+BASELINE is the JSON file of results to compare against
+
+CURRENT is the JSON file of results to compare
+""",
+)
+@click.argument("baseline", type=click.Path(path_type=Path, exists=True))
+@click.argument("current", type=click.Path(path_type=Path, exists=True))
+@click.option(
+    "--threshold",
+    type=float,
+    default=0.1,
+    help="The fractional increase in median time considered a regression",
+)
+def bench_compare(baseline: Path, current: Path, threshold: float) -> None:
+    with open(baseline) as f:
+        baseline_results = json.load(f)
+    with open(current) as f:
+        current_results = json.load(f)
+    report, regressions = compare_benchmarks(
+        baseline_results, current_results, threshold=threshold
+    )
+    click.echo(report)
+    if regressions:
+        raise click.ClickException(
+            "Conversion performance regressed:\n" + "\n".join(regressions)
+        )
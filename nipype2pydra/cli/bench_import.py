@@ -0,0 +1,89 @@
+from pathlib import Path
+import json
+import typing as ty
+import attrs
+import click
+from tqdm import tqdm
+from nipype2pydra.benchmark import (
+    find_package_modules,
+    benchmark_import,
+    load_import_budget,
+    check_import_budget,
+    format_import_report,
+)
+from nipype2pydra.cli.base import cli
+
+
+@cli.command(
+    name="bench-import",
+    help="""Benchmarks the time and memory taken to import a converted Pydra task
+package and each of its generated modules. Each import is run in an isolated
+subprocess, first without any cached bytecode (cold) and then with it (warm), and the
+time spent importing each dependency is attributed with `python -X importtime`.
+
+PACKAGE_ROOT is the root directory of the converted package repository (i.e. the one
+containing the 'pydra/tasks/<pkg>' directories)
+""",
+)
+@click.argument("package_root", type=click.Path(path_type=Path, exists=True))
+@click.option(
+    "--package",
+    "package_name",
+    type=str,
+    default=None,
+    help="Name of the package to benchmark, e.g. pydra.tasks.fsl, by default the "
+    "sole package under 'pydra/tasks'",
+)
+@click.option(
+    "--top-level-only",
+    is_flag=True,
+    default=False,
+    help="Only benchmark the import of the top-level package, not its modules",
+)
+@click.option(
+    "--repeat",
+    type=int,
+    default=3,
+    help="The number of warm imports to take the fastest of",
+)
+@click.option(
+    "--budget",
+    "budget_file",
+    type=click.Path(path_type=Path, exists=True),
+    default=None,
+    help="YAML file mapping module names (or glob patterns) to the maximum "
+    "'cold_time', 'warm_time' (s) and/or 'memory' (MB) allowed for their import. "
+    "The command exits with an error if any are exceeded",
+)
+@click.option(
+    "--json",
+    "json_file",
+    type=click.Path(path_type=Path),
+    default=None,
+    help="Path to write the benchmark results to in JSON format",
+)
+def bench_import(
+    package_root: Path,
+    package_name: ty.Optional[str],
+    top_level_only: bool,
+    repeat: int,
+    budget_file: ty.Optional[Path],
+    json_file: ty.Optional[Path],
+) -> None:
+    modules = find_package_modules(package_root, package_name)
+    if top_level_only:
+        modules = modules[:1]
+    results = [
+        benchmark_import(module, package_root, repeat=repeat)
+        for module in tqdm(modules, "benchmarking imports")
+    ]
+    click.echo(format_import_report(results))
+    if json_file:
+        with open(json_file, "w") as f:
+            json.dump([attrs.asdict(r) for r in results], f, indent=2)
+    if budget_file:
+        exceeded = check_import_budget(results, load_import_budget(budget_file))
+        if exceeded:
+            raise click.ClickException(
+                "Import budget exceeded:\n" + "\n".join(exceeded)
+            )
@@ -1,10 +1,13 @@
 from pathlib import Path
+import json
 import typing as ty
 import shutil
 import logging
+import attrs
 import click
-import yaml
 from nipype2pydra.package import PackageConverter
+from nipype2pydra.workflow import WorkflowParseCache
+from nipype2pydra.benchmark import MemoryProfile
 from nipype2pydra.cli.base import cli
 
 logger = logging.getLogger(__name__)
@@ -22,27 +25,177 @@ converted workflow
 TO_INCLUDE is the list of interfaces/workflows/functions to explicitly include in the
 conversion. If not provided, all workflows and interfaces will be included. Can also
 be the path to a file containing a list of interfaces/workflows/functions to include
+
+Large packages can be converted in parallel by running separate '--shard i/N'
+conversions for i = 1..N (e.g. on different machines sharing the package root), each of
+which writes a deterministic subset of the interfaces and workflows to its own staging
+directory, followed by a '--merge' conversion that combines the shards into the package
+root. The nested workflows, functions and classes a shard depends on are written by it
+too, so modules written by several shards are merged by their top-level definitions
+(failing if the shards define the same name differently). The merged package is the
+same as if it had been converted in one go
+
+The 'n_procs' and 'mem_gb' resource requirements of nipype nodes are only carried over
+to the 'qsub_args' of the converted tasks, which are read by pydra's SGE worker alone.
+Pydra's SLURM and Dask workers don't support per-task resource requests, so the
+converted tasks are submitted with the worker's defaults. Nodes flagged with
+'run_without_submitting' are submitted like any other task, as pydra has no way to
+run them inline
 """,
 )
 @click.argument("specs_dir", type=click.Path(path_type=Path, exists=True))
 @click.argument("package_root", type=click.Path(path_type=Path, exists=True))
 @click.argument("to_include", type=str, nargs=-1)
+@click.option(
+    "--memory-profile",
+    "memory_profile_file",
+    type=click.Path(path_type=Path),
+    default=None,
+    help="Path to write the peak resident memory of each stage of the conversion to "
+    "in JSON format",
+)
+@click.option(
+    "--trace-allocations",
+    is_flag=True,
+    default=False,
+    help="Also trace the peak and top allocations of each stage with tracemalloc when "
+    "writing a memory profile (slows the conversion down considerably)",
+)
+@click.option(
+    "--shard",
+    type=str,
+    default=None,
+    metavar="I/N",
+    help="Only convert the I-th (1-based) of N deterministic partitions of the "
+    "interfaces and workflows into the staging directory, to be combined with the "
+    "other shards by a subsequent '--merge'",
+)
+@click.option(
+    "--merge",
+    is_flag=True,
+    default=False,
+    help="Merge the shards previously written to the staging directory into the "
+    "package root",
+)
+@click.option(
+    "--staging-dir",
+    type=click.Path(path_type=Path),
+    default=None,
+    help="The directory the shards are written to and merged from, "
+    "'<PACKAGE_ROOT>/.shards' by default (which is removed after a successful merge)",
+)
+@click.option(
+    "--parse-cache",
+    "parse_cache_file",
+    type=click.Path(path_type=Path, dir_okay=False),
+    default=None,
+    help="Path of a file to persist the parsed workflow sources to, so that workflows "
+    "whose source hasn't changed aren't parsed again in subsequent conversions",
+)
 def convert(
     specs_dir: Path,
     package_root: Path,
     to_include: ty.List[str],
+    memory_profile_file: ty.Optional[Path],
+    trace_allocations: bool,
+    shard: ty.Optional[str],
+    merge: bool,
+    staging_dir: ty.Optional[Path],
+    parse_cache_file: ty.Optional[Path],
 ) -> None:
 
-    # Load package converter from spec
-    with open(specs_dir / "package.yaml", "r") as f:
-        package_spec = yaml.safe_load(f)
+    if shard and merge:
+        raise click.UsageError("'--shard' and '--merge' are mutually exclusive")
+    if shard:
+        try:
+            shard_no, n_shards = (int(p) for p in shard.split("/"))
+        except ValueError:
+            raise click.BadParameter(
+                f"should be of the form I/N, not '{shard}'", param_hint="'--shard'"
+            )
+        if not 1 <= shard_no <= n_shards:
+            raise click.BadParameter(
+                f"shard number must be between 1 and {n_shards}, not {shard_no}",
+                param_hint="'--shard'",
+            )
+        shard = (shard_no - 1, n_shards)
+
+    memory_profile = (
+        MemoryProfile(trace=trace_allocations) if memory_profile_file else None
+    )
 
-    # Get default value for 'to_include' if not provided in the spec
+    # Read the 'to_include' list from file if a path is provided
     if len(to_include) == 1:
         if Path(to_include[0]).exists():
             with open(to_include[0], "r") as f:
                 to_include = f.read().splitlines()
-    spec_to_include = package_spec.pop("to_include", None)
+
+    convert_package(
+        specs_dir,
+        package_root,
+        to_include,
+        memory_profile=memory_profile,
+        shard=shard,
+        merge=merge,
+        staging_dir=staging_dir,
+        parse_cache=WorkflowParseCache(parse_cache_file) if parse_cache_file else None,
+    )
+
+    if memory_profile:
+        click.echo(memory_profile.report())
+        with open(memory_profile_file, "w") as f:
+            json.dump([attrs.asdict(s) for s in memory_profile.stages], f, indent=2)
+
+
+def convert_package(
+    specs_dir: Path,
+    package_root: Path,
+    to_include: ty.Sequence[str] = (),
+    memory_profile: ty.Optional[MemoryProfile] = None,
+    shard: ty.Optional[ty.Tuple[int, int]] = None,
+    merge: bool = False,
+    staging_dir: ty.Optional[Path] = None,
+    parse_cache: ty.Optional[WorkflowParseCache] = None,
+) -> PackageConverter:
+    """Converts a package from its specs, replacing any previously converted version of
+    it in the package root
+
+    Parameters
+    ----------
+    specs_dir : Path
+        the directory containing the specs of the package
+    package_root : Path
+        the root directory of the package repository to write the package to
+    to_include : Sequence[str]
+        the interfaces/workflows/functions to explicitly include in the conversion,
+        overriding the 'to_include' value in the spec if provided
+    memory_profile : MemoryProfile, optional
+        if provided, the memory used by each stage of the conversion is recorded in it
+    shard : tuple[int, int], optional
+        the (zero-based) index of the shard to convert and the total number of shards.
+        The shard is written to 'shard-<index + 1>-of-<N>' in the staging directory
+        instead of the package root
+    merge : bool
+        merge the shards in the staging directory into the package root instead of
+        converting the package directly
+    staging_dir : Path, optional
+        the directory to write the shards to and merge them from, by default
+        '<package_root>/.shards', which is removed after the shards are merged
+    parse_cache : WorkflowParseCache, optional
+        the cache of parsed workflow sources to use instead of the package's own, e.g.
+        to share it with other packages and/or persist it between runs
+
+    Returns
+    -------
+    PackageConverter
+        the converter of the package
+    """
+    # Load package converter, and the converters of its interfaces, workflows,
+    # functions and classes, from the specs
+    converter, spec_to_include = PackageConverter.from_specs_dir(specs_dir)
+    if parse_cache is not None:
+        converter.parse_cache = parse_cache
+
     if spec_to_include:
         if not to_include:
             to_include = spec_to_include
@@ -52,16 +205,31 @@ def convert(
                 spec_to_include,
             )
 
-    # Load interface and workflow specs
-    workflow_yamls = list((specs_dir / "workflows").glob("*.yaml"))
-    interface_yamls = list((specs_dir / "interfaces").glob("*.yaml"))
-    function_yamls = list((specs_dir / "functions").glob("*.yaml"))
-    class_yamls = list((specs_dir / "classes").glob("*.yaml"))
+    default_staging_dir = staging_dir is None
+    if default_staging_dir:
+        staging_dir = package_root / ".shards"
 
-    # Initialise PackageConverter
-    if package_spec.get("interface_only", None) is None:
-        package_spec["interface_only"] = not workflow_yamls
-    converter = PackageConverter(**package_spec)
+    if shard is not None:
+        shard_root = staging_dir / f"shard-{shard[0] + 1}-of-{shard[1]}"
+        if shard_root.exists():
+            shutil.rmtree(shard_root)
+        shard_root.mkdir(parents=True)
+        converter.write(
+            shard_root, list(to_include), memory_profile=memory_profile, shard=shard
+        )
+        return converter
+
+    if merge:
+        shard_roots = sorted(
+            staging_dir.glob("shard-*-of-*"),
+            key=lambda p: int(p.name.split("-")[1]),
+        )
+        n_shards = set(int(p.name.split("-")[-1]) for p in shard_roots)
+        if len(n_shards) != 1 or len(shard_roots) != next(iter(n_shards)):
+            raise ValueError(
+                f"Expected the complete set of shards from a single sharded conversion "
+                f"in {staging_dir}, found {[p.name for p in shard_roots]}"
+            )
 
     # Clean previous version of output dir
     package_dir = converter.package_dir(package_root)
@@ -76,37 +244,14 @@ def convert(
             else:
                 fspath.unlink()
 
-    # Load interface specs
-    for fspath in interface_yamls:
-        with open(fspath, "r") as f:
-            spec = yaml.safe_load(f)
-        converter.add_interface_from_spec(
-            spec=spec,
-            callables_file=(
-                fspath.parent / (fspath.name[: -len(".yaml")] + "_callables.py")
-            ),
-        )
-
-    # Load workflow specs
-    for fspath in workflow_yamls:
-        with open(fspath, "r") as f:
-            spec = yaml.safe_load(f)
-        converter.add_workflow_from_spec(spec)
-
-    # Load workflow specs
-    for fspath in function_yamls:
-        with open(fspath, "r") as f:
-            spec = yaml.safe_load(f)
-        converter.add_function_from_spec(spec)
-
-    # Load workflow specs
-    for fspath in class_yamls:
-        with open(fspath, "r") as f:
-            spec = yaml.safe_load(f)
-        converter.add_class_from_spec(spec)
-
-    # Write out converted package
-    converter.write(package_root, to_include)
+    if merge:
+        converter.merge_shards(package_root, shard_roots)
+        if default_staging_dir:
+            shutil.rmtree(staging_dir)
+    else:
+        # Write out converted package
+        converter.write(package_root, list(to_include), memory_profile=memory_profile)
+    return converter
 
 
 if __name__ == "__main__":
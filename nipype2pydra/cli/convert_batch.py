@@ -0,0 +1,176 @@
+from pathlib import Path
+import json
+import time
+import typing as ty
+import logging
+import traceback
+import multiprocessing as mp
+import click
+import yaml
+from nipype2pydra.benchmark import peak_rss
+from nipype2pydra.cli.base import cli
+from nipype2pydra.cli.convert import convert_package
+from nipype2pydra.workflow import WorkflowParseCache
+
+logger = logging.getLogger(__name__)
+
+
+@cli.command(
+    name="convert-batch",
+    help="""Converts multiple packages in a single process (or a pool of worker
+processes), so that nipype and the other source packages are only imported once and the
+caches built up while converting one package (e.g. the symbols used by each module and
+the parsed workflow sources) are shared with the next. A failure in one package is
+reported and the remaining packages are still converted.
+
+The packages to convert are specified by repeated '--package SPECS_DIR PACKAGE_ROOT'
+options and/or a batch file
+
+The memory reported for each package is the peak resident memory of the process that
+converted it (cumulative over the packages converted before it by the same process),
+along with how much that peak grew while converting the package. As the peak may
+already have been reached by an earlier package, the growth is only a lower bound on
+the memory used by the package
+""",
+)
+@click.option(
+    "--package",
+    "-p",
+    "packages",
+    type=click.Path(path_type=Path),
+    nargs=2,
+    multiple=True,
+    metavar="SPECS_DIR PACKAGE_ROOT",
+    help="The directory containing the specs of a package to convert and the root "
+    "directory of the package repository to write it to",
+)
+@click.option(
+    "--batch-file",
+    type=click.Path(path_type=Path, exists=True, dir_okay=False),
+    default=None,
+    help="YAML file containing a list of the packages to convert, each a mapping with "
+    "'specs_dir', 'package_root' and optionally 'to_include' keys. Relative paths are "
+    "resolved relative to the batch file",
+)
+@click.option(
+    "--jobs",
+    "-j",
+    type=int,
+    default=1,
+    help="The number of worker processes to convert the packages in. Each worker "
+    "keeps its caches between the packages it converts",
+)
+@click.option(
+    "--json",
+    "json_file",
+    type=click.Path(path_type=Path),
+    default=None,
+    help="Path to write the results of each conversion to in JSON format",
+)
+@click.option(
+    "--parse-cache",
+    "parse_cache_file",
+    type=click.Path(path_type=Path, dir_okay=False),
+    default=None,
+    help="Path of a file to persist the parsed workflow sources to, so that workflows "
+    "whose source hasn't changed aren't parsed again in subsequent conversions",
+)
+def convert_batch(
+    packages: ty.Sequence[ty.Tuple[Path, Path]],
+    batch_file: ty.Optional[Path],
+    jobs: int,
+    json_file: ty.Optional[Path],
+    parse_cache_file: ty.Optional[Path],
+) -> None:
+    items = [
+        {"specs_dir": specs_dir, "package_root": package_root, "to_include": []}
+        for specs_dir, package_root in packages
+    ]
+    if batch_file:
+        with open(batch_file) as f:
+            batch = yaml.safe_load(f) or []
+        for entry in batch:
+            items.append(
+                {
+                    "specs_dir": batch_file.parent / entry["specs_dir"],
+                    "package_root": batch_file.parent / entry["package_root"],
+                    "to_include": entry.get("to_include") or [],
+                }
+            )
+    if not items:
+        raise click.UsageError("No packages to convert were provided")
+
+    if jobs > 1 and len(items) > 1:
+        with mp.Pool(
+            min(jobs, len(items)),
+            initializer=_init_parse_cache,
+            initargs=(parse_cache_file,),
+        ) as pool:
+            results = list(pool.imap(_convert_batch_item, items))
+    else:
+        _init_parse_cache(parse_cache_file)
+        results = [_convert_batch_item(item) for item in items]
+
+    name_width = max(len(r["specs_dir"]) for r in results)
+    click.echo(
+        f"{'specs dir':<{name_width}}  {'time (s)':>9}  {'process peak RSS (MB)':>21}  "
+        f"{'RSS growth (MB)':>15}  status"
+    )
+    for result in results:
+        click.echo(
+            f"{result['specs_dir']:<{name_width}}  {result['time']:>9.1f}  "
+            f"{result['peak_rss'] or 0:>21.1f}  {result['rss_growth'] or 0:>15.1f}  "
+            f"{result['error'] or 'ok'}"
+        )
+    if json_file:
+        with open(json_file, "w") as f:
+            json.dump(results, f, indent=2)
+    failed = [r["specs_dir"] for r in results if r["error"]]
+    if failed:
+        raise click.ClickException(
+            f"Failed to convert {len(failed)} of {len(results)} packages: "
+            + ", ".join(failed)
+        )
+
+
+# The parsed workflow sources shared by the packages converted in the process
+_parse_cache: ty.Optional[WorkflowParseCache] = None
+
+
+def _init_parse_cache(parse_cache_file: ty.Optional[Path]):
+    """Initialises the parse cache shared by the packages converted in the process"""
+    global _parse_cache
+    _parse_cache = WorkflowParseCache(parse_cache_file)
+
+
+def _convert_batch_item(item: ty.Dict[str, ty.Any]) -> ty.Dict[str, ty.Any]:
+    """Converts a single package of the batch, catching any errors so that the
+    remaining packages can still be converted"""
+    result = {
+        "specs_dir": str(item["specs_dir"]),
+        "package_root": str(item["package_root"]),
+        "error": None,
+    }
+    start = time.perf_counter()
+    start_rss = peak_rss()
+    try:
+        convert_package(
+            item["specs_dir"],
+            item["package_root"],
+            item["to_include"],
+            parse_cache=_parse_cache,
+        )
+    except Exception as e:
+        logger.error(
+            "Failed to convert %s:\n%s", item["specs_dir"], traceback.format_exc()
+        )
+        result["error"] = f"{type(e).__name__}: {e}"
+    result["time"] = time.perf_counter() - start
+    # The peak RSS is the high-water mark of the whole process, which includes the
+    # packages previously converted by it, so the growth of the peak during the
+    # conversion is also recorded
+    result["peak_rss"] = peak_rss()
+    result["rss_growth"] = (
+        result["peak_rss"] - start_rss if start_rss is not None else None
+    )
+    return result
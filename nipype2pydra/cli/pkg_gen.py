@@ -1,25 +1,30 @@
 import typing as ty
-import tempfile
 from importlib import import_module
 import subprocess as sp
 import shutil
-import tarfile
+from functools import partial
+from contextlib import nullcontext
+from concurrent.futures import ProcessPoolExecutor
 from pathlib import Path
 import click
 import yaml
 import toml
 from fileformats.generic import File
-import nipype.interfaces.base.core
 from nipype2pydra.utils import (
     to_snake_case,
 )
 from nipype2pydra.pkg_gen import (
-    download_tasks_template,
+    provision_tasks_template,
     initialise_task_repo,
-    NipypeInterface,
+    parse_nipype_interface,
     gen_fileformats_module,
     gen_fileformats_extras_module,
     gen_fileformats_extras_tests,
+    SharedCallables,
+    shared_callables_module_name,
+    nipype_source_hash,
+    spec_source_hash,
+    STUBS_DIR_NAME,
 )
 from nipype2pydra.cli.base import cli
 from nipype2pydra.package import PackageConverter
@@ -40,6 +45,41 @@ OUTPUT_DIR is the directory to write the generated packages to
 @click.argument("output_dir", type=click.Path(path_type=Path))
 @click.option("--work-dir", type=click.Path(path_type=Path), default=None)
 @click.option("--task-template", type=click.Path(path_type=Path), default=None)
+@click.option(
+    "--task-template-version",
+    type=str,
+    default=None,
+    help="The release of the pydra-tasks-template to use when --task-template isn't "
+    "provided, by default the latest release (or the most recently cached one when "
+    "--offline)",
+)
+@click.option(
+    "--task-template-sha256",
+    type=str,
+    default=None,
+    help="The expected SHA-256 hash of the pydra-tasks-template release tarball",
+)
+@click.option(
+    "--template-cache-dir",
+    type=click.Path(path_type=Path),
+    default=None,
+    help="The directory to cache pydra-tasks-template releases in, by default "
+    "$NIPYPE2PYDRA_CACHE_DIR/task-templates or ~/.cache/nipype2pydra/task-templates",
+)
+@click.option(
+    "--offline",
+    is_flag=True,
+    default=False,
+    help="Only use cached pydra-tasks-template releases instead of downloading them",
+)
+@click.option(
+    "--link-template-files",
+    is_flag=True,
+    default=False,
+    help="Hard-link files that don't need to be customised from the task template "
+    "instead of copying them. Faster when generating many packages, but the files "
+    "must not be modified in place afterwards",
+)
 @click.option("--single-interface", type=str, default=None)
 @click.option(
     "--example-packages",
@@ -69,21 +109,40 @@ OUTPUT_DIR is the directory to write the generated packages to
     metavar="<name> <value>",
     help="name-value pairs of default values to set in the converter specs",
 )
+@click.option(
+    "--update",
+    is_flag=True,
+    default=False,
+    help="Update the packages in an existing output directory instead of regenerating "
+    "them. Only the specs of interfaces that have changed since they were generated "
+    "are regenerated, and these are merged with any edits made to the existing specs",
+)
+@click.option(
+    "--jobs",
+    "-j",
+    type=int,
+    default=1,
+    help="The number of processes to parse the interfaces with",
+)
 def pkg_gen(
     spec_file: Path,
     output_dir: Path,
     work_dir: ty.Optional[Path],
     task_template: ty.Optional[Path],
+    task_template_version: ty.Optional[str],
+    task_template_sha256: ty.Optional[str],
+    template_cache_dir: ty.Optional[Path],
+    offline: bool,
+    link_template_files: bool,
     single_interface: ty.Optional[str],
     example_packages: ty.Optional[Path],
     pkg_prefix: str,
     pkg_default: ty.List[ty.Tuple[str, str]],
     wf_default: ty.List[ty.Tuple[str, str]],
+    update: bool,
+    jobs: int,
 ):
 
-    if work_dir is None:
-        work_dir = Path(tempfile.mkdtemp())
-
     pkg_defaults = dict(pkg_default)
     wf_defaults = dict(wf_default)
 
@@ -91,232 +150,352 @@ def pkg_gen(
         to_import = yaml.load(f, Loader=yaml.SafeLoader)
 
     if task_template is None:
-        task_template_tar = work_dir / "task-template.tar.gz"
-        download_tasks_template(task_template_tar)
-        extract_dir = work_dir / "task_template"
-        with tarfile.open(task_template_tar, "r:gz") as tar:
-            tar.extractall(path=extract_dir)
-        task_template = extract_dir / next(extract_dir.iterdir())
+        task_template = provision_tasks_template(
+            version=task_template_version,
+            sha256=task_template_sha256,
+            cache_dir=(
+                template_cache_dir
+                if template_cache_dir or not work_dir
+                else work_dir / "task-templates"
+            ),
+            offline=offline,
+        )
 
     # Wipe output dir
-    if output_dir.exists():
+    if output_dir.exists() and not update:
         shutil.rmtree(output_dir)
-    output_dir.mkdir(parents=True)
+    output_dir.mkdir(parents=True, exist_ok=True)
 
     not_interfaces = []
     unmatched_formats = []
     ambiguous_formats = []
     has_doctests = set()
+    unchanged_interfaces = []
+    merge_conflicts = []
+    kept_callables = []
+
+    # Interfaces are parsed in a process pool, with the results collected in order
+    # so the output is the same regardless of the number of jobs
+    with ProcessPoolExecutor(jobs) if jobs > 1 else nullcontext() as executor:
+        for pkg, spec in to_import.items():
+
+            with_fileformats = spec.get("with_fileformats")
+            interface_only_pkg = "workflows" not in spec
+            pkg_dir = output_dir / f"pydra-{pkg}"
+            # Existing packages are updated in place, keeping any manual edits
+            update_pkg = update and pkg_dir.exists()
+            if not update_pkg:
+                pkg_dir = initialise_task_repo(
+                    output_dir,
+                    task_template,
+                    pkg,
+                    interface_only=interface_only_pkg,
+                    link=link_template_files,
+                )
+            pkg_formats = set()
 
-    for pkg, spec in to_import.items():
-
-        with_fileformats = spec.get("with_fileformats")
-        interface_only_pkg = "workflows" not in spec
-        pkg_dir = initialise_task_repo(
-            output_dir, task_template, pkg, interface_only=interface_only_pkg
-        )
-        pkg_formats = set()
-
-        spec_dir = pkg_dir / "nipype-auto-conv" / "specs"
-        spec_dir.mkdir(parents=True, exist_ok=True)
+            spec_dir = pkg_dir / "nipype-auto-conv" / "specs"
+            spec_dir.mkdir(parents=True, exist_ok=True)
 
-        with open(spec_dir / "package.yaml", "w") as f:
-            f.write(
-                PackageConverter.default_spec(
-                    "pydra.tasks." + pkg, pkg_prefix + pkg, defaults=pkg_defaults
-                )
-            )
-
-        if not interface_only_pkg and not single_interface:
-            workflows_spec_dir = spec_dir / "workflows"
-            workflows_spec_dir.mkdir(parents=True, exist_ok=True)
-            for wf_path in spec["workflows"]:
-                parts = wf_path.split(".")
-                wf_name = parts[-1]
-                nipype_module_str = ".".join(parts[:-1])
-                nipype_module = import_module(nipype_module_str)
-                try:
-                    getattr(nipype_module, wf_name)
-                except AttributeError:
-                    raise RuntimeError(
-                        f"Did not find workflow function {wf_name} in module {nipype_module_str}"
-                    )
-                with open(workflows_spec_dir / (wf_path + ".yaml"), "w") as f:
+            if not (update_pkg and (spec_dir / "package.yaml").exists()):
+                with open(spec_dir / "package.yaml", "w") as f:
                     f.write(
-                        WorkflowConverter.default_spec(
-                            wf_name, nipype_module_str, defaults=wf_defaults
+                        PackageConverter.default_spec(
+                            "pydra.tasks." + pkg,
+                            pkg_prefix + pkg,
+                            defaults=pkg_defaults,
                         )
                     )
 
-        if "interfaces" in spec:
-            interfaces_spec_dir = spec_dir / "interfaces"
-            interfaces_spec_dir.mkdir(parents=True, exist_ok=True)
-            # Loop through all nipype modules and create specs for their auto-conversion
-            if single_interface:
-                interfaces = [single_interface]
-            else:
-                interfaces = spec["interfaces"]
-            for interface_path in interfaces:
-                # Import interface from module
-                parts = interface_path.split(".")
-                nipype_module_str = ".".join(parts[:-1])
-                interface = parts[-1]
-                nipype_module = import_module(nipype_module_str)
-                nipype_interface = getattr(nipype_module, interface)
-                if not issubclass(
-                    nipype_interface, nipype.interfaces.base.core.Interface
-                ):
-                    not_interfaces.append(interface_path)
-                    continue
+            if not interface_only_pkg and not single_interface:
+                workflows_spec_dir = spec_dir / "workflows"
+                workflows_spec_dir.mkdir(parents=True, exist_ok=True)
+                for wf_path in spec["workflows"]:
+                    parts = wf_path.split(".")
+                    wf_name = parts[-1]
+                    nipype_module_str = ".".join(parts[:-1])
+                    nipype_module = import_module(nipype_module_str)
+                    try:
+                        getattr(nipype_module, wf_name)
+                    except AttributeError:
+                        raise RuntimeError(
+                            f"Did not find workflow function {wf_name} in module {nipype_module_str}"
+                        )
+                    if (
+                        update_pkg
+                        and (workflows_spec_dir / (wf_path + ".yaml")).exists()
+                    ):
+                        continue
+                    with open(workflows_spec_dir / (wf_path + ".yaml"), "w") as f:
+                        f.write(
+                            WorkflowConverter.default_spec(
+                                wf_name, nipype_module_str, defaults=wf_defaults
+                            )
+                        )
 
-                parsed = NipypeInterface.parse(
-                    nipype_interface=nipype_interface,
-                    pkg=pkg,
-                    base_package=pkg_prefix,
+            if "interfaces" in spec:
+                interfaces_spec_dir = spec_dir / "interfaces"
+                interfaces_spec_dir.mkdir(parents=True, exist_ok=True)
+                # The stubs the specs are created from are saved so that they can be
+                # merged with newly generated stubs when the package is updated
+                stubs_dir = interfaces_spec_dir / STUBS_DIR_NAME
+                stubs_dir.mkdir(exist_ok=True)
+                # Loop through all nipype modules and create specs for their auto-conversion
+                if single_interface:
+                    interfaces = [single_interface]
+                else:
+                    interfaces = spec["interfaces"]
+                if update_pkg:
+                    # Skip interfaces that haven't changed since their specs were generated
+                    changed_interfaces = []
+                    for interface_path in interfaces:
+                        module_name, interface = interface_path.rsplit(".", 1)
+                        spec_fspath = interfaces_spec_dir / (
+                            to_snake_case(interface) + ".yaml"
+                        )
+                        if spec_fspath.exists() and spec_source_hash(
+                            spec_fspath.read_text()
+                        ) == nipype_source_hash(
+                            getattr(import_module(module_name), interface)
+                        ):
+                            unchanged_interfaces.append(interface_path)
+                        else:
+                            changed_interfaces.append(interface_path)
+                    interfaces = changed_interfaces
+                shared_callables = SharedCallables(shared_callables_module_name(pkg))
+                callables_to_write = {}
+                parse = partial(
+                    parse_nipype_interface, pkg=pkg, base_package=pkg_prefix
                 )
-
-                spec_name = to_snake_case(interface)
-                yaml_spec = parsed.generate_yaml_spec()
-                unmatched_formats.extend(parsed.unmatched_formats)
-                ambiguous_formats.extend(parsed.ambiguous_formats)
-                pkg_formats.update(parsed.pkg_formats)
-                if parsed.has_doctests:
-                    has_doctests.add(interface_path)
-                with open(interfaces_spec_dir / (spec_name + ".yaml"), "w") as f:
-                    f.write(yaml_spec)
-
-                callables_fspath = interfaces_spec_dir / f"{spec_name}_callables.py"
-
-                with open(callables_fspath, "w") as f:
-                    f.write(parsed.generate_callables(nipype_interface))
-
-        if "functions" in spec:
-            functions_spec_dir = spec_dir / "functions"
-            functions_spec_dir.mkdir(parents=True, exist_ok=True)
-            for function_path in spec["functions"]:
-                parts = function_path.split(".")
-                factory_name = parts[-1]
-                nipype_module_str = ".".join(parts[:-1])
-                nipype_module = import_module(nipype_module_str)
-                try:
-                    getattr(nipype_module, factory_name)
-                except AttributeError:
-                    raise RuntimeError(
-                        f"Did not find factory function {factory_name} in module {nipype_module_str}"
+                for interface_path, (parsed, yaml_spec) in zip(
+                    interfaces,
+                    (
+                        executor.map(parse, interfaces)
+                        if executor
+                        else map(parse, interfaces)
+                    ),
+                ):
+                    if parsed is None:
+                        not_interfaces.append(interface_path)
+                        continue
+                    module_name, interface = interface_path.rsplit(".", 1)
+                    nipype_interface = getattr(import_module(module_name), interface)
+
+                    spec_name = to_snake_case(interface)
+                    unmatched_formats.extend(parsed.unmatched_formats)
+                    ambiguous_formats.extend(parsed.ambiguous_formats)
+                    pkg_formats.update(parsed.pkg_formats)
+                    if parsed.has_doctests:
+                        has_doctests.add(interface_path)
+                    spec_fspath = interfaces_spec_dir / (spec_name + ".yaml")
+                    stub_fspath = stubs_dir / (spec_name + ".yaml")
+                    if update_pkg and spec_fspath.exists():
+                        merged_spec, conflicts = parsed.merge_yaml_spec(
+                            spec_fspath.read_text(),
+                            stub_fspath.read_text() if stub_fspath.exists() else None,
+                        )
+                        merge_conflicts.extend(
+                            f"{interface_path}: {c}" for c in conflicts
+                        )
+                        with open(spec_fspath, "w") as f:
+                            f.write(merged_spec)
+                    else:
+                        with open(spec_fspath, "w") as f:
+                            f.write(yaml_spec)
+                    with open(stub_fspath, "w") as f:
+                        f.write(yaml_spec)
+
+                    callables_fspath = interfaces_spec_dir / f"{spec_name}_callables.py"
+                    # The helpers of the interfaces that haven't changed aren't known when
+                    # updating, so the shared callables module is left as it is
+                    if not update_pkg:
+                        shared_callables.register(nipype_interface)
+                    callables_to_write[callables_fspath] = (parsed, nipype_interface)
+
+                # Callables modules are written once all interfaces have been parsed so
+                # helpers referenced by more than one of them can be written to the shared
+                # callables module
+                for callables_fspath, (
+                    parsed,
+                    nipype_interface,
+                ) in callables_to_write.items():
+                    callables = parsed.generate_callables(
+                        nipype_interface,
+                        shared_callables=shared_callables if not update_pkg else None,
                     )
+                    callables_stub_fspath = stubs_dir / callables_fspath.name
+                    # Callables modules that have been edited by hand are left as they are
+                    if (
+                        update_pkg
+                        and callables_fspath.exists()
+                        and (
+                            not callables_stub_fspath.exists()
+                            or callables_fspath.read_text()
+                            != callables_stub_fspath.read_text()
+                        )
+                    ):
+                        kept_callables.append(str(callables_fspath))
+                    else:
+                        with open(callables_fspath, "w") as f:
+                            f.write(callables)
+                    with open(callables_stub_fspath, "w") as f:
+                        f.write(callables)
+                if shared_callables:
+                    with open(
+                        interfaces_spec_dir / f"{shared_callables.module_name}.py", "w"
+                    ) as f:
+                        f.write(shared_callables.generate())
+
+            if "functions" in spec:
+                functions_spec_dir = spec_dir / "functions"
+                functions_spec_dir.mkdir(parents=True, exist_ok=True)
+                for function_path in spec["functions"]:
+                    parts = function_path.split(".")
+                    factory_name = parts[-1]
+                    nipype_module_str = ".".join(parts[:-1])
+                    nipype_module = import_module(nipype_module_str)
+                    try:
+                        getattr(nipype_module, factory_name)
+                    except AttributeError:
+                        raise RuntimeError(
+                            f"Did not find factory function {factory_name} in module {nipype_module_str}"
+                        )
+                    if (
+                        update_pkg
+                        and (functions_spec_dir / (function_path + ".yaml")).exists()
+                    ):
+                        continue
+
+                    with open(functions_spec_dir / (function_path + ".yaml"), "w") as f:
+                        f.write(
+                            FunctionConverter.default_spec(
+                                factory_name, nipype_module_str, defaults=wf_defaults
+                            )
+                        )
 
-                with open(functions_spec_dir / (function_path + ".yaml"), "w") as f:
-                    f.write(
-                        FunctionConverter.default_spec(
-                            factory_name, nipype_module_str, defaults=wf_defaults
+            if "classes" in spec:
+                classes_spec_dir = spec_dir / "classes"
+                classes_spec_dir.mkdir(parents=True, exist_ok=True)
+                for class_path in spec["classes"]:
+                    parts = class_path.split(".")
+                    factory_name = parts[-1]
+                    nipype_module_str = ".".join(parts[:-1])
+                    nipype_module = import_module(nipype_module_str)
+                    try:
+                        getattr(nipype_module, factory_name)
+                    except AttributeError:
+                        raise RuntimeError(
+                            f"Did not find factory function {factory_name} in module {nipype_module_str}"
+                        )
+                    if (
+                        update_pkg
+                        and (classes_spec_dir / (class_path + ".yaml")).exists()
+                    ):
+                        continue
+
+                    with open(classes_spec_dir / (class_path + ".yaml"), "w") as f:
+                        f.write(
+                            ClassConverter.default_spec(
+                                factory_name, nipype_module_str, defaults=wf_defaults
+                            )
                         )
+            if with_fileformats is None:
+                with_fileformats = interface_only_pkg
+
+            # The related fileformats packages and the pyproject.toml of existing packages
+            # are typically edited by hand so are left as they are when updating
+            if with_fileformats and not update_pkg:
+                with open(
+                    pkg_dir
+                    / "related-packages"
+                    / "fileformats"
+                    / "fileformats"
+                    / f"medimage_{pkg}"
+                    / "__init__.py",
+                    "w",
+                ) as f:
+                    f.write(gen_fileformats_module(pkg_formats))
+
+                with open(
+                    pkg_dir
+                    / "related-packages"
+                    / "fileformats-extras"
+                    / "fileformats"
+                    / "extras"
+                    / f"medimage_{pkg}"
+                    / "__init__.py",
+                    "w",
+                ) as f:
+                    f.write(gen_fileformats_extras_module(pkg, pkg_formats))
+
+                tests_dir = (
+                    pkg_dir
+                    / "related-packages"
+                    / "fileformats-extras"
+                    / "fileformats"
+                    / "extras"
+                    / f"medimage_{pkg}"
+                    / "tests"
+                )
+                tests_dir.mkdir()
+
+                with open(tests_dir / "test_generate_sample_data.py", "w") as f:
+                    f.write(gen_fileformats_extras_tests(pkg, pkg_formats))
+
+            if not update_pkg:
+                # Remove fileformats lines from pyproject.toml
+                pyproject_fspath = pkg_dir / "pyproject.toml"
+
+                pyproject = toml.load(pyproject_fspath)
+
+                if not with_fileformats:
+                    deps = pyproject["project"]["dependencies"]
+                    deps = [d for d in deps if d != f"fileformats-medimage-{pkg}"]
+                    pyproject["project"]["dependencies"] = deps
+                    test_deps = pyproject["project"]["optional-dependencies"]["test"]
+                    test_deps = [
+                        d
+                        for d in test_deps
+                        if d != f"fileformats-medimage-{pkg}-extras"
+                    ]
+                    pyproject["project"]["optional-dependencies"]["test"] = test_deps
+                with open(pyproject_fspath, "w") as f:
+                    toml.dump(pyproject, f)
+
+            if example_packages and not single_interface:
+                with open(example_packages) as f:
+                    example_pkg_names = yaml.load(f, Loader=yaml.SafeLoader)
+
+                examples_dir = (
+                    Path(__file__).parent.parent.parent / "example-specs" / "task" / pkg
+                )
+                if examples_dir.exists():
+                    shutil.rmtree(examples_dir)
+                examples_dir.mkdir()
+                for example_pkg_name in example_pkg_names:
+                    specs_dir = (
+                        output_dir
+                        / ("pydra-" + example_pkg_name)
+                        / "nipype-auto-conv"
+                        / "specs"
                     )
-
-        if "classes" in spec:
-            classes_spec_dir = spec_dir / "classes"
-            classes_spec_dir.mkdir(parents=True, exist_ok=True)
-            for class_path in spec["classes"]:
-                parts = class_path.split(".")
-                factory_name = parts[-1]
-                nipype_module_str = ".".join(parts[:-1])
-                nipype_module = import_module(nipype_module_str)
-                try:
-                    getattr(nipype_module, factory_name)
-                except AttributeError:
-                    raise RuntimeError(
-                        f"Did not find factory function {factory_name} in module {nipype_module_str}"
+                    dest_dir = examples_dir / example_pkg_name
+                    shutil.copytree(
+                        specs_dir,
+                        dest_dir,
+                        ignore=shutil.ignore_patterns(STUBS_DIR_NAME),
                     )
 
-                with open(classes_spec_dir / (class_path + ".yaml"), "w") as f:
-                    f.write(
-                        ClassConverter.default_spec(
-                            factory_name, nipype_module_str, defaults=wf_defaults
-                        )
-                    )
-        if with_fileformats is None:
-            with_fileformats = interface_only_pkg
-
-        if with_fileformats:
-            with open(
-                pkg_dir
-                / "related-packages"
-                / "fileformats"
-                / "fileformats"
-                / f"medimage_{pkg}"
-                / "__init__.py",
-                "w",
-            ) as f:
-                f.write(gen_fileformats_module(pkg_formats))
-
-            with open(
-                pkg_dir
-                / "related-packages"
-                / "fileformats-extras"
-                / "fileformats"
-                / "extras"
-                / f"medimage_{pkg}"
-                / "__init__.py",
-                "w",
-            ) as f:
-                f.write(gen_fileformats_extras_module(pkg, pkg_formats))
-
-            tests_dir = (
-                pkg_dir
-                / "related-packages"
-                / "fileformats-extras"
-                / "fileformats"
-                / "extras"
-                / f"medimage_{pkg}"
-                / "tests"
-            )
-            tests_dir.mkdir()
-
-            with open(tests_dir / "test_generate_sample_data.py", "w") as f:
-                f.write(gen_fileformats_extras_tests(pkg, pkg_formats))
-
-        # Remove fileformats lines from pyproject.toml
-        pyproject_fspath = pkg_dir / "pyproject.toml"
-
-        pyproject = toml.load(pyproject_fspath)
-
-        if not with_fileformats:
-            deps = pyproject["project"]["dependencies"]
-            deps = [d for d in deps if d != f"fileformats-medimage-{pkg}"]
-            pyproject["project"]["dependencies"] = deps
-            test_deps = pyproject["project"]["optional-dependencies"]["test"]
-            test_deps = [
-                d for d in test_deps if d != f"fileformats-medimage-{pkg}-extras"
-            ]
-            pyproject["project"]["optional-dependencies"]["test"] = test_deps
-        with open(pyproject_fspath, "w") as f:
-            toml.dump(pyproject, f)
-
-        if example_packages and not single_interface:
-            with open(example_packages) as f:
-                example_pkg_names = yaml.load(f, Loader=yaml.SafeLoader)
-
-            examples_dir = (
-                Path(__file__).parent.parent.parent / "example-specs" / "task" / pkg
-            )
-            if examples_dir.exists():
-                shutil.rmtree(examples_dir)
-            examples_dir.mkdir()
-            for example_pkg_name in example_pkg_names:
-                specs_dir = (
-                    output_dir
-                    / ("pydra-" + example_pkg_name)
-                    / "nipype-auto-conv"
-                    / "specs"
+            # Updates are left uncommitted so they can be reviewed
+            if not update_pkg:
+                sp.check_call("git init", shell=True, cwd=pkg_dir)
+                sp.check_call("git add --all", shell=True, cwd=pkg_dir)
+                sp.check_call(
+                    'git commit -m"initial commit of generated stubs"',
+                    shell=True,
+                    cwd=pkg_dir,
                 )
-                dest_dir = examples_dir / example_pkg_name
-                shutil.copytree(specs_dir, dest_dir)
-
-        sp.check_call("git init", shell=True, cwd=pkg_dir)
-        sp.check_call("git add --all", shell=True, cwd=pkg_dir)
-        sp.check_call(
-            'git commit -m"initial commit of generated stubs"', shell=True, cwd=pkg_dir
-        )
-        sp.check_call("git tag 0.1.0", shell=True, cwd=pkg_dir)
+                sp.check_call("git tag 0.1.0", shell=True, cwd=pkg_dir)
 
     unmatched_extensions = set(
         File.decompose_fspath(
@@ -333,6 +512,14 @@ def pkg_gen(
     print("\n".join(str(p) for p in ambiguous_formats))
     print("\nWith doctests")
     print("\n".join(sorted(has_doctests)))
+    if update:
+        print(
+            f"\n{len(unchanged_interfaces)} interfaces unchanged since last generated"
+        )
+        print("\nMerge conflicts (hand-edited values were kept)")
+        print("\n".join(merge_conflicts))
+        print("\nHand-edited callables modules that were not updated")
+        print("\n".join(kept_callables))
 
 
 if __name__ == "__main__":
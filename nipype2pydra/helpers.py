@@ -16,6 +16,7 @@ from .utils import (
     multiline_comment,
     split_source_into_statements,
     replace_undefined,
+    release_cached_properties,
 )
 from .statements import (
     ImportStatement,
@@ -166,6 +167,23 @@ class BaseHelperConverter:
         workflows"""
         return list(self.nested_interfaces) + self.external_nested_interfaces
 
+    def release(self):
+        """Drops the state derived during the conversion (source code, used symbols,
+        converted code, etc...) once it is no longer required so it can be garbage
+        collected. It is recomputed if it is accessed again"""
+        release_cached_properties(
+            self,
+            [
+                "src",
+                "used_symbols",
+                "used_configs",
+                "converted_code",
+                "_converted_code",
+                "nested_interfaces",
+                "nested_interface_symbols",
+            ],
+        )
+
     @classmethod
     def default_spec(
         cls, name: str, nipype_module: str, defaults: ty.Dict[str, ty.Any]
@@ -325,6 +343,10 @@ class FunctionConverter(BaseHelperConverter):
         preamble, args, post = extract_args(self.src)
         return post.split(":", 1)[1]
 
+    def release(self):
+        super().release()
+        release_cached_properties(self, ["func_body"])
+
     @cached_property
     def _converted_code(self) -> ty.Tuple[str, ty.List[str]]:
         """Convert the Nipype workflow function to a Pydra workflow function and determine
@@ -6,6 +6,8 @@ from .base import (
     OutputsConverter,
     TestGenerator,
     DocTestGenerator,
+    TraitSpecSnapshot,
+    CallableSources,
 )
 from .loaders import get_converter
 
@@ -17,5 +19,7 @@ __all__ = [
     "OutputsConverter",
     "TestGenerator",
     "DocTestGenerator",
+    "TraitSpecSnapshot",
+    "CallableSources",
     "get_converter",
 ]
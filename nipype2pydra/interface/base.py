@@ -1,11 +1,14 @@
 from pathlib import Path
 import typing as ty
 import re
+import io
+import tokenize
 import logging
 from abc import ABCMeta, abstractmethod
 from importlib import import_module
-from types import ModuleType
+from types import ModuleType, MappingProxyType
 import itertools
+from operator import attrgetter
 import inspect
 import traits.trait_types
 import json
@@ -24,6 +27,11 @@ from ..utils import (
     types_converter,
     from_dict_converter,
     unwrap_nested_type,
+    split_source_into_statements,
+    release_cached_properties,
+    get_local_functions,
+    get_local_classes,
+    get_local_constants,
 )
 from ..statements import (
     ImportStatement,
@@ -234,6 +242,9 @@ class DocTestGenerator:
         consisting of 'module', 'name', and optionally 'alias' keys
     directive : str
         any doctest directive to be applied to the cmdline line
+    xfail : bool
+        whether the inputs of the doctest are known not to reproduce its cmdline, in
+        which case the cmdline test generated from it is expected to fail
     """
 
     cmdline: str = attrs.field(metadata={"help": "the expected cmdline output"})
@@ -259,6 +270,25 @@ class DocTestGenerator:
             "help": "any doctest directive to place on the cmdline call, e.g. # doctest: +ELLIPSIS"
         },
     )
+    xfail: bool = attrs.field(
+        default=False,
+        metadata={
+            "help": """whether the inputs of the doctest are known not to reproduce its
+                cmdline, in which case the cmdline test generated from it is expected
+                to fail (strictly, so it is flagged once the conversion is fixed)"""
+        },
+    )
+
+
+def strip_trailing_comment(code: str) -> str:
+    """Strips a trailing comment from a line of code, e.g. a doctest directive"""
+    try:
+        for token in tokenize.generate_tokens(io.StringIO(code).readline):
+            if token.type == tokenize.COMMENT:
+                return code[: token.start[1]].rstrip()
+    except tokenize.TokenError:
+        pass
+    return code
 
 
 def from_dict_to_inputs(obj: ty.Union[InputsConverter, dict]) -> InputsConverter:
@@ -285,6 +315,156 @@ def from_list_to_doctests(
     return [from_dict_converter(t, DocTestGenerator) for t in obj]
 
 
+@attrs.define(frozen=True)
+class TraitSpecSnapshot:
+    """The traits of the input and output specs of a nipype interface, captured once
+    so that the traited specs don't need to be re-instantiated each time a trait is
+    inspected (which is expensive for interfaces with 100+ traits). Snapshots are held
+    by the converter of the interface (see `BaseInterfaceConverter.trait_spec`) and
+    released along with it
+
+    Parameters
+    ----------
+    input_traits : Mapping[str, CTrait]
+        the traits of an instance of the input spec
+    input_class_traits : Mapping[str, CTrait]
+        the class traits of the input spec
+    output_traits : Mapping[str, CTrait]
+        the traits of an instance of the output spec, empty if there isn't one
+    """
+
+    input_traits: ty.Mapping[str, traits.ctrait.CTrait] = attrs.field(
+        converter=MappingProxyType
+    )
+    input_class_traits: ty.Mapping[str, traits.ctrait.CTrait] = attrs.field(
+        converter=MappingProxyType
+    )
+    output_traits: ty.Mapping[str, traits.ctrait.CTrait] = attrs.field(
+        converter=MappingProxyType
+    )
+
+    @property
+    def output_names(self) -> ty.KeysView:
+        return self.output_traits.keys()
+
+    @classmethod
+    def from_interface(cls, nipype_interface: type) -> "TraitSpecSnapshot":
+        """Takes a snapshot of the traits of the given interface class"""
+        input_spec = nipype_interface.input_spec
+        output_spec = nipype_interface.output_spec
+        return cls(
+            input_traits=input_spec().traits() if input_spec else {},
+            input_class_traits=input_spec.class_traits() if input_spec else {},
+            output_traits=output_spec().traits() if output_spec else {},
+        )
+
+
+# Name of the modules generated by pkg-gen that contain the helpers shared between the
+# callables modules of a package (e.g. "_fsl_shared_callables")
+SHARED_CALLABLES_MODULE_RE = re.compile(r"^_\w+_shared_callables$")
+
+
+@attrs.define
+class CallableSources:
+    """The functions of a callables module referenced by an interface spec, along with
+    the helper functions, classes and constants of the module that they reference
+    (recursively) and the imports they require
+
+    Parameters
+    ----------
+    functions : list[callable]
+        the referenced functions followed by the helper functions they reference
+    classes : list[type]
+        the helper classes, in the order they are defined in the module
+    constants : list[tuple[str, str]]
+        the constants, in (name, value) tuples in the order they are defined
+    imports : list[ImportStatement]
+        the module-level imports used by the functions, classes and constants
+    shared : dict[str, callable or type]
+        helpers imported from the shared callables module of the package (see
+        `SharedCallables` in `nipype2pydra.pkg_gen`), keyed by the name they are
+        imported as
+    """
+
+    functions: ty.List[ty.Callable] = attrs.field(factory=list)
+    classes: ty.List[type] = attrs.field(factory=list)
+    constants: ty.List[ty.Tuple[str, str]] = attrs.field(factory=list)
+    imports: ty.List[ImportStatement] = attrs.field(factory=list)
+    shared: ty.Dict[str, ty.Union[ty.Callable, type]] = attrs.field(factory=dict)
+
+    @classmethod
+    def find(cls, module: ModuleType, names: ty.Iterable[str]) -> "CallableSources":
+        """Finds the sources of the named functions in the module and the helpers they
+        reference"""
+        names = list(names)
+        local_objs = {
+            o.__name__: o
+            for o in get_local_functions(module) + get_local_classes(module)
+        }
+        local_consts = get_local_constants(module)
+        const_defs = dict(local_consts)
+        shared = {
+            n: o
+            for n, o in vars(module).items()
+            if (inspect.isfunction(o) or inspect.isclass(o))
+            and SHARED_CALLABLES_MODULE_RE.match(o.__module__)
+        }
+        sources = cls()
+        visited = set()
+        to_visit = list(names)
+        helpers = []
+        while to_visit:
+            name = to_visit.pop(0)
+            if name in visited:
+                continue
+            visited.add(name)
+            if name in local_objs:
+                obj = local_objs[name]
+                src = inspect.getsource(obj)
+                if inspect.isclass(obj):
+                    sources.classes.append(obj)
+                elif name in names:
+                    sources.functions.append(obj)
+                else:
+                    helpers.append(obj)
+            elif name in const_defs:
+                src = const_defs[name]
+            elif name in shared:
+                sources.shared[name] = shared[name]
+                continue
+            else:
+                continue
+            symbols = set()
+            UsedSymbols._get_symbols(src, symbols)
+            to_visit.extend(sorted(symbols - visited))
+        sources.functions.extend(sorted(helpers, key=attrgetter("__name__")))
+        sources.classes.sort(key=lambda c: inspect.getsourcelines(c)[1])
+        sources.constants = [c for c in local_consts if c[0] in visited]
+        import_strs = [
+            s
+            for s in split_source_into_statements(inspect.getsource(module))
+            if ImportStatement.matches(s) and not s.startswith((" ", "\t"))
+        ]
+        sources.imports = UsedSymbols.filter_imports(
+            [
+                i
+                for i in parse_imports(import_strs, relative_to=module.__name__)
+                if not SHARED_CALLABLES_MODULE_RE.match(i.module_name)
+            ],
+            sources.code,
+        )
+        return sources
+
+    @property
+    def code(self) -> str:
+        code_str = ""
+        for name, value in self.constants:
+            code_str += f"{name} = {value}\n\n"
+        for obj in self.classes + self.functions:
+            code_str += inspect.getsource(obj) + "\n"
+        return code_str
+
+
 @attrs.define(slots=False)
 class BaseInterfaceConverter(metaclass=ABCMeta):
     """Specifies how the semi-automatic conversion from Nipype to Pydra should
@@ -373,7 +553,11 @@ class BaseInterfaceConverter(metaclass=ABCMeta):
     def nipype_interface(self) -> nipype.interfaces.base.BaseInterface:
         return getattr(self.nipype_module, self.nipype_name)
 
-    @property
+    @cached_property
+    def trait_spec(self) -> TraitSpecSnapshot:
+        return TraitSpecSnapshot.from_interface(self.nipype_interface)
+
+    @cached_property
     def nipype_input_spec(self) -> nipype.interfaces.base.BaseInterfaceInputSpec:
         return (
             self.nipype_interface.input_spec()
@@ -385,7 +569,7 @@ class BaseInterfaceConverter(metaclass=ABCMeta):
     def full_address(self):
         return f"{self.nipype_module.__name__}.{self.nipype_name}"
 
-    @property
+    @cached_property
     def nipype_output_spec(self) -> nipype.interfaces.base.BaseTraitedSpec:
         return (
             self.nipype_interface.output_spec()
@@ -465,6 +649,11 @@ class BaseInterfaceConverter(metaclass=ABCMeta):
             find_replace=self.find_replace + self.package.find_replace,
         )
 
+        if self.callable_sources.shared:
+            self.package.write_shared_callables(
+                package_root, self.callable_sources.shared.values()
+            )
+
         self.package.write_pkg_inits(
             package_root,
             self.output_module,
@@ -472,6 +661,7 @@ class BaseInterfaceConverter(metaclass=ABCMeta):
             depth=self.package.init_depth,
             auto_import_depth=self.package.auto_import_init_depth,
             import_find_replace=self.package.import_find_replace,
+            lazy=self.package.lazy_init_imports,
             # + [f.__name__ for f in self.used_symbols.local_functions]
             # + [c.__name__ for c in self.used_symbols.local_classes],
         )
@@ -492,13 +682,34 @@ class BaseInterfaceConverter(metaclass=ABCMeta):
             with open(conftest_fspath, "w") as f:
                 f.write(self.CONFTEST)
 
+    def release(self):
+        """Drops the state derived during the conversion (trait snapshots, converted
+        fields and code, used symbols, etc...) once the interface has been written so it
+        can be garbage collected. It is recomputed if it is accessed again"""
+        release_cached_properties(
+            self,
+            [
+                "trait_spec",
+                "nipype_input_spec",
+                "nipype_output_spec",
+                "input_fields",
+                "input_templates",
+                "output_fields",
+                "nonstd_types",
+                "_converted",
+                "_convert_input_fields",
+                "callable_sources",
+                "_converted_test",
+            ],
+        )
+
     @cached_property
     def _convert_input_fields(self):
         """creating fields list for pydra input spec"""
         pydra_fields_dict = {}
         position_dict = {}
         has_template = []
-        for name, fld in self.nipype_input_spec.traits().items():
+        for name, fld in self.trait_spec.input_traits.items():
             if name in self.TRAITS_IRREL:
                 continue
             if name in self.inputs.omit:
@@ -548,7 +759,7 @@ class BaseInterfaceConverter(metaclass=ABCMeta):
                 tmpl = self.string_formats(argstr=template, name=name_source[0])
             else:
                 tmpl = template
-            if nm in self.nipype_interface.output_spec().class_trait_names():
+            if nm in self.trait_spec.output_names:
                 pydra_metadata["output_file_template"] = tmpl
             if pydra_type in [specs.File, specs.Directory]:
                 pydra_type = Path
@@ -583,9 +794,7 @@ class BaseInterfaceConverter(metaclass=ABCMeta):
     def convert_output_spec(self, fields_from_template):
         """creating fields list for pydra input spec"""
         pydra_fields_l = []
-        if not self.nipype_output_spec:
-            return pydra_fields_l
-        for name, fld in self.nipype_output_spec.traits().items():
+        for name, fld in self.trait_spec.output_traits.items():
             if (
                 name not in self.TRAITS_IRREL
                 and name not in fields_from_template
@@ -638,20 +847,34 @@ class BaseInterfaceConverter(metaclass=ABCMeta):
             pydra_metadata["callable"] = self.outputs.callables[name]
         return (pydra_type, pydra_metadata)
 
-    def function_callables(self):
+    @cached_property
+    def callable_sources(self) -> CallableSources:
         if not self.outputs.callables:
-            return ""
+            return CallableSources()
         if not self.callables_module:
             raise Exception(
                 "callables module must be provided if output_callables are set in the spec file"
             )
-        fun_str = ""
-        fun_names = list(set(self.outputs.callables.values()))
-        fun_names.sort()
-        for fun_nm in fun_names:
-            fun = getattr(self.callables_module, fun_nm)
-            fun_str += inspect.getsource(fun) + "\n"
-        return fun_str
+        return CallableSources.find(
+            self.callables_module, sorted(set(self.outputs.callables.values()))
+        )
+
+    def function_callables(self):
+        return self.callable_sources.code
+
+    @property
+    def callables_imports(self) -> ty.List[ImportStatement]:
+        """The imports required by the callables, including those of the helpers that
+        are imported from the shared callables module of the package"""
+        imports = list(self.callable_sources.imports)
+        for name, helper in sorted(self.callable_sources.shared.items()):
+            imports.extend(
+                parse_imports(
+                    f"from {self.package.shared_callables_module} import "
+                    f"{helper.__name__} as {name}"
+                )
+            )
+        return imports
 
     def pydra_type_converter(self, field, spec_type, name):
         """converting types to types used in pydra"""
@@ -774,13 +997,43 @@ class BaseInterfaceConverter(metaclass=ABCMeta):
 
     @cached_property
     def _converted_test(self):
+        base_imports = {
+            "import pytest",
+        }
         spec_str = ""
+        # Fast tests that only check the command line constructed from the inputs of
+        # each doctest, without running the tool
+        if hasattr(self.nipype_interface, "_cmd"):
+            for i, doctest in enumerate(self.doctests, start=1):
+                if doctest.directive and "+SKIP" in doctest.directive:
+                    continue
+                if doctest.xfail:
+                    spec_str += "@pytest.mark.xfail(strict=True)\n"
+                spec_str += f"def test_{self.task_name.lower()}_cmdline_{i}():\n"
+                spec_str += f"    task = {self.task_name}()\n"
+                for nm, val in self._doctest_inputs(
+                    doctest, self.input_fields, strip_comments=True
+                ):
+                    spec_str += f"    task.inputs.{nm} = {val}\n"
+                # File paths are absolute in the Pydra cmdline, so their directories
+                # are stripped before the cmdlines are compared
+                ellipsis = bool(doctest.directive and "ELLIPSIS" in doctest.directive)
+                spec_str += (
+                    f"    assert cmdline_matches(task.cmdline, {doctest.cmdline!r}"
+                    + (", ellipsis=True" if ellipsis else "")
+                    + ")\n"
+                )
+                base_imports.add("from nipype2pydra.testing import cmdline_matches")
+                spec_str += "\n\n\n"
+        # Slow tests that run the tool (up until the timeout), which can be deselected
+        # with `-m "not execution"`
         for i, test in enumerate(self.tests, start=1):
+            spec_str += "@pytest.mark.execution\n"
             if test.xfail:
                 spec_str += "@pytest.mark.xfail\n"
             # spec_str += f"@pass_after_timeout(seconds={test.timeout})\n"
-            spec_str += f"def test_{self.task_name.lower()}_{i}():\n"
-            spec_str += f"    task = {self.task_name}()\n"
+            test_name = f"test_{self.task_name.lower()}_{i}"
+            body_str = f"    task = {self.task_name}()\n"
             for i, field in enumerate(self.input_fields):
                 nm, tp = field[:2]
                 # Try to get a sensible value for the traits value
@@ -791,12 +1044,12 @@ class BaseInterfaceConverter(metaclass=ABCMeta):
                 else:
                     if value is None:
                         if is_fileset(tp):
-                            value = f"{tp.__name__}.sample(seed={i})"
+                            value = f"sample_file({tp.__name__}, seed={i})"
                         elif ty.get_origin(tp) in (list, ty.Union) and is_fileset(
                             ty.get_args(tp)[0]
                         ):
                             arg_tp = ty.get_args(tp)[0]
-                            value = f"{arg_tp.__name__}.sample(seed={i})"
+                            value = f"sample_file({arg_tp.__name__}, seed={i})"
                             if ty.get_origin(tp) is list:
                                 value = "[" + value + "]"
                         else:
@@ -808,9 +1061,7 @@ class BaseInterfaceConverter(metaclass=ABCMeta):
                             else:
                                 assert len(field) == 3
                                 # Attempt to pick a sensible value for field
-                                trait = self.nipype_interface.input_spec.class_traits()[
-                                    nm
-                                ]
+                                trait = self.trait_spec.input_class_traits[nm]
                                 if isinstance(trait, traits.trait_types.Enum):
                                     value = trait.values[0]
                                 elif isinstance(trait, traits.trait_types.Range):
@@ -828,22 +1079,28 @@ class BaseInterfaceConverter(metaclass=ABCMeta):
                                 else:
                                     value = attrs.NOTHING
                     if value is not attrs.NOTHING:
-                        spec_str += f"    task.inputs.{nm} = {value}\n"
+                        body_str += f"    task.inputs.{nm} = {value}\n"
             if hasattr(self.nipype_interface, "_cmd"):
-                spec_str += r'    print(f"CMDLINE: {task.cmdline}\n\n")' + "\n"
-            spec_str += "    res = task(plugin=PassAfterTimeoutWorker)\n"
-            spec_str += "    print('RESULT: ', res)\n"
+                body_str += r'    print(f"CMDLINE: {task.cmdline}\n\n")' + "\n"
+            body_str += (
+                "    res = task(plugin=smoke_test_worker, "
+                f'plugin_kwargs={{"timeout": {test.timeout}}})\n'
+            )
+            body_str += "    print('RESULT: ', res)\n"
             for name, value in test.expected_outputs.items():
-                spec_str += f"    assert res.output.{name} == {value}\n"
+                body_str += f"    assert res.output.{name} == {value}\n"
+            # Sample files are generated once per session and shared between the tests
+            fixtures = ["smoke_test_worker"]
+            if "sample_file(" in body_str:
+                fixtures.append("sample_file")
+            spec_str += f"def {test_name}({', '.join(fixtures)}):\n"
+            spec_str += body_str
             spec_str += "\n\n\n"
 
         imports = self.construct_imports(
             self.nonstd_types,
             spec_str,
-            base={
-                "import pytest",
-                "from nipype2pydra.testing import PassAfterTimeoutWorker",
-            },
+            base=base_imports,
         )
 
         return spec_str, UsedSymbols(
@@ -855,38 +1112,8 @@ class BaseInterfaceConverter(metaclass=ABCMeta):
         doctest_str = ""
         for doctest in self.doctests:
             doctest_str += f"    >>> task = {self.task_name}()\n"
-            for field in input_fields:
-                nm, tp = field[:2]
-                try:
-                    val = doctest.inputs[nm]
-                except KeyError:
-                    if is_fileset(tp):
-                        val = f"{tp.__name__}.mock()"
-                    else:
-                        val = attrs.NOTHING
-                else:
-                    if is_fileset(tp):
-                        val = f"{tp.__name__}.mock({val})"
-                    elif ty.get_origin(tp) is list and is_fileset(ty.get_args(tp)[0]):
-                        try:
-                            val = eval(val)
-                        except Exception:
-                            pass
-                        else:
-                            val = (
-                                "["
-                                + ", ".join(
-                                    f'{ty.get_args(tp)[0].__name__}.mock("{v}")'
-                                    for v in val
-                                )
-                                + "]"
-                            )
-                    elif tp is str and not (val.startswith("'") or val.startswith('"')):
-                        val = f'"{val}"'
-                if val is None and is_fileset(tp):
-                    val = f"{tp.__name__}.mock()"
-                if val is not attrs.NOTHING:
-                    doctest_str += f"    >>> task.inputs.{nm} = {val}\n"
+            for nm, val in self._doctest_inputs(doctest, input_fields):
+                doctest_str += f"    >>> task.inputs.{nm} = {val}\n"
             doctest_str += "    >>> task.cmdline\n"
             doctest_str += f"    '{doctest.cmdline}'"
             doctest_str += "\n\n\n"
@@ -902,6 +1129,52 @@ class BaseInterfaceConverter(metaclass=ABCMeta):
 
         return "    Examples\n    -------\n\n" + doctest_str
 
+    def _doctest_inputs(
+        self,
+        doctest: DocTestGenerator,
+        input_fields: ty.List[tuple],
+        strip_comments: bool = False,
+    ) -> ty.List[ty.Tuple[str, str]]:
+        """The names of the input fields set in a doctest and the code for the values
+        they are set to, optionally dropping any comments (e.g. doctest directives)
+        appended to the values"""
+        inputs = []
+        for field in input_fields:
+            nm, tp = field[:2]
+            try:
+                val = doctest.inputs[nm]
+                if strip_comments and isinstance(val, str):
+                    val = strip_trailing_comment(val)
+            except KeyError:
+                if is_fileset(tp):
+                    val = f"{tp.__name__}.mock()"
+                else:
+                    val = attrs.NOTHING
+            else:
+                if is_fileset(tp):
+                    val = f"{tp.__name__}.mock({val})"
+                elif ty.get_origin(tp) is list and is_fileset(ty.get_args(tp)[0]):
+                    try:
+                        val = eval(val)
+                    except Exception:
+                        pass
+                    else:
+                        val = (
+                            "["
+                            + ", ".join(
+                                f'{ty.get_args(tp)[0].__name__}.mock("{v}")'
+                                for v in val
+                            )
+                            + "]"
+                        )
+                elif tp is str and not (val.startswith("'") or val.startswith('"')):
+                    val = f'"{val}"'
+            if val is None and is_fileset(tp):
+                val = f"{tp.__name__}.mock()"
+            if val is not attrs.NOTHING:
+                inputs.append((nm, val))
+        return inputs
+
     INPUT_KEYS = [
         "allowed_values",
         "argstr",
@@ -932,6 +1205,7 @@ class BaseInterfaceConverter(metaclass=ABCMeta):
 # break at it
 import os
 import pytest
+from nipype2pydra.testing import ProcessGroupTimeoutWorker
 
 
 if os.getenv("_PYTEST_RAISE", "0") != "0":
@@ -948,8 +1222,45 @@ if os.getenv("_PYTEST_RAISE", "0") != "0":
         config.option.capture = 'no'  # allow print statements to show up in the console
         config.option.log_cli = True  # show log messages in the console
         config.option.log_level = "INFO"  # set the log level to INFO
+        add_markers(config)
 
     CATCH_CLI_EXCEPTIONS = False
 else:
+
+    def pytest_configure(config):
+        add_markers(config)
+
     CATCH_CLI_EXCEPTIONS = True
+
+
+# Worker shared by the tests that run the tools, which runs them concurrently in their
+# own process groups so they can be killed once the timeout is reached
+@pytest.fixture(scope="session")
+def smoke_test_worker():
+    worker = ProcessGroupTimeoutWorker()
+    yield worker
+    worker.shutdown()
+
+
+# Sample files shared by the tests, which are only generated once per session for each
+# format and seed
+@pytest.fixture(scope="session")
+def sample_file(tmp_path_factory):
+    samples = {}
+
+    def get_sample(fileformat, seed=0):
+        if (fileformat, seed) not in samples:
+            dest_dir = tmp_path_factory.mktemp(f"{fileformat.__name__}-{seed}")
+            samples[(fileformat, seed)] = fileformat.sample(dest_dir, seed=seed)
+        return samples[(fileformat, seed)]
+
+    return get_sample
+
+
+def add_markers(config):
+    config.addinivalue_line(
+        "markers",
+        "execution: runs the tool (deselect with -m 'not execution' to only run the "
+        "fast command-line tests)",
+    )
 """
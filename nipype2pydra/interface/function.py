@@ -15,6 +15,7 @@ from ..utils import (
     get_local_constants,
     cleanup_function_body,
     insert_args_in_signature,
+    release_cached_properties,
 )
 
 
@@ -416,6 +417,21 @@ class FunctionInterfaceConverter(BaseInterfaceConverter):
     def local_function_names(self):
         return [f.__name__ for f in self.local_functions]
 
+    def release(self):
+        super().release()
+        release_cached_properties(
+            self,
+            [
+                "_referenced_funcs_and_methods",
+                "source_code",
+                "local_functions",
+                "local_constants",
+                "return_value",
+                "methods",
+                "local_function_names",
+            ],
+        )
+
     RUNTIME_ATTRS = (
         ("cwd", "os.getcwd()", "import os"),
         ("environ", "os.environ", "import os"),
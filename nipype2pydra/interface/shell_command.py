@@ -3,6 +3,7 @@ import typing as ty
 import attrs
 import inspect
 from copy import copy
+from pathlib import Path
 from .base import BaseInterfaceConverter
 from ..utils import UsedSymbols
 from fileformats.core.mixin import WithClassifiers
@@ -84,18 +85,33 @@ class ShellCommandInterfaceConverter(BaseInterfaceConverter):
         output_fields_str = types_to_names(spec_fields=output_fields)
         functions_str = self.function_callables()
         spec_str = functions_str
-        spec_str += f"input_fields = {input_fields_str}\n"
-        spec_str += f"{self.task_name}_input_spec = specs.SpecInfo(name='Input', fields=input_fields, bases=(specs.ShellSpec,))\n\n"
-        spec_str += f"output_fields = {output_fields_str}\n"
-        spec_str += f"{self.task_name}_output_spec = specs.SpecInfo(name='Output', fields=output_fields, bases=(specs.ShellOutSpec,))\n\n"
+        if self.package and self.package.lazy_task_specs:
+            # Wrap the construction of the specs in functions that are only called on
+            # first access of the task class's spec attributes
+            base_imports.append(f"from {self.package.lazy_spec_module} import LazySpec")
+            input_spec = f"LazySpec(_{self.task_name}_input_spec)"
+            output_spec = f"LazySpec(_{self.task_name}_output_spec)"
+            spec_str += f"def _{self.task_name}_input_spec():\n"
+            spec_str += f"    input_fields = {input_fields_str}\n"
+            spec_str += "    return specs.SpecInfo(name='Input', fields=input_fields, bases=(specs.ShellSpec,))\n\n"
+            spec_str += f"def _{self.task_name}_output_spec():\n"
+            spec_str += f"    output_fields = {output_fields_str}\n"
+            spec_str += "    return specs.SpecInfo(name='Output', fields=output_fields, bases=(specs.ShellOutSpec,))\n\n"
+        else:
+            input_spec = f"{self.task_name}_input_spec"
+            output_spec = f"{self.task_name}_output_spec"
+            spec_str += f"input_fields = {input_fields_str}\n"
+            spec_str += f"{self.task_name}_input_spec = specs.SpecInfo(name='Input', fields=input_fields, bases=(specs.ShellSpec,))\n\n"
+            spec_str += f"output_fields = {output_fields_str}\n"
+            spec_str += f"{self.task_name}_output_spec = specs.SpecInfo(name='Output', fields=output_fields, bases=(specs.ShellOutSpec,))\n\n"
         spec_str += f"class {self.task_name}({task_base}):\n"
         spec_str += '    """\n'
         spec_str += self.create_doctests(
             input_fields=input_fields, nonstd_types=nonstd_types
         )
         spec_str += '    """\n'
-        spec_str += f"    input_spec = {self.task_name}_input_spec\n"
-        spec_str += f"    output_spec = {self.task_name}_output_spec\n"
+        spec_str += f"    input_spec = {input_spec}\n"
+        spec_str += f"    output_spec = {output_spec}\n"
         if task_base == "ShellCommandTask":
             spec_str += f"    executable='{executable}'\n"
 
@@ -105,10 +121,15 @@ class ShellCommandInterfaceConverter(BaseInterfaceConverter):
             nonstd_types,
             spec_str,
             include_task=False,
-            base=base_imports,
+            base=base_imports + self.callables_imports,
         )
         # spec_str = "\n".join(str(i) for i in imports) + "\n\n" + spec_str
 
         return spec_str, UsedSymbols(
             module_name=self.nipype_module.__name__, imports=imports
         )
+
+    def write(self, package_root: Path, *args, **kwargs):
+        super().write(package_root, *args, **kwargs)
+        if self.package.lazy_task_specs:
+            self.package.write_lazy_spec_module(package_root)
@@ -1,3 +1,6 @@
+import re
+import sys
+import subprocess as sp
 from importlib import import_module
 import yaml
 import pytest
@@ -9,6 +12,8 @@ from nipype2pydra.utils import (
     INBUILT_NIPYPE_TRAIT_NAMES,
 )
 from nipype2pydra.package import PackageConverter
+from nipype2pydra.interface import BaseInterfaceConverter
+from nipype2pydra.benchmark import MemoryProfile
 from conftest import EXAMPLE_INTERFACES_DIR
 
 
@@ -174,3 +179,273 @@ def test_interface_convert(
             pytest.xfail(msg)
         else:
             raise
+
+
+SHARED_CALLABLES_SRC = """
+import os.path as op
+
+SUFFIX = "_box"
+OUTPUTS = ["x_max", "x_min", "y_max", "y_min", "z_max", "z_min"]
+
+
+def _list_outputs_0123abcd(inputs=None, stdout=None, stderr=None, output_dir=None):
+    return {n: _out_name_4567abcd(n) for n in OUTPUTS}
+
+
+def _out_name_4567abcd(name):
+    return op.abspath(name + SUFFIX)
+"""
+
+AUTOBOX_CALLABLE_TEMPLATE = """
+
+def {name}_callable(output_dir, inputs, stdout, stderr):
+    return _list_outputs(inputs=inputs)["{name}"]
+"""
+
+AUTOBOX_CALLABLES_SRC = (
+    "from _tst_shared_callables import _list_outputs_0123abcd as _list_outputs\n"
+) + "".join(
+    AUTOBOX_CALLABLE_TEMPLATE.format(name=n)
+    for n in ["x_max", "x_min", "y_max", "y_min", "z_max", "z_min"]
+)
+
+
+def test_interface_shared_callables(tmp_path):
+    spec_dir = tmp_path / "specs"
+    spec_dir.mkdir()
+    (spec_dir / "_tst_shared_callables.py").write_text(SHARED_CALLABLES_SRC)
+    with open(EXAMPLE_INTERFACES_DIR / "afni" / "autobox.yaml") as f:
+        interface_spec = yaml.safe_load(f)
+    pkg_root = tmp_path / "src"
+    pkg_converter = PackageConverter(
+        name="nipype2pydratest.shared_callables",
+        nipype_name="nipype",
+        interface_only=True,
+    )
+    converters = []
+    for task_name in ["Autobox", "AutoboxCopy"]:
+        callables_file = spec_dir / f"_tst_{task_name.lower()}_callables.py"
+        callables_file.write_text(AUTOBOX_CALLABLES_SRC)
+        converters.append(
+            pkg_converter.add_interface_from_spec(
+                spec=dict(interface_spec, task_name=task_name),
+                callables_file=callables_file,
+            )
+        )
+    for converter in converters:
+        converter.write(pkg_root)
+        code = (
+            pkg_root.joinpath(*converter.output_module.split("."))
+            .with_suffix(".py")
+            .read_text()
+        )
+        assert re.search(
+            r"from nipype2pydratest\.shared_callables\.auto\._shared_callables import "
+            r"\(?\s*_list_outputs_0123abcd as _list_outputs\b",
+            code,
+        )
+        assert "def _out_name_4567abcd(" not in code
+    shared_code = (
+        pkg_root.joinpath(*pkg_converter.shared_callables_module.split("."))
+        .with_suffix(".py")
+        .read_text()
+    )
+    assert shared_code.count("def _list_outputs_0123abcd(") == 1
+    assert shared_code.count("def _out_name_4567abcd(") == 1
+    assert shared_code.count("SUFFIX = ") == 1
+    with add_to_sys_path(pkg_root):
+        pydra_module = import_module(converters[1].output_module)
+    assert pydra_module.x_max_callable(None, None, None, None).endswith("x_max_box")
+
+
+def test_interface_shared_callables_conflicting_constants(tmp_path):
+    spec_dir = tmp_path / "specs"
+    spec_dir.mkdir()
+    (spec_dir / "_tst_shared_callables.py").write_text(SHARED_CALLABLES_SRC)
+    # A shared callables module of another nipype package, which defines a different
+    # constant under the same name (as written by versions of pkg-gen that didn't
+    # rename the constants by the hash of their values)
+    (spec_dir / "_tstother_shared_callables.py").write_text(
+        SHARED_CALLABLES_SRC.replace('"_box"', '"_other"')
+        .replace("0123abcd", "89abcdef")
+        .replace("4567abcd", "cdef0123")
+    )
+    with open(EXAMPLE_INTERFACES_DIR / "afni" / "autobox.yaml") as f:
+        interface_spec = yaml.safe_load(f)
+    pkg_converter = PackageConverter(
+        name="nipype2pydratest.shared_callables_conflict",
+        nipype_name="nipype",
+        interface_only=True,
+    )
+    converters = []
+    for task_name, shared_module, helper in [
+        ("AutoboxBox", "_tst_shared_callables", "_list_outputs_0123abcd"),
+        ("AutoboxOther", "_tstother_shared_callables", "_list_outputs_89abcdef"),
+    ]:
+        callables_file = spec_dir / f"_tst_{task_name.lower()}_callables.py"
+        callables_src = AUTOBOX_CALLABLES_SRC.replace(
+            "_tst_shared_callables", shared_module
+        )
+        callables_file.write_text(
+            callables_src.replace("_list_outputs_0123abcd", helper)
+        )
+        converters.append(
+            pkg_converter.add_interface_from_spec(
+                spec=dict(interface_spec, task_name=task_name),
+                callables_file=callables_file,
+            )
+        )
+    pkg_root = tmp_path / "src"
+    converters[0].write(pkg_root)
+    with pytest.raises(RuntimeError, match="different value, '_box',"):
+        converters[1].write(pkg_root)
+
+
+def test_interface_lazy_task_specs(tmp_path):
+    with open(EXAMPLE_INTERFACES_DIR / "afni" / "autobox.yaml") as f:
+        interface_spec = yaml.safe_load(f)
+    pkg_root = tmp_path / "src"
+    pkg_converter = PackageConverter(
+        name="nipype2pydratest.lazy_task_specs",
+        nipype_name="nipype",
+        interface_only=True,
+        lazy_task_specs=True,
+    )
+    converter = pkg_converter.add_interface_from_spec(
+        spec=interface_spec,
+        callables_file=EXAMPLE_INTERFACES_DIR / "afni" / "autobox_callables.py",
+    )
+    converter.write(pkg_root)
+    code = (
+        pkg_root.joinpath(*converter.output_module.split("."))
+        .with_suffix(".py")
+        .read_text()
+    )
+    assert "\ninput_fields = " not in code
+    assert "input_spec = LazySpec(_Autobox_input_spec)" in code
+    with add_to_sys_path(pkg_root):
+        pydra_module = import_module(converter.output_module)
+    lazy_spec = pydra_module.Autobox.__dict__["input_spec"]
+    assert lazy_spec.spec is None
+    input_spec = pydra_module.Autobox.input_spec
+    assert input_spec.name == "Input"
+    assert "in_file" in [f[0] for f in input_spec.fields]
+    assert pydra_module.Autobox().input_spec is input_spec
+
+
+def test_interface_release(tmp_path):
+    with open(EXAMPLE_INTERFACES_DIR / "afni" / "autobox.yaml") as f:
+        interface_spec = yaml.safe_load(f)
+    pkg_converter = PackageConverter(
+        name="nipype2pydratest.release",
+        nipype_name="nipype",
+        interface_only=True,
+    )
+    converter = pkg_converter.add_interface_from_spec(
+        spec=interface_spec,
+        callables_file=EXAMPLE_INTERFACES_DIR / "afni" / "autobox_callables.py",
+    )
+    converted_code = converter.converted_code
+    memory_profile = MemoryProfile(trace=False)
+    pkg_converter.write(tmp_path, memory_profile=memory_profile)
+    assert (
+        tmp_path.joinpath(*converter.output_module.split(".")).with_suffix(".py")
+    ).exists()
+    # Derived state is dropped once written but recomputed if accessed again
+    assert "_converted" not in converter.__dict__
+    assert "trait_spec" not in converter.__dict__
+    assert "nipype_port_converters" not in pkg_converter.__dict__
+    assert converter.converted_code == converted_code
+    assert [s.stage for s in memory_profile.stages] == [
+        "parsing workflows",
+        "collecting helpers",
+        "converting workflows",
+        "converting interfaces",
+        "porting nipype interfaces",
+        "writing intra-package modules",
+    ]
+    assert memory_profile.stages[-1].peak_rss > 0
+
+
+def test_interface_cmdline_tests(tmp_path):
+    with open(EXAMPLE_INTERFACES_DIR / "afni" / "autobox.yaml") as f:
+        interface_spec = yaml.safe_load(f)
+    pkg_root = tmp_path / "src"
+    interface_spec["doctests"].append(
+        {
+            "cmdline": "3dAutobox -input .../structural.nii -npad 5 -prefix ...",
+            "inputs": interface_spec["doctests"][0]["inputs"],
+            "directive": "# doctest: +ELLIPSIS",
+        }
+    )
+    # The arguments of the first doctest are in a different order to those in the Pydra
+    # cmdline
+    interface_spec["doctests"][0]["xfail"] = True
+    pkg_converter = PackageConverter(
+        name="nipype2pydratest.cmdline_tests",
+        nipype_name="nipype",
+        interface_only=True,
+    )
+    converter = pkg_converter.add_interface_from_spec(
+        spec=interface_spec,
+        callables_file=EXAMPLE_INTERFACES_DIR / "afni" / "autobox_callables.py",
+    )
+    converter.write(pkg_root)
+    test_module = converter.output_module.rsplit(".", 1)[0] + ".tests.test_autobox"
+    test_code = (
+        pkg_root.joinpath(*test_module.split(".")).with_suffix(".py").read_text()
+    )
+    assert (
+        "@pytest.mark.execution\n@pytest.mark.xfail\n"
+        "def test_autobox_1(smoke_test_worker, sample_file):"
+    ) in test_code
+    assert "task.inputs.in_file = sample_file(Nifti1, seed=0)" in test_code
+    assert (
+        "@pytest.mark.xfail(strict=True)\ndef test_autobox_cmdline_1():"
+    ) in test_code
+    assert "def test_autobox_cmdline_2():" in test_code
+    assert (
+        "@pytest.mark.xfail(strict=True)\ndef test_autobox_cmdline_2" not in test_code
+    )
+    with add_to_sys_path(pkg_root):
+        generated_tests = import_module(test_module)
+    with pytest.raises(AssertionError):
+        generated_tests.test_autobox_cmdline_1()
+    # The paths in the expected cmdline aren't absolute
+    generated_tests.test_autobox_cmdline_2()
+
+
+SAMPLE_FILE_TESTS = """
+class Text:
+    sampled = []
+
+    @classmethod
+    def sample(cls, dest_dir, seed=0):
+        cls.sampled.append(seed)
+        fspath = dest_dir / f"{seed}.txt"
+        fspath.write_text(str(seed))
+        return fspath
+
+
+def test_a(sample_file):
+    assert sample_file(Text, seed=1) == sample_file(Text, seed=1)
+    assert sample_file(Text, seed=2).read_text() == "2"
+
+
+def test_b(sample_file):
+    assert sample_file(Text, seed=1).read_text() == "1"
+    assert Text.sampled == [1, 2]
+"""
+
+
+def test_conftest_sample_file(tmp_path):
+    (tmp_path / "conftest.py").write_text(BaseInterfaceConverter.CONFTEST)
+    (tmp_path / "test_samples.py").write_text(SAMPLE_FILE_TESTS)
+    result = sp.run(
+        [sys.executable, "-m", "pytest", "-p", "no:cacheprovider", str(tmp_path)],
+        cwd=tmp_path,
+        stdout=sp.PIPE,
+        stderr=sp.STDOUT,
+        text=True,
+    )
+    assert result.returncode == 0, result.stdout
@@ -1,12 +1,15 @@
 from importlib import import_module
+import ast
 import inspect
 import re
 import typing as ty
 import types
+import json
 import logging
-from copy import copy
+from copy import copy, deepcopy
 import shutil
-from functools import cached_property
+from functools import cached_property, lru_cache
+from contextlib import nullcontext
 from collections import defaultdict
 from pathlib import Path
 from operator import attrgetter, itemgetter
@@ -23,7 +26,10 @@ from .utils import (
     cleanup_function_body,
     split_source_into_statements,
     get_source_code,
+    localise_imports,
+    release_cached_properties,
 )
+from .benchmark import measure_import_time, MemoryProfile
 from .statements import ImportStatement, parse_imports, GENERIC_PYDRA_IMPORTS
 import nipype2pydra.workflow
 import nipype2pydra.helpers
@@ -83,6 +89,29 @@ def resolve_objects(addresses: ty.Optional[ty.List[str]]) -> list:
     return objs
 
 
+@lru_cache(maxsize=None)
+def load_specs(specs_dir: Path) -> ty.Tuple[ty.Tuple[Path, ty.Dict[str, ty.Any]], ...]:
+    """Loads the YAML specs in a directory, caching them so they are only read once per
+    process (e.g. when converting multiple packages in a batch). The returned specs
+    are shared so shouldn't be modified
+
+    Parameters
+    ----------
+    specs_dir : Path
+        the directory containing the specs
+
+    Returns
+    -------
+    tuple[tuple[Path, dict]]
+        the path and contents of each spec, sorted by path
+    """
+    specs = []
+    for spec_file in sorted(specs_dir.glob("*.yaml")):
+        with open(spec_file, "r") as f:
+            specs.append((spec_file, yaml.safe_load(f)))
+    return tuple(specs)
+
+
 @attrs.define(slots=False)
 class PackageConverter:
     """
@@ -260,6 +289,47 @@ class PackageConverter:
             )
         }
     )
+    lazy_init_imports: bool = attrs.field(
+        default=False,
+        metadata={
+            "help": (
+                "Whether the names imported from sub-modules into __init__ files are "
+                "loaded lazily on first access (via a module-level __getattr__, see "
+                "PEP 562) instead of being eagerly imported with the package"
+            )
+        },
+    )
+    lazy_task_specs: bool = attrs.field(
+        default=False,
+        metadata={
+            "help": (
+                "Whether the input/output specs of the converted shell-command tasks are "
+                "only constructed on first access of the task class's 'input_spec' and "
+                "'output_spec' attributes instead of when the module is imported"
+            )
+        },
+    )
+    local_import_modules: ty.List[str] = attrs.field(
+        factory=list,
+        converter=lambda lst: list(lst) if lst else [],
+        metadata={
+            "help": (
+                "Names of (heavy) modules, e.g. matplotlib, that are imported within the "
+                "bodies of the functions that use them instead of at the top of the "
+                "converted modules, so they are only loaded when the tasks are run"
+            ),
+        },
+    )
+    local_import_threshold: ty.Optional[float] = attrs.field(
+        default=None,
+        metadata={
+            "help": (
+                "Import time (s), measured once per top-level package, above which "
+                "modules are imported within the bodies of the functions that use them "
+                "as per 'local_import_modules'"
+            ),
+        },
+    )
     copy_packages: ty.List[str] = attrs.field(
         factory=list,
         metadata={
@@ -308,10 +378,46 @@ class PackageConverter:
             )
         return all_translations
 
+    @property
+    def shared_callables_module(self) -> str:
+        """The module that helpers shared between the callables of the interfaces in
+        the package are written to"""
+        return (
+            self.name + (".auto" if self.interface_only else "") + "._shared_callables"
+        )
+
+    @property
+    def lazy_spec_module(self) -> str:
+        """The module that the descriptor used to lazily construct task specs is
+        written to"""
+        return self.name + (".auto" if self.interface_only else "") + "._lazy_spec"
+
     @property
     def all_omit_modules(self) -> ty.List[str]:
         return self.omit_modules + ["nipype.interfaces.utility"]
 
+    def keep_import_local(self, stmt: ImportStatement) -> bool:
+        """Whether an import statement should be moved into the bodies of the functions
+        that use it, as per `local_import_modules` and `local_import_threshold`"""
+        if stmt.is_relative or stmt.conditional:
+            return False
+        module_name = stmt.translation if stmt.translation else stmt.module_name
+        if module_name.split(".")[0] in (
+            self.name.split(".")[0],
+            self.nipype_name.split(".")[0],
+        ):
+            return False
+        if any(
+            module_name == m or module_name.startswith(m + ".")
+            for m in self.local_import_modules
+        ):
+            return True
+        if self.local_import_threshold is None:
+            return False
+        return measure_import_time(module_name.split(".")[0]) > (
+            self.local_import_threshold
+        )
+
     @property
     def all_explicit(self):
         return (
@@ -344,10 +450,45 @@ class PackageConverter:
             all_defaults[name] = defaults
         return all_defaults
 
-    def write(self, package_root: Path, to_include: ty.List[str] = None):
-        """Writes the package to the specified package root"""
+    def write(
+        self,
+        package_root: Path,
+        to_include: ty.List[str] = None,
+        memory_profile: ty.Optional[MemoryProfile] = None,
+        shard: ty.Optional[ty.Tuple[int, int]] = None,
+    ):
+        """Writes the package to the specified package root
+
+        The state derived by each converter is released once it has been written (and
+        is no longer referenced by any other converter) to limit the peak memory usage
+        of large conversions
+
+        Parameters
+        ----------
+        package_root : Path
+            the root directory of the package repository to write the package to
+        to_include : list[str], optional
+            the addresses of the interfaces, workflows and other objects to include,
+            by default all interfaces and workflows. If any interfaces or workflows are
+            selected, only they and the nested workflows, interfaces, helper functions
+            and classes they depend on (transitively) are converted
+        memory_profile : MemoryProfile, optional
+            if provided, the memory used by each stage of the conversion is recorded
+            in it
+        shard : tuple[int, int], optional
+            the (zero-based) index of the shard to write and the total number of
+            shards. The output modules of the interfaces and workflows to include are
+            partitioned between the shards deterministically (round-robin in sorted
+            order), and instead of writing the intra-package modules, post-release file
+            and copied packages, a manifest is written for `merge_shards` to combine
+            with those of the other shards. Note that the nested workflows, functions
+            and classes that the included converters depend on are written by every
+            shard that references them, so the same module can be written by several
+            shards
+        """
 
-        mod_dir = self.to_fspath(package_root, self.name)
+        def stage(name):
+            return memory_profile.stage(name) if memory_profile else nullcontext()
 
         already_converted = set()
         intra_pkg_modules = defaultdict(set)
@@ -371,7 +512,10 @@ class PackageConverter:
                         raise ValueError(
                             f"Could not import {mod_name} to include {address}"
                         )
-        if not interfaces_to_include and not workflows_to_include:
+        # Whether only the dependency closure of the selected interfaces and workflows
+        # is to be converted, rather than all of them and all helpers
+        closure_only = bool(interfaces_to_include or workflows_to_include)
+        if not closure_only:
             if to_include:
                 logger.info(
                     "No interfaces or workflows were explicitly included, assuming all "
@@ -380,13 +524,30 @@ class PackageConverter:
             interfaces_to_include = list(self.interfaces.values())
             workflows_to_include = list(self.workflows.values())
 
+        if shard is not None:
+            shard_index, n_shards = shard
+            output_modules = sorted(
+                set(c.output_module for c in interfaces_to_include)
+                | set(w.output_module for w in workflows_to_include)
+            )
+            shard_modules = set(output_modules[shard_index::n_shards])
+            interfaces_to_include = [
+                c for c in interfaces_to_include if c.output_module in shard_modules
+            ]
+            workflows_to_include = [
+                w for w in workflows_to_include if w.output_module in shard_modules
+            ]
+
         nipype_ports = []
 
-        for workflow in tqdm(workflows_to_include, "parsing workflow statements"):
-            workflow.prepare()
+        with stage("parsing workflows"):
+            for workflow in tqdm(workflows_to_include, "parsing workflow statements"):
+                workflow.prepare()
 
-        for workflow in tqdm(workflows_to_include, "processing workflow connections"):
-            workflow.prepare_connections()
+            for workflow in tqdm(
+                workflows_to_include, "processing workflow connections"
+            ):
+                workflow.prepare_connections()
 
         def collect_intra_pkg_objects(used: UsedSymbols, port_nipype: bool = True):
             for _, klass in used.intra_pkg_classes:
@@ -399,58 +560,116 @@ class PackageConverter:
                             f"Cannot port {address} as it is referenced from another "
                             "nipype interface to be ported"
                         )
-                elif full_address(klass) not in self.interfaces:
+                elif address not in self.interfaces:
                     intra_pkg_modules[klass.__module__].add(klass)
+                elif address not in [i.full_address for i in interfaces_to_include]:
+                    interfaces_to_include.append(self.interfaces[address])
             for _, func in used.intra_pkg_funcs:
                 if full_address(func) not in list(self.workflows):
                     intra_pkg_modules[func.__module__].add(func)
             for const_mod_address, _, const_name in used.intra_pkg_constants:
                 intra_pkg_modules[const_mod_address].add(const_name)
 
-        for conv in list(self.functions.values()) + list(self.classes.values()):
-            intra_pkg_modules[conv.nipype_module_name].add(conv.nipype_object)
-            collect_intra_pkg_objects(conv.used_symbols)
-
-        for converter in tqdm(
-            workflows_to_include, "converting workflows from Nipype to Pydra syntax"
-        ):
-            all_used = converter.write(
-                package_root,
-                already_converted=already_converted,
-            )
-            class_addrs = [full_address(c) for _, c in all_used.intra_pkg_classes]
-            included_addrs = [c.full_address for c in interfaces_to_include]
-            interfaces_to_include.extend(
-                self.interfaces[a]
-                for a in class_addrs
-                if a in self.interfaces and a not in included_addrs
-            )
+        helpers = list(self.functions.values()) + list(self.classes.values())
+
+        def collect_helpers(converters):
+            for conv in converters:
+                intra_pkg_modules[conv.nipype_module_name].add(conv.nipype_object)
+                collect_intra_pkg_objects(conv.used_symbols)
+                conv.release()
+
+        with stage("collecting helpers"):
+            if not closure_only:
+                collect_helpers(helpers)
+                helpers = []
+
+        with stage("converting workflows"):
+            for converter in tqdm(
+                workflows_to_include, "converting workflows from Nipype to Pydra syntax"
+            ):
+                all_used = converter.write(
+                    package_root,
+                    already_converted=already_converted,
+                )
+                class_addrs = [full_address(c) for _, c in all_used.intra_pkg_classes]
+                included_addrs = [c.full_address for c in interfaces_to_include]
+                interfaces_to_include.extend(
+                    self.interfaces[a]
+                    for a in class_addrs
+                    if a in self.interfaces and a not in included_addrs
+                )
 
-            collect_intra_pkg_objects(all_used)
+                collect_intra_pkg_objects(all_used)
+
+            # Workflows are only released once they have all been written, as the
+            # conversion of a workflow references the state of the workflows it nests
+            for workflow in self.workflows.values():
+                workflow.release()
+
+        with stage("converting interfaces"):
+            n_converted = 0
+            while True:
+                # Interfaces referenced by those being converted are appended to
+                # `interfaces_to_include` during the pass, and are converted in the next
+                to_convert = interfaces_to_include[n_converted:]
+                for converter in tqdm(
+                    to_convert,
+                    "Converting interfaces from Nipype to Pydra syntax",
+                ):
+                    converter.write(
+                        package_root,
+                        already_converted=already_converted,
+                    )
+                    collect_intra_pkg_objects(converter.used_symbols)
+                    converter.release()
+                n_converted += len(to_convert)
+                # When only converting the dependency closure, add the helpers that are
+                # referenced by the objects converted so far, which can in turn
+                # reference further helpers and interfaces
+                referenced = [
+                    h
+                    for h in helpers
+                    if h.nipype_object
+                    in intra_pkg_modules.get(h.nipype_module_name, ())
+                ]
+                if not referenced and n_converted == len(interfaces_to_include):
+                    break
+                helpers = [h for h in helpers if all(h is not r for r in referenced)]
+                collect_helpers(referenced)
+
+        with stage("porting nipype interfaces"):
+            for converter in tqdm(
+                nipype_ports, "Porting interfaces from the core nipype package"
+            ):
+                converter.write(
+                    package_root,
+                    already_converted=already_converted,
+                )
+                collect_intra_pkg_objects(converter.used_symbols, port_nipype=False)
+                converter.release()
 
-        for converter in tqdm(
-            interfaces_to_include,
-            "Converting interfaces from Nipype to Pydra syntax",
-        ):
-            converter.write(
-                package_root,
-                already_converted=already_converted,
-            )
-            collect_intra_pkg_objects(converter.used_symbols)
+        if shard is not None:
+            self.write_shard_manifest(package_root, intra_pkg_modules)
+        else:
+            # Write any additional functions in other modules in the package
+            with stage("writing intra-package modules"):
+                self.write_intra_pkg_modules(package_root, intra_pkg_modules)
+            self.write_package_files(package_root)
 
-        for converter in tqdm(
-            nipype_ports, "Porting interfaces from the core nipype package"
-        ):
-            converter.write(
-                package_root,
-                already_converted=already_converted,
-            )
-            collect_intra_pkg_objects(converter.used_symbols, port_nipype=False)
+        # The nipype port converters are rebuilt from their specs if required again
+        release_cached_properties(self, ["nipype_port_converters"])
+        self.parse_cache.save()
 
-        # Write any additional functions in other modules in the package
-        self.write_intra_pkg_modules(package_root, intra_pkg_modules)
+    def write_package_files(self, package_root: Path):
+        """Writes the post-release file and copies the packages that are to be copied
+        verbatim to the package root
 
-        post_release_dir = mod_dir
+        Parameters
+        ----------
+        package_root : Path
+            the root directory of the package repository
+        """
+        post_release_dir = self.to_fspath(package_root, self.name)
         if self.interface_only:
             post_release_dir /= "auto"
         self.write_post_release_file(post_release_dir / "_post_release.py")
@@ -470,6 +689,233 @@ class PackageConverter:
                     output_pkg_fspath,
                 )
 
+    SHARD_MANIFEST = "shard-manifest.json"
+
+    def write_shard_manifest(
+        self, shard_root: Path, intra_pkg_modules: ty.Dict[str, ty.Set[ty.Any]]
+    ):
+        """Writes the manifest of a shard, which records the objects to be written to the
+        intra-package modules so they can be written once all shards are merged
+
+        Parameters
+        ----------
+        shard_root : Path
+            the root directory the shard was written to
+        intra_pkg_modules : dict[str, set]
+            the functions, classes and constant names to write to each intra-package
+            module
+        """
+        manifest = {}
+        for mod_name, objs in sorted(intra_pkg_modules.items()):
+            if objs:
+                manifest[mod_name] = {
+                    "objects": sorted(
+                        o.__name__ for o in objs if not isinstance(o, str)
+                    ),
+                    "names": sorted(o for o in objs if isinstance(o, str)),
+                }
+        with open(shard_root / self.SHARD_MANIFEST, "w") as f:
+            json.dump({"intra_pkg_modules": manifest}, f, indent=2)
+
+    def merge_shards(self, package_root: Path, shard_roots: ty.Sequence[Path]):
+        """Merges the shards written by `write` with the `shard` argument into the
+        package root, then writes the intra-package modules referenced by any of them
+        along with the post-release file and copied packages
+
+        Files that are only written by one shard (or identically by several) are
+        copied over as is. Modules written differently by multiple shards (e.g. ones
+        that a dependency pulled into several shards is written to) are merged by
+        collating their import statements with `ImportStatement.collate` and
+        appending the top-level definitions that aren't already present, in shard
+        order (see `_missing_blocks`). Existing files in the package root (e.g. the
+        package's __init__.py) are merged in the same way
+
+        Parameters
+        ----------
+        package_root : Path
+            the root directory of the package repository to write the package to
+        shard_roots : Sequence[Path]
+            the root directories the shards were written to, in shard order
+        """
+        intra_pkg_modules = defaultdict(set)
+        for shard_root in shard_roots:
+            manifest_fspath = shard_root / self.SHARD_MANIFEST
+            if not manifest_fspath.exists():
+                raise ValueError(
+                    f"{shard_root} does not contain a shard manifest, was it written "
+                    "with the 'shard' argument?"
+                )
+            for src_fspath in sorted(shard_root.rglob("*")):
+                rel_path = src_fspath.relative_to(shard_root)
+                if (
+                    src_fspath.is_dir()
+                    or src_fspath == manifest_fspath
+                    or "__pycache__" in rel_path.parts
+                ):
+                    continue
+                dest_fspath = package_root / rel_path
+                if not dest_fspath.exists():
+                    dest_fspath.parent.mkdir(parents=True, exist_ok=True)
+                    shutil.copyfile(src_fspath, dest_fspath)
+                elif dest_fspath.read_bytes() == src_fspath.read_bytes():
+                    continue
+                elif src_fspath.suffix != ".py":
+                    logger.warning(
+                        "Not merging %s into %s as they differ and it isn't a Python "
+                        "module",
+                        src_fspath,
+                        dest_fspath,
+                    )
+                elif src_fspath.name == "__init__.py":
+                    package_name = ".".join(rel_path.parts[:-1])
+                    code_str, import_stmts = self._read_init(dest_fspath, package_name)
+                    src_code_str, src_imports = self._read_init(
+                        src_fspath, package_name
+                    )
+                    dest_fspath.write_text(
+                        self._render_init(
+                            code_str
+                            + self._missing_blocks(src_code_str, code_str, dest_fspath),
+                            import_stmts + src_imports,
+                            package_name,
+                            import_find_replace=self.import_find_replace,
+                            lazy=self.lazy_init_imports,
+                        )
+                    )
+                else:
+                    self._merge_module(
+                        src_fspath,
+                        dest_fspath,
+                        ".".join(rel_path.with_suffix("").parts),
+                    )
+            with open(manifest_fspath) as f:
+                manifest = json.load(f)
+            for mod_name, objs in manifest["intra_pkg_modules"].items():
+                mod = import_module(mod_name)
+                intra_pkg_modules[mod_name].update(
+                    getattr(mod, n) for n in objs["objects"]
+                )
+                intra_pkg_modules[mod_name].update(objs["names"])
+
+        self.write_intra_pkg_modules(package_root, intra_pkg_modules)
+        self.write_package_files(package_root)
+
+    def _merge_module(self, src_fspath: Path, dest_fspath: Path, module_name: str):
+        """Merges a module written by one shard into the same module written by
+        another"""
+        import_strs = []
+        code_strs = []
+        for fspath in (dest_fspath, src_fspath):
+            imports = []
+            code_str = ""
+            for stmt in split_source_into_statements(fspath.read_text()):
+                if not stmt.startswith(" ") and ImportStatement.matches(stmt):
+                    imports.append(stmt)
+                else:
+                    code_str += "\n" + stmt
+            import_strs.extend(imports)
+            code_strs.append(code_str)
+        code_str = code_strs[0] + self._missing_blocks(
+            code_strs[1], code_strs[0], dest_fspath
+        )
+        imports = ImportStatement.collate(
+            parse_imports(import_strs, relative_to=module_name)
+        )
+        import_str = "\n".join(str(i) for i in imports if i)
+        try:
+            code_str = black.format_file_contents(
+                import_str + "\n\n" + code_str, fast=False, mode=black.FileMode()
+            )
+        except black.report.NothingChanged:
+            code_str = import_str + "\n\n" + code_str
+        dest_fspath.write_text(code_str)
+
+    @classmethod
+    def _missing_blocks(
+        cls, code_str: str, existing_code: str, dest_fspath: Path
+    ) -> str:
+        """Returns the top-level blocks of code (e.g. function and class definitions
+        along with their decorators and preceding comments) in `code_str` that aren't
+        already present in `existing_code`.
+
+        Blocks that define top-level symbols (functions, classes and assigned names)
+        are matched to those in the existing code by the names they define, so
+        differently formatted versions of the same definition aren't duplicated. Other
+        blocks are matched by their text
+
+        Raises
+        ------
+        RuntimeError
+            if a symbol is defined differently in the two versions of the module
+        """
+        existing_defs = {}
+        for block in cls._top_level_blocks(existing_code):
+            names, dumped = cls._block_definitions(block)
+            existing_defs.update((n, dumped) for n in names)
+        missing = ""
+        for block in cls._top_level_blocks(code_str):
+            names, dumped = cls._block_definitions(block)
+            if not names:
+                if block.strip() not in existing_code:
+                    missing += "\n" + block
+                continue
+            conflicting = sorted(
+                n for n in names if n in existing_defs and existing_defs[n] != dumped
+            )
+            if conflicting:
+                raise RuntimeError(
+                    f"Cannot merge the shards of {dest_fspath} as they define "
+                    f"{conflicting} differently"
+                )
+            if any(n not in existing_defs for n in names):
+                missing += "\n" + block
+                existing_defs.update((n, dumped) for n in names)
+        return missing
+
+    @classmethod
+    def _top_level_blocks(cls, code_str: str) -> ty.List[str]:
+        """Splits code into its top-level blocks, i.e. the top-level statements along
+        with their decorators, preceding comments and trailing clauses"""
+        blocks = []
+        for stmt in split_source_into_statements(code_str):
+            if (
+                not blocks
+                or (stmt and not stmt.startswith((" ", "\t", ")", "]", "}")))
+                and not cls.CONTINUATION_CLAUSE_RE.match(stmt)
+                and not blocks[-1].rstrip().split("\n")[-1].startswith(("@", "#"))
+            ):
+                blocks.append(stmt)
+            else:
+                blocks[-1] += "\n" + stmt
+        return [b for b in blocks if b.strip()]
+
+    # Clauses that continue the compound statement of the preceding top-level block
+    CONTINUATION_CLAUSE_RE = re.compile(r"(else|elif|except|finally)\b")
+
+    @classmethod
+    def _block_definitions(cls, block: str) -> ty.Tuple[ty.List[str], ty.Optional[str]]:
+        """Returns the names of the top-level symbols defined by a block of code, along
+        with a dump of its syntax tree to compare it to other definitions of them
+        regardless of formatting and comments"""
+        try:
+            tree = ast.parse(block)
+        except SyntaxError:
+            return [], None
+        names = []
+        for node in tree.body:
+            if isinstance(node, (ast.FunctionDef, ast.AsyncFunctionDef, ast.ClassDef)):
+                names.append(node.name)
+            elif isinstance(node, ast.Assign):
+                names.extend(
+                    n.id
+                    for t in node.targets
+                    for n in ast.walk(t)
+                    if isinstance(n, ast.Name) and isinstance(n.ctx, ast.Store)
+                )
+            elif isinstance(node, ast.AnnAssign) and isinstance(node.target, ast.Name):
+                names.append(node.target.id)
+        return names, ast.dump(tree) if names else None
+
     def translate_submodule(
         self, nipype_module_name: str, sub_pkg: ty.Optional[str] = None
     ) -> str:
@@ -578,6 +1024,7 @@ class PackageConverter:
                 depth=self.init_depth,
                 auto_import_depth=self.auto_import_init_depth,
                 import_find_replace=self.import_find_replace,
+                lazy=self.lazy_init_imports,
             )
 
     def nipype2pydra_module_name(self, nipype_name: str) -> str:
@@ -694,10 +1141,8 @@ post_release = "{post_release}"
                 "not exist, cannot create Nipype port converters"
             )
         converters = {}
-        spec_files = list(self.NIPYPE_PORT_CONVERTER_SPEC_DIR.glob("*.yaml"))
-        for spec_file in spec_files:
-            with open(spec_file, "r") as f:
-                spec = yaml.safe_load(f)
+        for spec_file, spec in load_specs(self.NIPYPE_PORT_CONVERTER_SPEC_DIR):
+            spec = deepcopy(spec)
             callables_file = spec_file.parent / (spec_file.stem + "_callables.py")
             if self.interface_only:
                 mod_base = [self.name, "auto", "nipype_ports"]
@@ -721,10 +1166,74 @@ post_release = "{post_release}"
 
         return converters
 
+    @cached_property
+    def parse_cache(self) -> "nipype2pydra.workflow.WorkflowParseCache":
+        """The parsed sources of the workflows in the package, which can be replaced by
+        a cache shared with other packages (e.g. of a batch) and/or persisted between
+        runs"""
+        return nipype2pydra.workflow.WorkflowParseCache()
+
     NIPYPE_PORT_CONVERTER_SPEC_DIR = (
         Path(__file__).parent / "interface" / "nipype-ports"
     )
 
+    @classmethod
+    def from_specs_dir(
+        cls, specs_dir: Path
+    ) -> ty.Tuple["PackageConverter", ty.List[str]]:
+        """Loads a package converter, along with the converters for all of its
+        interfaces, workflows, functions and classes, from a directory of specs (as
+        generated by pkg-gen)
+
+        Parameters
+        ----------
+        specs_dir : Path
+            the directory containing the 'package.yaml' spec and the 'interfaces',
+            'workflows', 'functions' and 'classes' sub-directories
+
+        Returns
+        -------
+        converter : PackageConverter
+            the package converter
+        to_include : list[str]
+            the 'to_include' value of the package spec, an empty list if not provided
+        """
+        with open(specs_dir / "package.yaml", "r") as f:
+            package_spec = yaml.safe_load(f)
+        to_include = package_spec.pop("to_include", None) or []
+
+        workflow_yamls = list((specs_dir / "workflows").glob("*.yaml"))
+        interface_yamls = list((specs_dir / "interfaces").glob("*.yaml"))
+        function_yamls = list((specs_dir / "functions").glob("*.yaml"))
+        class_yamls = list((specs_dir / "classes").glob("*.yaml"))
+
+        if package_spec.get("interface_only", None) is None:
+            package_spec["interface_only"] = not workflow_yamls
+        converter = cls(**package_spec)
+
+        for fspath in interface_yamls:
+            with open(fspath, "r") as f:
+                spec = yaml.safe_load(f)
+            converter.add_interface_from_spec(
+                spec=spec,
+                callables_file=(
+                    fspath.parent / (fspath.name[: -len(".yaml")] + "_callables.py")
+                ),
+            )
+        for fspath in workflow_yamls:
+            with open(fspath, "r") as f:
+                spec = yaml.safe_load(f)
+            converter.add_workflow_from_spec(spec)
+        for fspath in function_yamls:
+            with open(fspath, "r") as f:
+                spec = yaml.safe_load(f)
+            converter.add_function_from_spec(spec)
+        for fspath in class_yamls:
+            with open(fspath, "r") as f:
+                spec = yaml.safe_load(f)
+            converter.add_class_from_spec(spec)
+        return converter, to_include
+
     def add_interface_from_spec(
         self, spec: ty.Dict[str, ty.Any], callables_file: Path
     ) -> interface.BaseInterfaceConverter:
@@ -967,6 +1476,13 @@ post_release = "{post_release}"
 
         if module_fspath.name != "__init__.py":
             imports = UsedSymbols.filter_imports(imports, code_str)
+            if self.local_import_modules or self.local_import_threshold is not None:
+                code_str, imports = localise_imports(
+                    code_str,
+                    imports,
+                    self.keep_import_local,
+                    find_replace=self.import_find_replace,
+                )
 
         # Strip out inlined imports
         for inlined_symbol in inlined_symbols:
@@ -998,6 +1514,86 @@ post_release = "{post_release}"
 
         return module_fspath
 
+    def write_shared_callables(
+        self,
+        package_root: Path,
+        helpers: ty.Iterable[ty.Union[ty.Callable, type]],
+    ):
+        """Writes helpers that are shared between the callables of the interfaces in the
+        package, along with the helpers, constants and imports they reference, to the
+        shared callables module, skipping those that have already been written to it.
+        Constants with the same name as one already written but a different value raise
+        an error instead of silently clashing
+
+        Parameters
+        ----------
+        package_root : Path
+            the root directory of the package to write the module to
+        helpers : iterable[callable or type]
+            the shared helper functions and classes
+        """
+        module_fspath = self.to_fspath(
+            package_root, self.shared_callables_module
+        ).with_suffix(".py")
+        existing_code = module_fspath.read_text() if module_fspath.exists() else ""
+
+        def already_written(name: str) -> bool:
+            return bool(
+                re.search(
+                    r"^(def|class) " + name + r"\b|^" + name + " = ",
+                    existing_code,
+                    flags=re.MULTILINE,
+                )
+            )
+
+        def const_written(name: str, value: str) -> bool:
+            """Whether the constant has already been written, raising an error if a
+            different value has been written under the same name"""
+            if not already_written(name):
+                return False
+            written = [
+                n.value
+                for n in ast.parse(existing_code).body
+                if isinstance(n, ast.Assign)
+                and any(isinstance(t, ast.Name) and t.id == name for t in n.targets)
+            ]
+            value_ast = ast.parse(value, mode="eval").body
+            if written and ast.dump(written[-1]) != ast.dump(value_ast):
+                raise RuntimeError(
+                    f"Cannot write constant '{name} = {value}' to the shared callables "
+                    f"module {self.shared_callables_module}, as a different value, "
+                    f"{ast.unparse(written[-1])}, has already been written under the "
+                    "same name. Regenerate the shared callables modules of the specs "
+                    "with pkg-gen so the constants are named by the hash of their values"
+                )
+            return True
+
+        by_module = defaultdict(list)
+        for helper in helpers:
+            by_module[helper.__module__].append(helper.__name__)
+        for mod_name, names in sorted(by_module.items()):
+            sources = interface.CallableSources.find(import_module(mod_name), names)
+            sources = attrs.evolve(
+                sources,
+                functions=[
+                    f for f in sources.functions if not already_written(f.__name__)
+                ],
+                classes=[c for c in sources.classes if not already_written(c.__name__)],
+                constants=[c for c in sources.constants if not const_written(*c)],
+            )
+            if not (sources.functions or sources.classes or sources.constants):
+                continue
+            self.write_to_module(
+                package_root=package_root,
+                module_name=self.shared_callables_module,
+                used=UsedSymbols(
+                    module_name=self.shared_callables_module,
+                    imports=set(sources.imports),
+                ),
+                converted_code=sources.code,
+            )
+            existing_code = module_fspath.read_text()
+
     def write_pkg_inits(
         self,
         package_root: Path,
@@ -1006,6 +1602,7 @@ post_release = "{post_release}"
         depth: int,
         auto_import_depth: int,
         import_find_replace: ty.Optional[ty.List[str]] = None,
+        lazy: bool = False,
     ):
         """Writes __init__.py files to all directories in the given package path
 
@@ -1022,6 +1619,11 @@ post_release = "{post_release}"
             the depth below which the init files should contain cascading imports from
         names : List[str]
             The names to import in the __init__.py files
+        import_find_replace : list[tuple[str, str]], optional
+            find-replace pairs to apply to the import statements of the __init__.py files
+        lazy : bool, optional
+            whether the names imported from sub-modules are only loaded when they are
+            first accessed (PEP 562) instead of when the package is imported
         """
         # Write base init path that imports __version__ from the auto-generated _version
         # file
@@ -1034,72 +1636,261 @@ post_release = "{post_release}"
                 # Write empty __init__.py if it doesn't exist
                 init_fspath.touch()
                 continue
-            code_str = ""
-            import_stmts = []
-            if init_fspath.exists():
-                with open(init_fspath, "r") as f:
-                    existing_code = f.read()
-                stmts = split_source_into_statements(existing_code)
-                for stmt in stmts:
-                    if ImportStatement.matches(stmt):
-                        import_stmt = parse_imports(stmt, relative_to=parent_mod)[0]
-                        if import_stmt.conditional:
-                            code_str += f"\n{stmt}"
-                        else:
-                            import_stmts.append(import_stmt)
-                    else:
-                        code_str += f"\n{stmt}"
+            code_str, import_stmts = self._read_init(init_fspath, parent_mod)
             import_stmts.append(
                 parse_imports(
                     f"from .{part} import ({', '.join(names)})", relative_to=parent_mod
                 )[0]
             )
-            import_stmts = sorted(ImportStatement.collate(import_stmts))
-            import_str = "\n".join(str(i) for i in import_stmts)
+            code_str = self._render_init(
+                code_str,
+                import_stmts,
+                parent_mod,
+                import_find_replace=import_find_replace,
+                lazy=lazy,
+            )
+            with open(init_fspath, "w") as f:
+                f.write(code_str)
 
-            # Format import str to make the find-replace target consistent
-            try:
-                import_str = black.format_file_contents(
-                    import_str, fast=False, mode=black.FileMode()
-                )
-            except black.report.NothingChanged:
-                pass
-            except Exception as e:
-                # Write to file for debugging
-                debug_file = "~/unparsable-nipype2pydra-output.py"
-                with open(Path(debug_file).expanduser(), "w") as f:
-                    f.write(code_str)
-                raise RuntimeError(
-                    f"Black could not parse generated code (written to {debug_file}): "
-                    f"{e}\n\n{code_str}"
-                )
+    def _read_init(
+        self, init_fspath: Path, package_name: str
+    ) -> ty.Tuple[str, ty.List[ImportStatement]]:
+        """Reads an existing __init__.py file (if present) into its import statements,
+        including those that are imported lazily, and the remaining code
 
-            # Rerun find-replace to allow us to catch any imports we want to alter
-            for find, replace in import_find_replace or []:
-                import_str = re.sub(
-                    find, replace, import_str, flags=re.MULTILINE | re.DOTALL
+        Parameters
+        ----------
+        init_fspath : Path
+            the path to the __init__.py file
+        package_name : str
+            the name of the package the __init__.py file belongs to
+
+        Returns
+        -------
+        code_str : str
+            the code of the file other than its (non-conditional) imports
+        import_stmts : list[ImportStatement]
+            the import statements of the file
+        """
+        code_str = ""
+        import_stmts = []
+        if init_fspath.exists():
+            with open(init_fspath, "r") as f:
+                existing_code = f.read()
+            lazy_match = self.LAZY_INIT_BLOCK_RE.search(existing_code)
+            if lazy_match:
+                # Recover the lazily imported names from the type-checking block
+                existing_code = (
+                    existing_code[: lazy_match.start()]
+                    + existing_code[lazy_match.end() :]
                 )
+                for stmt in split_source_into_statements(
+                    inspect.cleandoc(lazy_match.group(1))
+                ):
+                    if ImportStatement.matches(stmt):
+                        import_stmts.extend(
+                            parse_imports(stmt, relative_to=package_name)
+                        )
+            stmts = split_source_into_statements(existing_code)
+            for stmt in stmts:
+                if ImportStatement.matches(stmt):
+                    import_stmt = parse_imports(stmt, relative_to=package_name)[0]
+                    if import_stmt.conditional:
+                        code_str += f"\n{stmt}"
+                    else:
+                        import_stmts.append(import_stmt)
+                else:
+                    code_str += f"\n{stmt}"
+        return code_str, import_stmts
+
+    def _render_init(
+        self,
+        code_str: str,
+        import_stmts: ty.List[ImportStatement],
+        package_name: str,
+        import_find_replace: ty.Optional[ty.List[str]] = None,
+        lazy: bool = False,
+    ) -> str:
+        """Renders the contents of an __init__.py file from its collated import
+        statements and remaining code, as read by `_read_init`"""
+        import_stmts = sorted(ImportStatement.collate(import_stmts))
+        import_str = "\n".join(str(i) for i in import_stmts)
+
+        # Format import str to make the find-replace target consistent
+        try:
+            import_str = black.format_file_contents(
+                import_str, fast=False, mode=black.FileMode()
+            )
+        except black.report.NothingChanged:
+            pass
+        except Exception as e:
+            # Write to file for debugging
+            debug_file = "~/unparsable-nipype2pydra-output.py"
+            with open(Path(debug_file).expanduser(), "w") as f:
+                f.write(code_str)
+            raise RuntimeError(
+                f"Black could not parse generated code (written to {debug_file}): "
+                f"{e}\n\n{code_str}"
+            )
 
+        # Rerun find-replace to allow us to catch any imports we want to alter
+        for find, replace in import_find_replace or []:
+            import_str = re.sub(
+                find, replace, import_str, flags=re.MULTILINE | re.DOTALL
+            )
+
+        if lazy:
+            import_str, lazy_str = self._lazy_init_imports(import_str, package_name)
+            code_str = import_str + "\n" + code_str + "\n" + lazy_str
+        else:
             code_str = import_str + "\n" + code_str
 
-            try:
-                code_str = black.format_file_contents(
-                    code_str, fast=False, mode=black.FileMode()
-                )
-            except black.report.NothingChanged:
-                pass
-            except Exception as e:
-                # Write to file for debugging
-                debug_file = "~/unparsable-nipype2pydra-output.py"
-                with open(Path(debug_file).expanduser(), "w") as f:
-                    f.write(code_str)
-                raise RuntimeError(
-                    f"Black could not parse generated code (written to {debug_file}): "
-                    f"{e}\n\n{code_str}"
+        try:
+            code_str = black.format_file_contents(
+                code_str, fast=False, mode=black.FileMode()
+            )
+        except black.report.NothingChanged:
+            pass
+        except Exception as e:
+            # Write to file for debugging
+            debug_file = "~/unparsable-nipype2pydra-output.py"
+            with open(Path(debug_file).expanduser(), "w") as f:
+                f.write(code_str)
+            raise RuntimeError(
+                f"Black could not parse generated code (written to {debug_file}): "
+                f"{e}\n\n{code_str}"
+            )
+        return code_str
+
+    def _lazy_init_imports(
+        self, import_str: str, module_name: str
+    ) -> ty.Tuple[str, str]:
+        """Splits the import statements of an __init__ file into the absolute imports,
+        which are left to be imported eagerly, and a block that loads the names imported
+        from sub-modules of the package when they are first accessed
+
+        Parameters
+        ----------
+        import_str : str
+            the import statements of the __init__ file
+        module_name : str
+            the name of the package the __init__ file belongs to
+
+        Returns
+        -------
+        eager_str : str
+            the imports that are to be imported with the package
+        lazy_str : str
+            the type-checking imports, lookup table, __getattr__ and __dir__ functions
+            of the lazily imported names
+        """
+        eager = parse_imports("import typing as ty")
+        lazy = []
+        for stmt in split_source_into_statements(import_str):
+            if not ImportStatement.matches(stmt):
+                continue
+            for import_stmt in parse_imports(stmt, relative_to=module_name):
+                if import_stmt.is_relative and not import_stmt.conditional:
+                    lazy.append(import_stmt)
+                else:
+                    eager.append(import_stmt)
+        if not lazy:
+            return import_str, ""
+        eager_str = "\n".join(str(i) for i in sorted(ImportStatement.collate(eager)))
+        type_checking = []
+        table = []
+        for import_stmt in sorted(ImportStatement.collate(lazy)):
+            type_checking.append(f"    {import_stmt}")
+            for imported in sorted(import_stmt.values()):
+                table.append(
+                    f'    "{imported.local_name}": ("{import_stmt.from_}", '
+                    f'"{imported.name}"),'
                 )
+        lazy_str = self.LAZY_INIT_TEMPLATE.format(
+            type_checking="\n".join(type_checking), table="\n".join(sorted(table))
+        )
+        return eager_str, lazy_str
 
-            with open(init_fspath, "w") as f:
-                f.write(code_str)
+    def write_lazy_spec_module(self, package_root: Path):
+        """Writes the module containing the descriptor used to lazily construct the
+        specs of the converted tasks, if it hasn't been written already
+
+        Parameters
+        ----------
+        package_root : Path
+            the root directory of the package to write the module to
+        """
+        module_fspath = self.to_fspath(package_root, self.lazy_spec_module).with_suffix(
+            ".py"
+        )
+        if not module_fspath.exists():
+            module_fspath.parent.mkdir(parents=True, exist_ok=True)
+            module_fspath.write_text(self.LAZY_SPEC_MODULE)
+
+    LAZY_SPEC_MODULE = """\"\"\"Deferred construction of the input/output specs of the converted tasks,
+so that importing a module only constructs the specs of the tasks that are used
+\"\"\"
+import typing as ty
+
+
+class LazySpec:
+    \"\"\"Class attribute that calls the function it wraps to construct a task spec
+    the first time it is accessed and returns the same spec from then on
+
+    Parameters
+    ----------
+    build : callable
+        function that takes no arguments and returns the spec
+    \"\"\"
+
+    def __init__(self, build: ty.Callable[[], ty.Any]):
+        self.build = build
+        self.spec = None
+
+    def __get__(self, instance: ty.Any, owner: type) -> ty.Any:
+        if self.spec is None:
+            self.spec = self.build()
+        return self.spec
+"""
+
+    LAZY_INIT_TEMPLATE = """
+# Names imported from sub-modules are only loaded on first access (see PEP 562).
+# This block is regenerated by nipype2pydra, so don't edit it by hand
+if ty.TYPE_CHECKING:
+{type_checking}
+
+_lazy_imports = {{
+{table}
+}}
+
+
+def __getattr__(name: str) -> ty.Any:
+    try:
+        module_name, attr_name = _lazy_imports[name]
+    except KeyError:
+        raise AttributeError(
+            f"module {{__name__!r}} has no attribute {{name!r}}"
+        ) from None
+    from importlib import import_module
+
+    value = getattr(import_module(module_name, __name__), attr_name)
+    globals()[name] = value
+    return value
+
+
+def __dir__() -> ty.List[str]:
+    return sorted(set(globals()) | set(_lazy_imports))
+
+
+# End of lazily-loaded names
+"""
+
+    LAZY_INIT_BLOCK_RE = re.compile(
+        r"^# Names imported from sub-modules are only loaded on first access.*?"
+        r"^if ty\.TYPE_CHECKING:\n(.*?)^_lazy_imports = .*?"
+        r"^# End of lazily-loaded names\n",
+        flags=re.MULTILINE | re.DOTALL,
+    )
 
     BASE_INIT_TEMPLATE = """\"\"\"
 This is a basic doctest demonstrating that the package and pydra can both be successfully
@@ -1,20 +1,25 @@
 import os
 import typing as ty
 import re
+import hashlib
 from importlib import import_module
 from copy import copy
-from collections import defaultdict
+from collections import defaultdict, Counter
 import shutil
 import string
-from pathlib import Path
+import tarfile
+import tempfile
+from pathlib import Path, PurePosixPath
 import inspect
 import attrs
 from warnings import warn
+from functools import lru_cache
 import requests
 from operator import itemgetter
 from traits.trait_type import TraitType
 import yaml
 import black.parsing
+import black.report
 import fileformats.core
 import fileformats.core.mixin
 from fileformats.generic import File, Directory
@@ -32,6 +37,7 @@ from nipype2pydra.interface import (
     OutputsConverter,
     TestGenerator,
     DocTestGenerator,
+    TraitSpecSnapshot,
 )
 from nipype2pydra.utils import (
     UsedSymbols,
@@ -41,7 +47,7 @@ from nipype2pydra.utils import (
     insert_args_in_signature,
     INBUILT_NIPYPE_TRAIT_NAMES,
 )
-from nipype2pydra.statements import parse_imports
+from nipype2pydra.statements import ImportStatement, parse_imports
 from nipype2pydra.exceptions import UnmatchedParensException
 
 
@@ -108,6 +114,7 @@ class NipypeInterface:
     ambiguous_formats: ty.List[str] = attrs.field(factory=list)
     pkg_formats: ty.Set[str] = attrs.field(factory=set)
     has_doctests: bool = False
+    source_hash: str = ""
 
     @classmethod
     def parse(
@@ -120,6 +127,7 @@ class NipypeInterface:
 
         doc_string = nipype_interface.__doc__ if nipype_interface.__doc__ else ""
         doc_string = doc_string.replace("\n", "\n# ")
+        source_hash = nipype_source_hash(nipype_interface)
         # Create a preamble at the top of the specificaiton explaining what to do
         preamble = (
             f"""# This file is used to manually specify the semi-automatic conversion of
@@ -127,6 +135,8 @@ class NipypeInterface:
 #
 # Please fill-in/edit the fields below where appropriate
 #
+# nipype-source-hash: {source_hash} (used by `pkg-gen --update`, don't edit)
+#
 # Docs
 # ----
 # {doc_string}\n"""
@@ -146,10 +156,12 @@ class NipypeInterface:
             pkg=pkg,
             base_package=base_package,
             preamble=preamble,
+            source_hash=source_hash,
         )
+        trait_spec = TraitSpecSnapshot.from_interface(nipype_interface)
         # Parse output types and descriptions
         if nipype_interface.output_spec:
-            for outpt_name, outpt in nipype_interface.output_spec().traits().items():
+            for outpt_name, outpt in trait_spec.output_traits.items():
                 if outpt_name in ("trait_added", "trait_modified"):
                     continue
                 outpt_desc = outpt.desc.replace("\n", " ") if outpt.desc else ""
@@ -173,7 +185,7 @@ class NipypeInterface:
                 else:
                     parsed.callables.append(outpt_name)
         # Parse input types, descriptions and metadata
-        for inpt_name, inpt in nipype_interface.input_spec().traits().items():
+        for inpt_name, inpt in trait_spec.input_traits.items():
             if inpt_name in ("trait_added", "trait_modified"):
                 continue
             inpt_desc = inpt.desc.replace("\n", " ") if inpt.desc else ""
@@ -328,7 +340,20 @@ class NipypeInterface:
             "tests": tests,
             "doctests": doctests,
         }
-        yaml_str = yaml.dump(spec_stub, indent=2, sort_keys=False, width=4096)
+        return self.render_yaml_spec(spec_stub)
+
+    def render_yaml_spec(self, spec: ty.Dict[str, ty.Any]) -> str:
+        """Dumps a spec to a YAML string, with the preamble and comments describing
+        the fields of the spec and the inputs and outputs of the interface
+
+        Parameters
+        ----------
+        spec : dict[str, Any]
+            the spec to dump, either a stub or a spec loaded from YAML
+        """
+        yaml_str = yaml.dump(
+            self._prefix_field_names(spec), indent=2, sort_keys=False, width=4096
+        )
         # Strip explicit nulls from dumped YAML
         yaml_str = re.sub(r": null$", ":", yaml_str, flags=re.MULTILINE)
         # Inject comments into dumped YAML
@@ -369,14 +394,54 @@ class NipypeInterface:
             yaml_str = yaml_str.replace("##PLACEHOLDER##", desc)
         return self.preamble + yaml_str
 
-    def generate_callables(self, nipype_interface) -> str:
+    def merge_yaml_spec(
+        self, existing: str, base: ty.Optional[str] = None
+    ) -> ty.Tuple[str, ty.List[str]]:
+        """Three-way merges the spec generated for the interface into an existing spec,
+        which may have been edited by hand, so that changes to the interface are picked
+        up without losing manual edits. Comments added by hand are not preserved.
+
+        Parameters
+        ----------
+        existing : str
+            the YAML of the existing spec
+        base : str, optional
+            the YAML of the stub the existing spec was created from. If not provided,
+            all values that differ between the existing spec and the new stub are
+            treated as conflicts
+
+        Returns
+        -------
+        merged : str
+            the YAML of the merged spec
+        conflicts : list[str]
+            the paths of the values that were changed both by hand and in the new stub,
+            for which the values in the existing spec are kept
+        """
+        merged, conflicts = three_way_merge(
+            yaml.safe_load(base) if base is not None else MISSING,
+            yaml.safe_load(existing),
+            yaml.safe_load(self.generate_yaml_spec()),
+        )
+        return self.render_yaml_spec(merged), conflicts
+
+    def generate_callables(
+        self,
+        nipype_interface,
+        shared_callables: ty.Optional["SharedCallables"] = None,
+    ) -> str:
         callables_str = (
             f'"""Module to put any functions that are referred to in the "callables"'
             f' section of {self.name}.yaml"""\n\n'
         )
         # Convert the "_gen_filename" method into a function with any referenced
         # methods, functions and constants included in the module
-        funcs, classes, imports, consts = get_callable_sources(nipype_interface)
+        if shared_callables is not None:
+            funcs, classes, imports, consts = shared_callables.sources_for(
+                nipype_interface
+            )
+        else:
+            funcs, classes, imports, consts = get_callable_sources(nipype_interface)
 
         # Write imports to file
         if any(
@@ -390,7 +455,8 @@ class NipypeInterface:
 
         # Create separate default function for each input field with genfile, which
         # reference the magic "_gen_filename" method
-        for inpt_name, inpt in sorted(nipype_interface.input_spec().traits().items()):
+        trait_spec = TraitSpecSnapshot.from_interface(nipype_interface)
+        for inpt_name, inpt in sorted(trait_spec.input_traits.items()):
             if inpt.genfile:
                 callables_str += (
                     f"def {inpt_name}_default(inputs):\n"
@@ -399,7 +465,7 @@ class NipypeInterface:
 
         # Create separate function for each output field in the "callables" section
         if nipype_interface.output_spec:
-            for output_name in sorted(nipype_interface.output_spec().traits().keys()):
+            for output_name in sorted(trait_spec.output_names):
                 if output_name not in INBUILT_NIPYPE_TRAIT_NAMES:
                     callables_str += (
                         f"def {output_name}_callable(output_dir, inputs, stdout, stderr):\n"
@@ -457,16 +523,7 @@ class NipypeInterface:
                         fspath = re.search(r"""['"]([^'"]*)['"]""", fspath).group(1)
                     except AttributeError:
                         return File
-                    possible_formats = []
-                    for frmt in fileformats.core.FileSet.all_formats:
-                        if (
-                            not frmt.ext
-                            or None in frmt.alternate_exts
-                            or "-" in frmt.namespace
-                        ):
-                            continue
-                        if frmt.matching_exts(fspath):
-                            possible_formats.append(frmt)
+                    possible_formats = FormatExtensionIndex.get().candidates(fspath)
                     if not possible_formats:
                         if fspath.endswith(".dcm"):
                             return Dicom
@@ -604,46 +661,647 @@ class NipypeInterface:
             dct[field_name] = val
         return dct
 
+    @classmethod
+    def _prefix_field_names(cls, spec: ty.Dict[str, ty.Any]) -> ty.Dict[str, ty.Any]:
+        """Prefixes the names of fields loaded from a YAML spec with the category they
+        belong to, as in the stubs generated by `_fields_stub`, so comments can be
+        inserted after them"""
+
+        def prefix(name, category_class, dct):
+            if not isinstance(dct, dict):
+                return dct
+            field_names = attrs.fields_dict(category_class)
+            return {
+                (f"{name}.{k}" if k in field_names else k): v for k, v in dct.items()
+            }
 
-def download_tasks_template(output_path: Path):
-    """Downloads the latest pydra-template to the output path"""
-    output_path.parent.mkdir(parents=True, exist_ok=True)
+        spec = dict(spec)
+        for category, name, category_class in [
+            ("inputs", "inputs", InputsConverter),
+            ("outputs", "outputs", OutputsConverter),
+            ("tests", "test", TestGenerator),
+            ("doctests", "doctest", DocTestGenerator),
+        ]:
+            if category not in spec:
+                continue
+            if isinstance(spec[category], list):
+                spec[category] = [
+                    prefix(name, category_class, d) for d in spec[category]
+                ]
+            else:
+                spec[category] = prefix(name, category_class, spec[category])
+        return spec
 
-    release_url = (
-        "https://api.github.com/repos/nipype/pydra-tasks-template/releases/latest"
+
+@attrs.define
+class FormatExtensionIndex:
+    """Index of the file formats registered with fileformats (excluding those without
+    extensions, with optional extensions, or in extras namespaces) by their primary and
+    alternate extensions, e.g. '.nii.gz', '.BRIK' or '.HEAD', so the formats that match
+    a path can be found by looking up its suffixes instead of checking every format
+
+    Parameters
+    ----------
+    by_ext : dict[str, list[type]]
+        the formats matching each extension that starts with a '.'
+    other_exts : list[tuple[str, type]]
+        extensions that don't start with a '.' (and therefore can't be looked up by
+        suffix) and the format they belong to
+    """
+
+    by_ext: ty.Dict[str, ty.List[type]] = attrs.field(factory=dict)
+    other_exts: ty.List[ty.Tuple[str, type]] = attrs.field(factory=list)
+
+    _cache = {}
+
+    @classmethod
+    def build(cls, formats: ty.Iterable[type]) -> "FormatExtensionIndex":
+        index = cls()
+        for frmt in formats:
+            if not frmt.ext or None in frmt.alternate_exts or "-" in frmt.namespace:
+                continue
+            for ext in dict.fromkeys(frmt.possible_exts):
+                if ext.startswith("."):
+                    index.by_ext.setdefault(ext, []).append(frmt)
+                else:
+                    index.other_exts.append((ext, frmt))
+        return index
+
+    @classmethod
+    def get(cls) -> "FormatExtensionIndex":
+        """Returns the index of all registered formats, which is only rebuilt when the
+        registered formats change"""
+        all_formats = fileformats.core.FileSet.all_formats
+        cache_key = (id(all_formats), len(all_formats))
+        try:
+            return cls._cache[cache_key]
+        except KeyError:
+            pass
+        index = cls._cache[cache_key] = cls.build(all_formats)
+        return index
+
+    def candidates(self, fspath: str) -> ty.List[type]:
+        """Returns the formats with an extension that the path ends with"""
+        matches = []
+        pos = fspath.find(".")
+        while pos != -1:
+            matches.extend(self.by_ext.get(fspath[pos:], []))
+            pos = fspath.find(".", pos + 1)
+        matches.extend(f for e, f in self.other_exts if fspath.endswith(e))
+        return list(dict.fromkeys(matches))
+
+
+NIPYPE_SOURCE_HASH_RE = re.compile(r"^# nipype-source-hash: (\w+)", flags=re.MULTILINE)
+
+# Name of the directory the stubs that specs were created from are saved in next to
+# the specs, so they can be three-way merged with newly generated stubs
+STUBS_DIR_NAME = ".stubs"
+
+# Sentinel for values missing from one side of a three-way merge
+MISSING = object()
+
+
+@lru_cache(maxsize=None)
+def _class_source(klass: type) -> str:
+    try:
+        return inspect.getsource(klass)
+    except (OSError, TypeError):
+        return f"{klass.__module__}.{klass.__qualname__}"
+
+
+def nipype_source_hash(nipype_interface: type) -> str:
+    """Returns a hash of the source code of a nipype interface, its input and output
+    specs (i.e. the traits), and their base classes, which is embedded in the spec
+    generated for the interface to detect whether it has changed since
+
+    Parameters
+    ----------
+    nipype_interface : type
+        the nipype interface class
+
+    Returns
+    -------
+    str
+        the SHA-256 hash of the source code
+    """
+    classes = []
+    for klass in (
+        nipype_interface,
+        nipype_interface.input_spec,
+        nipype_interface.output_spec,
+    ):
+        if klass is None:
+            continue
+        for base in klass.__mro__:
+            if base not in classes and base.__module__.split(".")[0] not in (
+                "builtins",
+                "traits",
+            ):
+                classes.append(base)
+    sha = hashlib.sha256()
+    for klass in classes:
+        sha.update(_class_source(klass).encode("utf-8"))
+    return sha.hexdigest()
+
+
+def spec_source_hash(yaml_spec: str) -> ty.Optional[str]:
+    """Returns the hash of the nipype source embedded in an interface spec, None if
+    it doesn't have one"""
+    match = NIPYPE_SOURCE_HASH_RE.search(yaml_spec)
+    return match.group(1) if match else None
+
+
+def three_way_merge(base, ours, theirs) -> ty.Tuple[ty.Any, ty.List[str]]:
+    """Merges the changes made to a value loaded from YAML in "theirs" into "ours",
+    relative to their common ancestor "base". Dictionaries are merged key by key,
+    while other values (including lists) are treated as atomic. Values that are missing
+    from any of the sides are represented by `MISSING`.
+
+    Parameters
+    ----------
+    base : Any
+        the common ancestor of ours and theirs
+    ours : Any
+        the value with local changes (e.g. a hand-edited spec), which take precedence
+    theirs : Any
+        the value with upstream changes (e.g. a newly generated stub)
+
+    Returns
+    -------
+    merged : Any
+        the merged value, `MISSING` if it has been deleted
+    conflicts : list[str]
+        the paths of the values that have been changed in both ours and theirs, for
+        which ours is kept
+    """
+    if ours == theirs or theirs == base:
+        return ours, []
+    if ours == base:
+        return theirs, []
+    if not all(isinstance(v, dict) for v in (ours, theirs)):
+        return ours, [""]
+    if not isinstance(base, dict):
+        base = {}
+    merged = {}
+    conflicts = []
+    # Keep the order of keys in ours, with keys added in theirs appended
+    for key in list(ours) + [k for k in theirs if k not in ours]:
+        value, key_conflicts = three_way_merge(
+            base.get(key, MISSING), ours.get(key, MISSING), theirs.get(key, MISSING)
+        )
+        if value is not MISSING:
+            merged[key] = value
+        conflicts.extend(f"{key}.{c}" if c else str(key) for c in key_conflicts)
+    return merged, conflicts
+
+
+def parse_nipype_interface(
+    interface_path: str, pkg: str, base_package: str
+) -> ty.Tuple[ty.Optional[NipypeInterface], ty.Optional[str]]:
+    """Imports and parses a Nipype interface and generates the YAML spec for its
+    conversion. Defined at the module level so it can be run in a process pool
+
+    Parameters
+    ----------
+    interface_path : str
+        the full path to the interface class, e.g. nipype.interfaces.fsl.BET
+    pkg : str
+        the name of the package the interface is converted into
+    base_package : str
+        the prefix to add to the package name
+
+    Returns
+    -------
+    parsed : NipypeInterface or None
+        the parsed interface, None if the path doesn't point to a Nipype interface
+    yaml_spec : str or None
+        the YAML spec for the conversion of the interface
+    """
+    module_name, interface_name = interface_path.rsplit(".", 1)
+    nipype_interface = getattr(import_module(module_name), interface_name)
+    if not issubclass(nipype_interface, nipype.interfaces.base.core.Interface):
+        return None, None
+    parsed = NipypeInterface.parse(
+        nipype_interface=nipype_interface,
+        pkg=pkg,
+        base_package=base_package,
     )
-    headers = {"Accept": "application/vnd.github.v3+json", "User-Agent": "nipype2pydra"}
+    return parsed, parsed.generate_yaml_spec()
 
-    response = requests.get(release_url, headers=headers)
+
+TASKS_TEMPLATE_REPO = "nipype/pydra-tasks-template"
+
+
+def default_template_cache_dir() -> Path:
+    """The directory the downloaded pydra-tasks-template releases are cached in, which
+    can be set by the NIPYPE2PYDRA_CACHE_DIR environment variable"""
+    cache_dir = os.environ.get("NIPYPE2PYDRA_CACHE_DIR")
+    if cache_dir is None:
+        cache_dir = (
+            Path(os.environ.get("XDG_CACHE_HOME", Path.home() / ".cache"))
+            / "nipype2pydra"
+        )
+    return Path(cache_dir) / "task-templates"
+
+
+def _github_api_get(url: str) -> requests.Response:
+    headers = {"Accept": "application/vnd.github.v3+json", "User-Agent": "nipype2pydra"}
+    response = requests.get(url, headers=headers)
     if response.status_code != 200:
-        raise RuntimeError(f"Did not find release at '{release_url}'")
-    data = response.json()
-    tarball_url = data["tarball_url"]
+        raise RuntimeError(f"Request to '{url}' failed ({response.status_code})")
+    return response
 
-    response = requests.get(tarball_url)
 
-    if response.status_code == 200:
-        # Save the response content to a file
-        with open(output_path, "wb") as f:
-            f.write(response.content)
-    else:
-        raise RuntimeError(
-            f"Could not download the pydra-tasks template at {release_url}"
+def latest_tasks_template_version() -> str:
+    """Returns the tag of the latest release of the pydra-tasks-template"""
+    return _github_api_get(
+        f"https://api.github.com/repos/{TASKS_TEMPLATE_REPO}/releases/latest"
+    ).json()["tag_name"]
+
+
+def download_tasks_template(output_path: Path, version: ty.Optional[str] = None):
+    """Downloads the pydra-template to the output path
+
+    Parameters
+    ----------
+    output_path : Path
+        the path to save the tarball of the template to
+    version : str, optional
+        the release tag to download, by default the latest release
+    """
+    output_path.parent.mkdir(parents=True, exist_ok=True)
+    if version is None:
+        version = latest_tasks_template_version()
+    response = _github_api_get(
+        f"https://api.github.com/repos/{TASKS_TEMPLATE_REPO}/tarball/{version}"
+    )
+    with open(output_path, "wb") as f:
+        f.write(response.content)
+
+
+def file_sha256(fspath: Path) -> str:
+    sha = hashlib.sha256()
+    with open(fspath, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            sha.update(chunk)
+    return sha.hexdigest()
+
+
+def provision_tasks_template(
+    version: ty.Optional[str] = None,
+    sha256: ty.Optional[str] = None,
+    cache_dir: ty.Optional[Path] = None,
+    offline: bool = False,
+) -> Path:
+    """Returns a directory containing the pydra-tasks-template, downloading and
+    extracting the release into the cache directory if it isn't already there
+
+    Each release is cached as '<version>.tar.gz' along with its SHA-256 hash
+    ('<version>.tar.gz.sha256'), which is checked before the tarball is extracted, and
+    is extracted into the '<version>' directory only once. Downloads are written to a
+    temporary file and only moved into the cache once they match the expected hash
+    (if provided), so a bad download is never cached. Note that without an expected
+    hash, the recorded hash only guards against the cached tarball being corrupted on
+    disk, not against the download itself having been tampered with. Cached releases
+    that don't match their recorded or expected hash are downloaded again (unless
+    offline).
+
+    Parameters
+    ----------
+    version : str, optional
+        the release tag to use, by default the latest release (or when offline the
+        most recently cached release)
+    sha256 : str, optional
+        the expected SHA-256 hash of the release tarball
+    cache_dir : Path, optional
+        the directory to cache the releases in, by default `default_template_cache_dir()`
+    offline : bool
+        only use cached releases, raising an error if the requested one isn't cached
+
+    Returns
+    -------
+    Path
+        the root directory of the extracted template
+    """
+    if cache_dir is None:
+        cache_dir = default_template_cache_dir()
+    cache_dir = Path(cache_dir)
+    cache_dir.mkdir(parents=True, exist_ok=True)
+    if version is None:
+        if offline:
+            cached = sorted(
+                cache_dir.glob("*.tar.gz.sha256"), key=lambda p: p.stat().st_mtime
+            )
+            if not cached:
+                raise RuntimeError(
+                    f"No pydra-tasks-template releases are cached in {cache_dir}"
+                )
+            version = cached[-1].name[: -len(".tar.gz.sha256")]
+        else:
+            version = latest_tasks_template_version()
+    tarball = cache_dir / f"{version}.tar.gz"
+    hash_file = cache_dir / f"{version}.tar.gz.sha256"
+    extract_dir = cache_dir / version
+    actual_sha256 = None
+    if tarball.exists() and hash_file.exists():
+        actual_sha256 = file_sha256(tarball)
+        if actual_sha256 != hash_file.read_text().strip():
+            error = f"Cached pydra-tasks-template tarball {tarball} is corrupted"
+        elif sha256 is not None and actual_sha256 != sha256:
+            error = (
+                f"SHA-256 hash of pydra-tasks-template release '{version}' "
+                f"({actual_sha256}) doesn't match the expected hash ({sha256})"
+            )
+        else:
+            error = None
+        if error:
+            if offline:
+                raise RuntimeError(
+                    f"{error}, and it can't be downloaded again in offline mode"
+                )
+            warn(f"{error}, so it is being downloaded again")
+            tarball.unlink()
+            hash_file.unlink()
+            shutil.rmtree(extract_dir, ignore_errors=True)
+            actual_sha256 = None
+    if actual_sha256 is None:
+        if offline:
+            raise RuntimeError(
+                f"pydra-tasks-template release '{version}' isn't cached in {cache_dir} "
+                "and can't be downloaded in offline mode"
+            )
+        fd, tmp_tarball = tempfile.mkstemp(
+            prefix=f"{version}.", suffix=".tar.gz.part", dir=cache_dir
         )
+        os.close(fd)
+        tmp_tarball = Path(tmp_tarball)
+        try:
+            download_tasks_template(tmp_tarball, version=version)
+            actual_sha256 = file_sha256(tmp_tarball)
+            if sha256 is not None and actual_sha256 != sha256:
+                raise RuntimeError(
+                    f"SHA-256 hash of downloaded pydra-tasks-template release "
+                    f"'{version}' ({actual_sha256}) doesn't match the expected hash "
+                    f"({sha256})"
+                )
+            # The hash is recorded first so a tarball is never cached without it
+            hash_file.write_text(actual_sha256)
+            tmp_tarball.rename(tarball)
+        finally:
+            if tmp_tarball.exists():
+                tmp_tarball.unlink()
+    if not extract_dir.exists():
+        # Extract into a temporary directory first so that a partially extracted
+        # template is never left in the cache
+        tmp_extract_dir = Path(tempfile.mkdtemp(dir=cache_dir))
+        try:
+            extract_tarball(tarball, tmp_extract_dir)
+            tmp_extract_dir.rename(extract_dir)
+        finally:
+            shutil.rmtree(tmp_extract_dir, ignore_errors=True)
+    return next(p for p in extract_dir.iterdir() if p.is_dir())
+
+
+def extract_tarball(tarball: Path, dest_dir: Path):
+    """Extracts a gzipped tarball into the destination directory, refusing to extract
+    members (or links) with absolute paths or '..' components, which could otherwise
+    be written outside of it. Where supported, the tarball is also extracted with the
+    "data" filter, which additionally rejects device files and strips unsafe
+    permissions
+
+    Parameters
+    ----------
+    tarball : Path
+        the tarball to extract
+    dest_dir : Path
+        the directory to extract it into
+    """
+    with tarfile.open(tarball, "r:gz") as tar:
+        for member in tar.getmembers():
+            paths = [member.name]
+            if member.issym() or member.islnk():
+                paths.append(member.linkname)
+            for path in paths:
+                path = PurePosixPath(path)
+                if path.is_absolute() or ".." in path.parts:
+                    raise RuntimeError(
+                        f"Refusing to extract '{member.name}' from {tarball} as it "
+                        "could be written outside of the extraction directory"
+                    )
+        if hasattr(tarfile, "data_filter"):
+            tar.extractall(path=dest_dir, filter="data")
+        else:
+            tar.extractall(path=dest_dir)
+
+
+TEMPLATE_IGNORE = (".git", "__pycache__", ".pytest_cache")
+BINARY_SNIFF_SIZE = 8192
+
+
+def render_file(
+    src: Path,
+    dest: Path,
+    substitutions: ty.Dict[str, str],
+    edit: ty.Optional[ty.Callable[[str], str]] = None,
+    link: bool = False,
+) -> bool:
+    """Copies a template file to the destination, replacing any placeholders in it
+
+    Binary files (sniffed by the presence of NUL bytes), and text files that don't
+    contain any of the placeholders and don't need to be edited, are copied (or
+    hard-linked) without being decoded, and only the remaining files are rewritten.
+
+    Parameters
+    ----------
+    src : Path
+        the template file
+    dest : Path
+        the path to write the rendered file to
+    substitutions : dict[str, str]
+        placeholders to replace in the file and the strings to replace them with
+    edit : callable, optional
+        a function applied to the contents of the file before the placeholders are
+        replaced
+    link : bool
+        hard-link files that don't need to be rewritten instead of copying them. Note
+        that linked files share their contents with the template, so they must be
+        replaced rather than modified in place
+
+    Returns
+    -------
+    bool
+        whether the file was rewritten
+    """
+    dest.parent.mkdir(parents=True, exist_ok=True)
+    if dest.exists() or dest.is_symlink():
+        # Don't write through a link to a previously rendered file
+        dest.unlink()
+    with open(src, "rb") as f:
+        contents = f.read(BINARY_SNIFF_SIZE)
+        is_binary = b"\0" in contents
+        if not is_binary:
+            contents += f.read()
+    text = None
+    if not is_binary:
+        try:
+            text = contents.decode("utf-8")
+        except UnicodeDecodeError:
+            pass
+    if text is not None and (edit or any(k in text for k in substitutions)):
+        if edit:
+            text = edit(text)
+        for placeholder, value in substitutions.items():
+            text = text.replace(placeholder, value)
+        with open(dest, "wb") as f:
+            f.write(text.encode("utf-8"))
+        shutil.copymode(src, dest)
+        return True
+    if link:
+        try:
+            os.link(src, dest)
+            return False
+        except OSError:  # e.g. on a different file-system
+            pass
+    shutil.copyfile(src, dest)
+    shutil.copymode(src, dest)
+    return False
+
+
+def render_template(
+    template_dir: Path,
+    output_dir: Path,
+    substitutions: ty.Dict[str, str],
+    renames: ty.Optional[ty.Dict[str, str]] = None,
+    edits: ty.Optional[ty.Dict[str, ty.Callable[[str], str]]] = None,
+    exclude: ty.Iterable[str] = (),
+    link: bool = False,
+) -> ty.List[Path]:
+    """Copies a template directory to the output directory in a single pass,
+    replacing placeholders in both the paths and the contents of the files (see
+    `render_file`)
+
+    Parameters
+    ----------
+    template_dir : Path
+        the template directory
+    output_dir : Path
+        the directory to render the template into
+    substitutions : dict[str, str]
+        placeholders to replace in the paths and contents of the files, and the
+        strings to replace them with
+    renames : dict[str, str], optional
+        paths (relative to the template directory) to rename before the placeholders
+        in them are replaced
+    edits : dict[str, callable], optional
+        functions to apply to the contents of files, keyed by their path relative to
+        the template directory, before the placeholders in them are replaced
+    exclude : iterable[str]
+        paths of files or directories, relative to the template directory, to omit
+    link : bool
+        hard-link files that don't need to be rewritten instead of copying them
+
+    Returns
+    -------
+    list[Path]
+        the rendered files that were rewritten
+    """
+    renames = renames if renames else {}
+    edits = edits if edits else {}
+    exclude = set(exclude)
+    rewritten = []
+    for dpath, dnames, fnames in os.walk(template_dir):
+        rel_dir = Path(dpath).relative_to(template_dir)
+        dnames[:] = sorted(
+            d
+            for d in dnames
+            if d not in TEMPLATE_IGNORE and (rel_dir / d).as_posix() not in exclude
+        )
+        for fname in sorted(fnames):
+            rel_path = (rel_dir / fname).as_posix()
+            if rel_path in exclude:
+                continue
+            dest_path = renames.get(rel_path, rel_path)
+            for placeholder, value in substitutions.items():
+                dest_path = dest_path.replace(placeholder, value)
+            dest = output_dir / dest_path
+            if render_file(
+                Path(dpath) / fname,
+                dest,
+                substitutions,
+                edit=edits.get(rel_path),
+                link=link,
+            ):
+                rewritten.append(dest)
+    return rewritten
 
 
 def initialise_task_repo(
-    output_dir, task_template: Path, pkg: str, interface_only: bool
+    output_dir,
+    task_template: Path,
+    pkg: str,
+    interface_only: bool,
+    link: bool = False,
 ) -> Path:
     """Copy the task template to the output directory and customise it for the given
-    package name and return the created package directory"""
+    package name and return the created package directory
+
+    Parameters
+    ----------
+    output_dir : Path
+        the directory to create the package repository in
+    task_template : Path
+        the root directory of the pydra-tasks-template
+    pkg : str
+        the name of the package
+    interface_only : bool
+        whether the package only contains interfaces (i.e. no workflows)
+    link : bool
+        hard-link files from the task template that don't need to be customised
+        instead of copying them (see `render_file`). Files from the nipype2pydra
+        resources are always copied as some of them are overwritten by pkg-gen
+    """
 
     pkg_dir = output_dir / f"pydra-{pkg}"
+    python_pkg_dir = pkg_dir / "pydra" / "tasks" / pkg
+    substitutions = {"CHANGEME": pkg}
+
+    def underline(old_len: int, new_len: int):
+        return lambda s: s.replace("=" * old_len, "=" * new_len)
+
+    def edit_pyproject(pyproject_toml: str) -> str:
+        pyproject_toml = pyproject_toml.replace("README.md", "README.rst")
+        return pyproject_toml.replace("test = [\n", 'test = [\n    "nipype2pydra",\n')
 
-    def copy_ignore(_, names):
-        return [n for n in names if n in (".git", "__pycache__", ".pytest_cache")]
+    def edit_gitignore(gitignore: str) -> str:
+        # Add "pydra.tasks.<pkg>.auto to gitignore"
+        return (
+            gitignore
+            + "\n/pydra/tasks/CHANGEME/auto\n/pydra/tasks/CHANGEME/_version.py\n"
+        )
 
-    shutil.copytree(task_template, pkg_dir, ignore=copy_ignore)
+    # README.md is replaced by README.rst and the package __init__.py by init.py below
+    exclude = ["README.md", "pydra/tasks/CHANGEME/__init__.py"]
+    if not interface_only:
+        exclude.append("pydra/tasks/CHANGEME")
+    render_template(
+        task_template,
+        pkg_dir,
+        substitutions,
+        edits={"pyproject.toml": edit_pyproject, ".gitignore": edit_gitignore},
+        exclude=exclude,
+        link=link,
+    )
+    if interface_only:
+        render_template(
+            TEMPLATES_DIR / "related-packages",
+            pkg_dir / "related-packages",
+            substitutions,
+            renames={"conftest_.py": "conftest.py"},
+            edits={
+                "fileformats/README.rst": underline(29, 21 + len(pkg)),
+                "fileformats-extras/README.rst": underline(36, 28 + len(pkg)),
+            },
+        )
 
     # Setup script to auto-convert nipype interfaces
     auto_conv_dir = pkg_dir / "nipype-auto-conv"
@@ -657,120 +1315,40 @@ nipype2pydra convert $conv_dir/specs $conv_dir/.. $@
 """
         )
     os.chmod(auto_conv_dir / "generate", 0o755)  # make executable
-    shutil.copy(
+    render_file(
         TEMPLATES_DIR / "nipype-auto-convert-requirements.txt",
         auto_conv_dir / "requirements.txt",
+        substitutions,
     )
 
     # Setup GitHub workflows
-    gh_workflows_dir = pkg_dir / ".github" / "workflows"
-    gh_workflows_dir.mkdir(parents=True, exist_ok=True)
     ci_cd = "ci-cd-interface.yaml" if interface_only else "ci-cd-workflow.yaml"
-    shutil.copy(
+    render_file(
         TEMPLATES_DIR / "gh_workflows" / ci_cd,
-        gh_workflows_dir / "ci-cd.yaml",
+        pkg_dir / ".github" / "workflows" / "ci-cd.yaml",
+        substitutions,
     )
 
-    related_pkgs_dir = pkg_dir / "related-packages"
-    shutil.copytree(TEMPLATES_DIR / "related-packages", related_pkgs_dir)
-    os.rename(related_pkgs_dir / "conftest_.py", related_pkgs_dir / "conftest.py")
-
     # Add modified README
-    os.unlink(pkg_dir / "README.md")
-    with open(TEMPLATES_DIR / "README.rst") as f:
-        readme_rst = f.read()
-    readme_rst = readme_rst.replace("=" * 31, "=" * (23 + len(pkg)))
-    with open(pkg_dir / "README.rst", "w") as f:
-        f.write(readme_rst)
+    render_file(
+        TEMPLATES_DIR / "README.rst",
+        pkg_dir / "README.rst",
+        substitutions,
+        edit=underline(31, 23 + len(pkg)),
+    )
 
     with open(pkg_dir / "AUTHORS", "w") as f:
         f.write("# Enter list of names and emails of contributors to this package")
 
-    shutil.copyfile(TEMPLATES_DIR / "NOTICE", pkg_dir / "NOTICE")
-
-    fileformat_readme_path = related_pkgs_dir / "fileformats" / "README.rst"
-    with open(fileformat_readme_path) as f:
-        ff_readme_rst = f.read()
-    ff_readme_rst = ff_readme_rst.replace("=" * 29, "=" * (21 + len(pkg)))
-    with open(fileformat_readme_path, "w") as f:
-        f.write(ff_readme_rst)
-
-    fileformat_extras_readme_path = (
-        related_pkgs_dir / "fileformats-extras" / "README.rst"
-    )
-    with open(fileformat_extras_readme_path) as f:
-        ffe_readme_rst = f.read()
-    ffe_readme_rst = ffe_readme_rst.replace("=" * 36, "=" * (28 + len(pkg)))
-    with open(fileformat_extras_readme_path, "w") as f:
-        f.write(ffe_readme_rst)
-
-    with open(pkg_dir / "pyproject.toml") as f:
-        pyproject_toml = f.read()
-    pyproject_toml = pyproject_toml.replace("README.md", "README.rst")
-    pyproject_toml = pyproject_toml.replace(
-        "test = [\n", 'test = [\n    "nipype2pydra",\n'
-    )
-    with open(pkg_dir / "pyproject.toml", "w") as f:
-        f.write(pyproject_toml)
+    render_file(TEMPLATES_DIR / "NOTICE", pkg_dir / "NOTICE", substitutions)
 
     for tool_path in (TEMPLATES_DIR / "tools").iterdir():
-        shutil.copyfile(tool_path, pkg_dir / tool_path.name)
-
-    # Add "pydra.tasks.<pkg>.auto to gitignore"
-    with open(pkg_dir / ".gitignore", "a") as f:
-        f.write(f"\n/pydra/tasks/{pkg}/auto" f"\n/pydra/tasks/{pkg}/_version.py\n")
-
-    python_pkg_dir = pkg_dir / "pydra" / "tasks" / pkg
-
-    # rename tasks directory
-    if interface_only:
-        (pkg_dir / "pydra" / "tasks" / "CHANGEME").rename(python_pkg_dir)
-        (
-            pkg_dir
-            / "related-packages"
-            / "fileformats"
-            / "fileformats"
-            / "medimage_CHANGEME"
-        ).rename(
-            pkg_dir
-            / "related-packages"
-            / "fileformats"
-            / "fileformats"
-            / f"medimage_{pkg}"
-        )
-        (
-            pkg_dir
-            / "related-packages"
-            / "fileformats-extras"
-            / "fileformats"
-            / "extras"
-            / "medimage_CHANGEME"
-        ).rename(
-            pkg_dir
-            / "related-packages"
-            / "fileformats-extras"
-            / "fileformats"
-            / "extras"
-            / f"medimage_{pkg}"
-        )
-
-    else:
-        shutil.rmtree(pkg_dir / "pydra" / "tasks" / "CHANGEME")
-        shutil.rmtree(pkg_dir / "related-packages")
-        python_pkg_dir.mkdir(parents=True)
+        render_file(tool_path, pkg_dir / tool_path.name, substitutions)
 
     # Add in modified __init__.py
-    shutil.copy(TEMPLATES_DIR / "init.py", python_pkg_dir / "__init__.py")
-
-    # Replace "CHANGEME" string with pkg name
-    for fspath in pkg_dir.glob("**/*"):
-        if fspath.is_dir() or fspath.suffix in (".pyc", ".pyo", ".pyd"):
-            continue
-        with open(fspath) as f:
-            contents = f.read()
-        contents = contents.replace("CHANGEME", pkg)
-        with open(fspath, "w") as f:
-            f.write(contents)
+    render_file(
+        TEMPLATES_DIR / "init.py", python_pkg_dir / "__init__.py", substitutions
+    )
 
     return pkg_dir
 
@@ -921,6 +1499,137 @@ def test_generate_sample_{frmt.lower()}_data():
     return code_str
 
 
+# Arguments that are passed to all callables
+IMPLICIT_CALLABLE_ARGS = ["inputs", "stdout", "stderr", "output_dir"]
+
+
+@lru_cache(maxsize=None)
+def _cached_source_code(func_or_klass: ty.Union[ty.Callable, ty.Type]) -> str:
+    """`get_source_code` memoised for the whole run, as most interfaces in a package
+    share the methods of their base classes (e.g. FSLCommand, AFNICommand, FSCommand)"""
+    return get_source_code(func_or_klass)
+
+
+@lru_cache(maxsize=None)
+def _find_method_calls(
+    method: ty.Callable, class_name: str
+) -> ty.Tuple[ty.Tuple[str, ...], ty.Tuple[str, ...]]:
+    """Returns the names of the methods called on self (or the class) and super() in a
+    method, which are resolved against each interface the method is inherited by"""
+    method_src = _cached_source_code(method)
+    return (
+        tuple(re.findall(r"(?:self|" + class_name + r")\.(\w+)\(", method_src)),
+        tuple(re.findall(r"super\([^\)]*\)\.(\w+)\(", method_src)),
+    )
+
+
+@lru_cache(maxsize=None)
+def _process_callable_method(
+    method: ty.Callable,
+    new_name: str,
+    name_map: ty.FrozenSet[ty.Tuple[str, str]],
+    class_name: str,
+    cmd: ty.Optional[str],
+) -> str:
+    """Converts a method of a nipype interface into a function for a callables module,
+    memoised so that methods inherited by many interfaces are only converted once
+
+    Parameters
+    ----------
+    method : callable
+        the method to convert
+    new_name : str
+        the name of the function
+    name_map : frozenset[tuple[str, str]]
+        the names of the functions the methods called by the method are converted to
+    class_name : str
+        the name of the interface class, if it is referenced in the method, otherwise
+        "self"
+    cmd : str, optional
+        the command of the interface if it is referenced in the method
+    """
+    name_map = dict(name_map)
+    src = _cached_source_code(method)
+    src = src.replace("if self.output_spec:", "if True:")
+    src = re.sub(
+        r"outputs = self\.(output_spec|_outputs)\(\).*$",
+        r"outputs = {}",
+        src,
+        flags=re.MULTILINE,
+    )
+    prefix, args, body = extract_args(src)
+    body = insert_args_in_method_calls(
+        body, [f"{a}={a}" for a in IMPLICIT_CALLABLE_ARGS], name_map, class_name
+    )
+    if cmd is not None:
+        body = body.replace("self.cmd", f'"{cmd}"')
+    body = body.replace("self.", "")
+    body = re.sub(
+        r"super\([^\)]*\)\.(\w+)\(", lambda m: name_map[m.group(1)] + "(", body
+    )
+    body = re.sub(r"\w+runtime\.(stdout|stderr)", r"\1", body)
+    body = body.replace("os.getcwd()", "output_dir")
+    # drop 'self' from the args and add the implicit callable args
+    args = args[1:]
+    arg_names = [a.split("=")[0].split(":")[0] for a in args]
+    for implicit in IMPLICIT_CALLABLE_ARGS:
+        if implicit not in arg_names:
+            args.append(f"{implicit}=None")
+    match = re.match(r"(\s*#[^\n]*\n)(\s*@[^\n]*\n)*(\s*def\s+)", prefix)
+    prefix = "".join(g for g in match.groups() if g and g.strip() != "@classmethod")
+    src = prefix + new_name + "(" + ", ".join(args) + body
+    src = cleanup_function_body(src)
+    return src
+
+
+def insert_args_in_method_calls(
+    src: str,
+    args: ty.List[ty.Tuple[str, str]],
+    name_map: ty.Dict[str, str],
+    class_name: str,
+) -> str:
+    """Insert additional arguments into the method calls
+
+    Parameters
+    ----------
+    body : str
+        the body of th
+    args : list[tuple[str, str]]
+        the arguments to insert into the method calls
+    """
+    # Split the src code into chunks delimited by calls to methods (i.e. 'self.<method>(.*)')
+    method_re = re.compile(
+        r"(?:self|" + class_name + r")\.(\w+)(?=\()", flags=re.MULTILINE | re.DOTALL
+    )
+    splits = method_re.split(src)
+    new_src = splits[0]
+    # Iterate through these chunks and add the additional args to the method calls
+    # using insert_args_in_signature function
+    sig = ""
+    outer_name = None
+    for name, next_part in zip(splits[1::2], splits[2::2]):
+        if outer_name:
+            sig += name + next_part
+        else:
+            sig += next_part
+        try:
+            new_sig = insert_args_in_signature(sig, args)
+        except UnmatchedParensException:
+            sig = next_part
+            outer_name = name
+        else:
+            if outer_name:
+                new_sig = insert_args_in_method_calls(
+                    new_sig, args, name_map=name_map, class_name=class_name
+                )
+                new_src += name_map[outer_name] + new_sig
+                outer_name = None
+            else:
+                new_src += name_map[name] + new_sig
+            sig = ""
+    return new_src
+
+
 def get_callable_sources(
     nipype_interface,
 ) -> ty.Tuple[ty.Set[str], ty.List[str], ty.Set[str], ty.Set[ty.Tuple[str, str]]]:
@@ -945,8 +1654,6 @@ def get_callable_sources(
         the external constants required by the functions and classes in (name, value) tuples
     """
 
-    IMPLICIT_ARGS = ["inputs", "stdout", "stderr", "output_dir"]
-
     def common_parent_pkg_prefix(mod_name: str) -> str:
         """Return the common part of two package names"""
         ref_parts = nipype_interface.__module__.split(".")
@@ -968,10 +1675,8 @@ def get_callable_sources(
             interface = nipype_interface
         all_nested = {}
         for method in methods:
-            method_src = get_source_code(method)
-            for match in re.findall(
-                r"(?:self|" + class_name + r")\.(\w+)\(", method_src
-            ):
+            self_calls, super_calls = _find_method_calls(method, class_name)
+            for match in self_calls:
                 if match in ("output_spec", "_outputs"):
                     continue
                 nested = getattr(nipype_interface, match)
@@ -981,7 +1686,7 @@ def get_callable_sources(
                     all_nested.update(
                         find_nested_methods([nested], class_name=class_name)
                     )
-            for match in re.findall(r"super\([^\)]*\)\.(\w+)\(", method_src):
+            for match in super_calls:
                 nested = None
                 for base in interface.__bases__:
                     try:
@@ -1011,84 +1716,22 @@ def get_callable_sources(
     def process_method(
         method: ty.Callable, new_name: str, name_map: ty.Dict[str, str], class_name: str
     ) -> str:
-        src = get_source_code(method)
-        src = src.replace("if self.output_spec:", "if True:")
-        src = re.sub(
-            r"outputs = self\.(output_spec|_outputs)\(\).*$",
-            r"outputs = {}",
-            src,
-            flags=re.MULTILINE,
-        )
-        prefix, args, body = extract_args(src)
-        body = insert_args_in_method_calls(
-            body, [f"{a}={a}" for a in IMPLICIT_ARGS], name_map, class_name
-        )
-        if hasattr(nipype_interface, "_cmd"):
-            body = body.replace("self.cmd", f'"{nipype_interface._cmd}"')
-        body = body.replace("self.", "")
-        body = re.sub(
-            r"super\([^\)]*\)\.(\w+)\(", lambda m: name_map[m.group(1)] + "(", body
-        )
-        body = re.sub(r"\w+runtime\.(stdout|stderr)", r"\1", body)
-        body = body.replace("os.getcwd()", "output_dir")
-        # drop 'self' from the args and add the implicit callable args
-        args = args[1:]
-        arg_names = [a.split("=")[0].split(":")[0] for a in args]
-        for implicit in IMPLICIT_ARGS:
-            if implicit not in arg_names:
-                args.append(f"{implicit}=None")
-        match = re.match(r"(\s*#[^\n]*\n)(\s*@[^\n]*\n)*(\s*def\s+)", prefix)
-        prefix = "".join(g for g in match.groups() if g and g.strip() != "@classmethod")
-        src = prefix + new_name + "(" + ", ".join(args) + body
-        src = cleanup_function_body(src)
-        return src
-
-    def insert_args_in_method_calls(
-        src: str,
-        args: ty.List[ty.Tuple[str, str]],
-        name_map: ty.Dict[str, str],
-        class_name: str,
-    ) -> str:
-        """Insert additional arguments into the method calls
-
-        Parameters
-        ----------
-        body : str
-            the body of th
-        args : list[tuple[str, str]]
-            the arguments to insert into the method calls
-        """
-        # Split the src code into chunks delimited by calls to methods (i.e. 'self.<method>(.*)')
-        method_re = re.compile(
-            r"(?:self|" + class_name + r")\.(\w+)(?=\()", flags=re.MULTILINE | re.DOTALL
+        src = _cached_source_code(method)
+        # Only the parts of the interface that the method references are passed on, so
+        # the processed method can be reused between interfaces that inherit it
+        if class_name + "." not in src:
+            class_name = "self"
+        if hasattr(nipype_interface, "_cmd") and "self.cmd" in src:
+            cmd = str(nipype_interface._cmd)
+        else:
+            cmd = None
+        return _process_callable_method(
+            method,
+            new_name,
+            frozenset((k, v) for k, v in name_map.items() if k in src),
+            class_name,
+            cmd,
         )
-        splits = method_re.split(src)
-        new_src = splits[0]
-        # Iterate through these chunks and add the additional args to the method calls
-        # using insert_args_in_signature function
-        sig = ""
-        outer_name = None
-        for name, next_part in zip(splits[1::2], splits[2::2]):
-            if outer_name:
-                sig += name + next_part
-            else:
-                sig += next_part
-            try:
-                new_sig = insert_args_in_signature(sig, args)
-            except UnmatchedParensException:
-                sig = next_part
-                outer_name = name
-            else:
-                if outer_name:
-                    new_sig = insert_args_in_method_calls(
-                        new_sig, args, name_map=name_map, class_name=class_name
-                    )
-                    new_src += name_map[outer_name] + new_sig
-                    outer_name = None
-                else:
-                    new_src += name_map[name] + new_sig
-                sig = ""
-        return new_src
 
     methods_to_process = [nipype_interface._list_outputs]
     if hasattr(nipype_interface, "_gen_filename"):
@@ -1116,15 +1759,15 @@ def get_callable_sources(
         used = UsedSymbols.find(mod, methods, omit_classes=(BaseInterface, TraitedSpec))
         all_funcs.update(methods)
         for func in used.local_functions:
-            all_funcs.add(cleanup_function_body(get_source_code(func)))
+            all_funcs.add(cleanup_function_body(_cached_source_code(func)))
         for klass in used.local_classes:
-            klass_src = cleanup_function_body(get_source_code(klass))
+            klass_src = cleanup_function_body(_cached_source_code(klass))
             if klass_src not in all_classes:
                 all_classes.append(klass_src)
         for new_func_name, func in used.intra_pkg_funcs:
             if new_func_name is None:
                 continue  # Not referenced directly in this module
-            func_src = get_source_code(func)
+            func_src = _cached_source_code(func)
             location_comment, func_src = func_src.split("\n", 1)
             match = re.match(
                 r"(.*)\bdef *" + func.__name__ + r"(?=\()(.*)$",
@@ -1143,7 +1786,7 @@ def get_callable_sources(
         for new_klass_name, klass in used.intra_pkg_classes:
             if new_klass_name is None:
                 continue  # Not referenced directly in this module
-            klass_src = get_source_code(klass)
+            klass_src = _cached_source_code(klass)
             location_comment, klass_src = klass_src.split("\n", 1)
             match = re.match(
                 r"(.*)\bclass *" + klass.__name__ + r"(?=\()(.*)$",
@@ -1172,3 +1815,226 @@ def get_callable_sources(
         all_imports,
         all_constants,
     )
+
+
+def shared_callables_module_name(pkg: str) -> str:
+    """The name of the module that the helper functions shared between the callables
+    modules of a package are written to"""
+    return f"_{pkg}_shared_callables"
+
+
+def callable_helper_name(src: str) -> str:
+    """The name of the function or class defined in a helper's source code"""
+    return re.search(r"^(?:def|class) (\w+)\b", src, flags=re.MULTILINE).group(1)
+
+
+def hash_callable_helpers(
+    helpers: ty.Iterable[str], consts: ty.Iterable[ty.Tuple[str, str]]
+) -> ty.Dict[str, ty.Tuple[str, ty.Set[str]]]:
+    """Hashes the source code of each helper function/class along with the helpers
+    and constants it references (recursively), so helpers are only considered to be
+    the same if they behave the same
+
+    Parameters
+    ----------
+    helpers : iterable[str]
+        the source code of the helper functions and classes
+    consts : iterable[tuple[str, str]]
+        the constants in the callables module in (name, value) tuples
+
+    Returns
+    -------
+    dict[str, tuple[str, set[str]]]
+        the hash of each helper and the names of the helpers it references (including
+        itself)
+    """
+    srcs = {callable_helper_name(h): h for h in helpers}
+    const_defs = dict(consts)
+    refs = {}
+    for name, src in srcs.items():
+        refs[name] = set()
+        UsedSymbols._get_symbols(src, refs[name])
+    hashes = {}
+    for name in srcs:
+        closure = set()
+        to_visit = [name]
+        while to_visit:
+            visiting = to_visit.pop()
+            if visiting not in closure:
+                closure.add(visiting)
+                to_visit.extend(r for r in refs[visiting] if r in srcs)
+        referenced = set().union(*(refs[n] for n in closure))
+        content = [srcs[n] for n in sorted(closure)] + [
+            f"{c} = {const_defs[c]}" for c in sorted(referenced & set(const_defs))
+        ]
+        hashes[name] = (
+            hashlib.sha256("\n".join(content).encode()).hexdigest(),
+            closure,
+        )
+    return hashes
+
+
+@attrs.define
+class SharedCallables:
+    """Helper functions and classes (e.g. `FSLCommand._gen_fname`) that are referenced
+    by the callables of more than one interface in a package. They are written once to
+    a shared callables module, identified by the hash of their source code (see
+    `hash_callable_helpers`), and imported from there by the callables module of each
+    interface instead of being duplicated in all of them
+
+    Parameters
+    ----------
+    module_name : str
+        the name of the shared callables module
+    min_shared : int
+        the number of interfaces that need to reference a helper for it to be shared
+    """
+
+    module_name: str = attrs.field()
+    min_shared: int = attrs.field(default=2)
+    _sources: ty.Dict[type, tuple] = attrs.field(factory=dict)
+    _hashes: ty.Dict[type, ty.Dict[str, str]] = attrs.field(factory=dict)
+    _counts: ty.Counter[str] = attrs.field(factory=Counter)
+    # The name, source, hashes of the referenced helpers, and the constants and imports
+    # of the callables module of each distinct helper, keyed by its hash
+    _helpers: ty.Dict[str, tuple] = attrs.field(factory=dict)
+
+    def register(self, nipype_interface: type):
+        """Adds the helpers referenced by the callables of an interface"""
+        funcs, classes, imports, consts = get_callable_sources(nipype_interface)
+        self._sources[nipype_interface] = (funcs, classes, imports, consts)
+        srcs = {callable_helper_name(h): h for h in list(funcs) + classes}
+        hashes = hash_callable_helpers(srcs.values(), consts)
+        self._hashes[nipype_interface] = {n: h for n, (h, _) in hashes.items()}
+        for name, (hsh, closure) in hashes.items():
+            self._counts[hsh] += 1
+            if hsh not in self._helpers:
+                self._helpers[hsh] = (
+                    name,
+                    srcs[name],
+                    {n: hashes[n][0] for n in closure},
+                    consts,
+                    imports,
+                )
+
+    def shared_name(self, name: str, hsh: str) -> str:
+        return f"{name}_{hsh[:8]}"
+
+    @staticmethod
+    def const_hash(name: str, value: str) -> str:
+        return hashlib.sha256(f"{name} = {value}".encode()).hexdigest()
+
+    def is_shared(self, hsh: str) -> bool:
+        return self._counts[hsh] >= self.min_shared
+
+    def sources_for(
+        self, nipype_interface: type
+    ) -> ty.Tuple[ty.Set[str], ty.List[str], ty.Set[str], ty.Set[ty.Tuple[str, str]]]:
+        """The sources to write to the callables module of an interface (see
+        `get_callable_sources`), with the shared helpers replaced by imports from the
+        shared callables module"""
+        if nipype_interface not in self._sources:
+            self.register(nipype_interface)
+        funcs, classes, imports, consts = self._sources[nipype_interface]
+        shared = {
+            n: h for n, h in self._hashes[nipype_interface].items() if self.is_shared(h)
+        }
+        funcs = set(f for f in funcs if callable_helper_name(f) not in shared)
+        classes = [c for c in classes if callable_helper_name(c) not in shared]
+        imports = set(imports)
+        for name, hsh in sorted(shared.items()):
+            imports.update(
+                parse_imports(
+                    f"from {self.module_name} import {self.shared_name(name, hsh)} as "
+                    f"{name}"
+                )
+            )
+        return funcs, classes, imports, consts
+
+    def __bool__(self):
+        return any(self.is_shared(h) for h in self._helpers)
+
+    def generate(self) -> str:
+        """Generates the source code of the shared callables module"""
+        funcs = []
+        classes = []
+        consts = {}
+        imports = set()
+        for hsh, (name, src, referenced, helper_consts, helper_imports) in sorted(
+            self._helpers.items(), key=lambda h: self.shared_name(h[1][0], h[0])
+        ):
+            if not self.is_shared(hsh):
+                continue
+            renames = {n: self.shared_name(n, h) for n, h in referenced.items()}
+            # The constants are renamed by the hash of their values in the same way,
+            # so constants of the same name in different callables modules don't clash
+            used = set()
+            UsedSymbols._get_symbols(src, used)
+            for const_name, value in helper_consts:
+                if const_name in used:
+                    renames[const_name] = self.shared_name(
+                        const_name, self.const_hash(const_name, value)
+                    )
+                    consts[renames[const_name]] = value
+            src = re.sub(
+                r"(?<![\w\.\"'])("
+                + "|".join(re.escape(n) for n in sorted(renames, key=len)[::-1])
+                + r")\b",
+                lambda m: renames[m.group(1)],
+                src,
+            )
+            if re.search(r"^class ", src, flags=re.MULTILINE):
+                classes.append(src)
+            else:
+                funcs.append(src)
+            imports.update(helper_imports)
+        # Classes are written first in case they are referenced at import time
+        code_str = "\n\n".join(sorted_by_base_classes(classes) + funcs)
+        used_consts = set()
+        UsedSymbols._get_symbols(code_str, used_consts)
+        code_str = (
+            "".join(
+                f"{n} = {v}\n\n\n"
+                for n, v in sorted(consts.items())
+                if n in used_consts
+            )
+            + code_str
+        )
+        imports = UsedSymbols.filter_imports(
+            ImportStatement.collate(i.absolute() for i in imports if not i.indent),
+            code_str,
+        )
+        code_str = (
+            '"""Module containing the helper functions that are shared between the '
+            'callables modules of the package"""\n\n'
+            + "\n".join(str(i) for i in imports)
+            + "\n\n\n"
+            + code_str
+        )
+        try:
+            code_str = black.format_file_contents(
+                code_str, fast=False, mode=black.FileMode()
+            )
+        except black.report.NothingChanged:
+            pass
+        return code_str
+
+
+def sorted_by_base_classes(classes: ty.List[str]) -> ty.List[str]:
+    """Sorts the source code of classes so that base classes are defined before the
+    classes that inherit from them"""
+    names = {callable_helper_name(c): c for c in classes}
+    ordered = []
+
+    def add(name):
+        src = names.pop(name, None)
+        if src is None:
+            return
+        bases = re.search(r"^class \w+\(([^\)]*)\)", src, flags=re.MULTILINE)
+        for base in re.findall(r"\w+", bases.group(1)) if bases else []:
+            add(base)
+        ordered.append(src)
+
+    for name in list(names):
+        add(name)
+    return ordered
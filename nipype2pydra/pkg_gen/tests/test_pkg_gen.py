@@ -1,3 +1,4 @@
+import re
 import pytest
 from nipype2pydra.cli.pkg_gen import pkg_gen
 from nipype2pydra.utils import show_cli_trace
@@ -28,3 +29,354 @@ def test_pkg_gen(pkg_gen_spec_file, cli_runner, tmp_path, tasks_template_args):
         + tasks_template_args,
     )
     assert result.exit_code == 0, show_cli_trace(result)
+
+
+def test_shared_callables():
+    from nipype.interfaces.fsl import BET, FLIRT, ApplyXFM
+    from nipype2pydra.pkg_gen import SharedCallables, shared_callables_module_name
+
+    shared = SharedCallables(shared_callables_module_name("fsl"))
+    interfaces = [BET, FLIRT, ApplyXFM]
+    for interface in interfaces:
+        shared.register(interface)
+    assert shared
+    shared_code = shared.generate()
+    compile(shared_code, shared.module_name, "exec")
+    funcs, _, imports, _ = shared.sources_for(BET)
+    shared_imports = [i for i in imports if i.from_ == shared.module_name]
+    assert shared_imports
+    for imported in (i for stmt in shared_imports for i in stmt.values()):
+        assert re.search(
+            rf"^(def|class) {imported.name}\b", shared_code, flags=re.MULTILINE
+        )
+        assert not any(re.search(rf"^def {imported.alias}\b", f) for f in funcs)
+
+
+def test_shared_callables_conflicting_constants(monkeypatch):
+    import nipype2pydra.pkg_gen
+    from nipype2pydra.pkg_gen import SharedCallables
+
+    helper = "def _gen_fname(name):\n    return name + SUFFIX\n"
+    suffixes = {"A1": '"_a"', "A2": '"_a"', "B1": '"_b"', "B2": '"_b"'}
+    monkeypatch.setattr(
+        nipype2pydra.pkg_gen,
+        "get_callable_sources",
+        lambda intf: ({helper}, [], set(), {("SUFFIX", suffixes[intf])}),
+    )
+    shared = SharedCallables("_tst_shared_callables")
+    for interface in suffixes:
+        shared.register(interface)
+    namespace = {}
+    exec(shared.generate(), namespace)
+    # Each pair of interfaces shares its own helper, which references the constant
+    # of its own callables module even though the constants have the same name
+    for interface, suffix in suffixes.items():
+        _, _, imports, _ = shared.sources_for(interface)
+        (imported,) = [i for stmt in imports for i in stmt.values()]
+        assert namespace[imported.name]("x") == "x" + suffix[1:-1]
+    assert "SUFFIX" not in namespace
+
+
+def test_parse_nipype_interface_in_pool():
+    from concurrent.futures import ProcessPoolExecutor
+    from functools import partial
+    from nipype2pydra.pkg_gen import parse_nipype_interface
+
+    interfaces = [
+        "nipype.interfaces.fsl.BET",
+        "nipype.interfaces.fsl.FLIRT",
+        "nipype.interfaces.fsl.base.Info",
+    ]
+    parse = partial(parse_nipype_interface, pkg="fsl", base_package="")
+    with ProcessPoolExecutor(2) as executor:
+        in_pool = list(executor.map(parse, interfaces))
+    assert in_pool == list(map(parse, interfaces))
+    assert in_pool[-1] == (None, None)
+    parsed, yaml_spec = in_pool[0]
+    assert parsed.name == "BET"
+    assert "task_name: BET" in yaml_spec
+
+
+def test_format_extension_index():
+    from fileformats.core import FileSet
+    from nipype2pydra.pkg_gen import FormatExtensionIndex
+
+    index = FormatExtensionIndex.get()
+    assert FormatExtensionIndex.get() is index
+    formats = [
+        f
+        for f in FileSet.all_formats
+        if f.ext and None not in f.alternate_exts and "-" not in f.namespace
+    ]
+    for fspath in [
+        "structural.nii",
+        "functional.nii.gz",
+        "anat+orig.BRIK",
+        "anat+orig.HEAD",
+        "lh.white",
+        "trans.mat",
+        "bvals",
+        "data.pkl.gz",
+    ]:
+        expected = [f for f in formats if f.matching_exts(fspath)]
+        assert sorted(index.candidates(fspath), key=str) == sorted(expected, key=str)
+
+
+def test_provision_tasks_template_offline(tmp_path, monkeypatch):
+    import tarfile
+    import requests
+    from nipype2pydra.pkg_gen import provision_tasks_template, file_sha256
+
+    template_dir = tmp_path / "nipype-pydra-tasks-template-abc123"
+    (template_dir / "pydra" / "tasks" / "CHANGEME").mkdir(parents=True)
+    (template_dir / "README.md").write_text("CHANGEME")
+    cache_dir = tmp_path / "cache"
+    cache_dir.mkdir()
+    tarball = cache_dir / "v0.1.0.tar.gz"
+    with tarfile.open(tarball, "w:gz") as tar:
+        tar.add(template_dir, arcname=template_dir.name)
+    (cache_dir / "v0.1.0.tar.gz.sha256").write_text(file_sha256(tarball))
+
+    def no_network(*args, **kwargs):
+        raise AssertionError("Attempted to access the network in offline mode")
+
+    monkeypatch.setattr(requests, "get", no_network)
+    extracted = provision_tasks_template(
+        version="v0.1.0",
+        sha256=file_sha256(tarball),
+        cache_dir=cache_dir,
+        offline=True,
+    )
+    assert extracted == cache_dir / "v0.1.0" / template_dir.name
+    assert (extracted / "README.md").read_text() == "CHANGEME"
+    # Most recently cached release is used when the version isn't pinned
+    assert provision_tasks_template(cache_dir=cache_dir, offline=True) == extracted
+    with pytest.raises(RuntimeError, match="doesn't match the expected hash"):
+        provision_tasks_template(
+            version="v0.1.0", sha256="0" * 64, cache_dir=cache_dir, offline=True
+        )
+    with pytest.raises(RuntimeError, match="can't be downloaded in offline mode"):
+        provision_tasks_template(version="v0.2.0", cache_dir=cache_dir, offline=True)
+    with open(tarball, "ab") as f:
+        f.write(b"corrupted")
+    with pytest.raises(RuntimeError, match="is corrupted, and it can't be downloaded"):
+        provision_tasks_template(version="v0.1.0", cache_dir=cache_dir, offline=True)
+
+
+@pytest.mark.parametrize(
+    "arcname", ["../escaped", "/tmp/escaped", "tmpl/../../escaped"]
+)
+def test_provision_tasks_template_unsafe_members(tmp_path, arcname):
+    import io
+    import tarfile
+    from nipype2pydra.pkg_gen import provision_tasks_template, file_sha256
+
+    cache_dir = tmp_path / "cache" / "releases"
+    cache_dir.mkdir(parents=True)
+    tarball = cache_dir / "v0.1.0.tar.gz"
+    with tarfile.open(tarball, "w:gz") as tar:
+        member = tarfile.TarInfo(arcname)
+        member.size = 7
+        tar.addfile(member, io.BytesIO(b"escaped"))
+    (cache_dir / "v0.1.0.tar.gz.sha256").write_text(file_sha256(tarball))
+    with pytest.raises(RuntimeError, match="Refusing to extract"):
+        provision_tasks_template(version="v0.1.0", cache_dir=cache_dir, offline=True)
+    assert not (tmp_path / "cache" / "escaped").exists()
+    # Nothing is left extracted in the cache
+    assert sorted(p.name for p in cache_dir.iterdir()) == [
+        "v0.1.0.tar.gz",
+        "v0.1.0.tar.gz.sha256",
+    ]
+
+
+def test_provision_tasks_template_verify_download(tmp_path, monkeypatch):
+    import tarfile
+    import shutil
+    import nipype2pydra.pkg_gen
+    from nipype2pydra.pkg_gen import provision_tasks_template, file_sha256
+
+    template_dir = tmp_path / "nipype-pydra-tasks-template-abc123"
+    (template_dir / "pydra" / "tasks" / "CHANGEME").mkdir(parents=True)
+    good_tarball = tmp_path / "good.tar.gz"
+    with tarfile.open(good_tarball, "w:gz") as tar:
+        tar.add(template_dir, arcname=template_dir.name)
+    good_sha256 = file_sha256(good_tarball)
+    downloads = []
+
+    def download(output_path, version=None):
+        downloads.append(version)
+        if len(downloads) == 1:
+            output_path.write_bytes(b"bad download")
+        else:
+            shutil.copyfile(good_tarball, output_path)
+
+    monkeypatch.setattr(nipype2pydra.pkg_gen, "download_tasks_template", download)
+    cache_dir = tmp_path / "cache"
+    with pytest.raises(RuntimeError, match="doesn't match the expected hash"):
+        provision_tasks_template(
+            version="v0.1.0", sha256=good_sha256, cache_dir=cache_dir
+        )
+    # Nothing is left in the cache by the bad download
+    assert list(cache_dir.iterdir()) == []
+    extracted = provision_tasks_template(
+        version="v0.1.0", sha256=good_sha256, cache_dir=cache_dir
+    )
+    assert extracted == cache_dir / "v0.1.0" / template_dir.name
+    assert (cache_dir / "v0.1.0.tar.gz.sha256").read_text() == good_sha256
+    # A cached release that doesn't match the pinned hash is downloaded again
+    (cache_dir / "v0.1.0.tar.gz").write_bytes(b"tampered")
+    (cache_dir / "v0.1.0.tar.gz.sha256").write_text(
+        file_sha256(cache_dir / "v0.1.0.tar.gz")
+    )
+    with pytest.warns(UserWarning, match="so it is being downloaded again"):
+        assert (
+            provision_tasks_template(
+                version="v0.1.0", sha256=good_sha256, cache_dir=cache_dir
+            )
+            == extracted
+        )
+    assert downloads == ["v0.1.0"] * 3
+
+
+def make_tasks_template(template_dir):
+    """Creates a minimal stand-in for the pydra-tasks-template"""
+    (template_dir / "pydra" / "tasks" / "CHANGEME").mkdir(parents=True)
+    (template_dir / ".git").mkdir()
+    (template_dir / ".git" / "HEAD").write_text("ref: refs/heads/main")
+    (template_dir / "README.md").write_text("pydra-CHANGEME")
+    (template_dir / "pyproject.toml").write_text(
+        '[project]\nname = "pydra-CHANGEME"\nreadme = "README.md"\n'
+        '[project.optional-dependencies]\ntest = [\n    "pytest",\n]\n'
+    )
+    (template_dir / ".gitignore").write_text("*.pyc\n")
+    (template_dir / "pydra" / "tasks" / "CHANGEME" / "_version.py").write_text("")
+    (template_dir / "docs").mkdir()
+    (template_dir / "docs" / "plain.txt").write_text("no placeholders")
+    (template_dir / "docs" / "logo.png").write_bytes(b"\x89PNG\x00CHANGEME\xff")
+    return template_dir
+
+
+def test_initialise_task_repo(tmp_path):
+    from nipype2pydra.pkg_gen import initialise_task_repo
+
+    template_dir = make_tasks_template(tmp_path / "template")
+
+    pkg_dir = initialise_task_repo(
+        tmp_path / "output", template_dir, "foo", interface_only=True, link=True
+    )
+    assert not (pkg_dir / ".git").exists()
+    assert not (pkg_dir / "README.md").exists()
+    assert (
+        (pkg_dir / "README.rst")
+        .read_text()
+        .startswith("=" * 26 + "\nPydra task package for foo\n" + "=" * 26 + "\n")
+    )
+    pyproject = (pkg_dir / "pyproject.toml").read_text()
+    assert 'name = "pydra-foo"' in pyproject
+    assert 'readme = "README.rst"' in pyproject
+    assert 'test = [\n    "nipype2pydra",\n    "pytest",\n]' in pyproject
+    assert (pkg_dir / ".gitignore").read_text() == (
+        "*.pyc\n\n/pydra/tasks/foo/auto\n/pydra/tasks/foo/_version.py\n"
+    )
+    assert sorted(p.name for p in (pkg_dir / "pydra" / "tasks" / "foo").iterdir()) == [
+        "__init__.py",
+        "_version.py",
+    ]
+    assert (pkg_dir / "related-packages" / "conftest.py").exists()
+    assert (
+        pkg_dir / "related-packages" / "fileformats" / "fileformats" / "medimage_foo"
+    ).is_dir()
+    # Binary files are copied verbatim and files without placeholders are linked
+    assert (pkg_dir / "docs" / "logo.png").read_bytes() == b"\x89PNG\x00CHANGEME\xff"
+    assert (pkg_dir / "docs" / "plain.txt").samefile(
+        template_dir / "docs" / "plain.txt"
+    )
+    assert not (pkg_dir / "pyproject.toml").samefile(template_dir / "pyproject.toml")
+    assert not any("CHANGEME" in str(p) for p in pkg_dir.glob("**/*"))
+
+    wf_pkg_dir = initialise_task_repo(
+        tmp_path / "wf-output", template_dir, "bar", interface_only=False
+    )
+    assert not (wf_pkg_dir / "related-packages").exists()
+    assert [p.name for p in (wf_pkg_dir / "pydra" / "tasks" / "bar").iterdir()] == [
+        "__init__.py"
+    ]
+    assert not (wf_pkg_dir / "docs" / "plain.txt").samefile(
+        template_dir / "docs" / "plain.txt"
+    )
+
+
+def test_pkg_gen_update(tmp_path, cli_runner, monkeypatch):
+    for var in ("AUTHOR", "COMMITTER"):
+        monkeypatch.setenv(f"GIT_{var}_NAME", "nipype2pydra")
+        monkeypatch.setenv(f"GIT_{var}_EMAIL", "nipype2pydra@example.com")
+    spec_file = tmp_path / "spec.yaml"
+    spec_file.write_text(
+        "fsl:\n  interfaces:\n"
+        "  - nipype.interfaces.fsl.BET\n"
+        "  - nipype.interfaces.fsl.FLIRT\n"
+    )
+    output_dir = tmp_path / "output"
+    args = [
+        str(spec_file),
+        str(output_dir),
+        "--task-template",
+        str(make_tasks_template(tmp_path / "template")),
+    ]
+    result = cli_runner(pkg_gen, args)
+    assert result.exit_code == 0, show_cli_trace(result)
+    specs_dir = output_dir / "pydra-fsl" / "nipype-auto-conv" / "specs" / "interfaces"
+    bet_spec = specs_dir / "bet.yaml"
+    bet_stub = specs_dir / ".stubs" / "bet.yaml"
+    assert bet_spec.read_text() == bet_stub.read_text()
+    # Make the spec and its stub look like they were generated from an older version
+    # of BET, then edit the spec by hand
+    for fspath in (bet_spec, bet_stub):
+        fspath.write_text(
+            re.sub(
+                r"nipype-source-hash: \w+",
+                "nipype-source-hash: 0",
+                fspath.read_text().replace(
+                    "    out_file: medimage/nifti1", "    out_file: generic/file"
+                ),
+            )
+        )
+    bet_spec.write_text(bet_spec.read_text().replace("xfail: true", "xfail: false"))
+    flirt_spec = specs_dir / "flirt.yaml"
+    flirt_spec.write_text(flirt_spec.read_text() + "# hand-written comment\n")
+    (specs_dir / "flirt_callables.py").write_text("# edited by hand\n")
+
+    result = cli_runner(pkg_gen, args + ["--update"])
+    assert result.exit_code == 0, show_cli_trace(result)
+    assert "1 interfaces unchanged since last generated" in result.output
+    # Unchanged interfaces are skipped
+    assert flirt_spec.read_text().endswith("# hand-written comment\n")
+    # Changes to the interface are merged into the hand-edited spec
+    bet = bet_spec.read_text()
+    assert "nipype-source-hash: 0" not in bet
+    assert "    out_file: medimage/nifti1" in bet
+    assert "xfail: false" in bet
+    assert "xfail: true" not in bet
+    assert (specs_dir / "flirt_callables.py").read_text() == "# edited by hand\n"
+
+
+def test_three_way_merge():
+    from nipype2pydra.pkg_gen import three_way_merge
+
+    base = {"a": 1, "b": {"c": 2, "d": 3}, "e": [1], "f": 4}
+    ours = {"a": 1, "b": {"c": 20, "d": 3}, "e": [1, 2], "g": 5}
+    theirs = {"a": 10, "b": {"c": 2, "d": 30}, "e": [1, 3], "f": 4, "h": 6}
+    merged, conflicts = three_way_merge(base, ours, theirs)
+    assert merged == {"a": 10, "b": {"c": 20, "d": 30}, "e": [1, 2], "g": 5, "h": 6}
+    assert conflicts == ["e"]
+
+
+def test_callable_sources_memoised():
+    from nipype.interfaces.fsl import ApplyMask, Threshold
+    from nipype2pydra.pkg_gen import get_callable_sources, _process_callable_method
+
+    funcs, _, _, _ = get_callable_sources(ApplyMask)
+    hits = _process_callable_method.cache_info().hits
+    # Both interfaces inherit _list_outputs and _gen_filename from MathsCommand
+    assert get_callable_sources(Threshold)[0] == funcs
+    assert _process_callable_method.cache_info().hits > hits
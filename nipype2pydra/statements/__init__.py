@@ -21,4 +21,5 @@ from .misc import DocStringStatement, CommentStatement, ReturnStatement  # noqa:
 from .utility import (  # noqa: F401
     AddIdentityInterfaceStatement,
     AddFunctionInterfaceStatement,
+    FusedFunctionInterfaceStatement,
 )
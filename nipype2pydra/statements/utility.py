@@ -1,4 +1,7 @@
 import re
+import typing as ty
+from functools import cached_property
+from operator import attrgetter
 import attrs
 from .workflow_build import AddInterfaceStatement
 
@@ -23,6 +26,139 @@ class AddFunctionInterfaceStatement(AddInterfaceStatement):
             name_vals.append((name, val))
         return name_vals
 
+    @cached_property
+    def function_args(self) -> ty.Dict[str, str]:
+        """The keyword arguments passed to the nipype Function interface, empty if
+        any of them are passed positionally"""
+        kwargs = {}
+        for arg in self.args or []:
+            match = re.match(r"\s*(\w+)\s*=\s*(.*)", arg, flags=re.DOTALL)
+            if not match:
+                return {}
+            kwargs[match.group(1)] = match.group(2).strip()
+        return kwargs
+
+    @property
+    def input_names(self) -> ty.List[str]:
+        return to_fields_spec(self.function_args.get("input_names", "[]"))[0]
+
+    @property
+    def output_names(self) -> ty.List[str]:
+        return to_fields_spec(self.function_args.get("output_names", "'out'"))[0]
+
+    @property
+    def fusable(self) -> bool:
+        """Whether the node is a plain function node that can be fused with other
+        function nodes, i.e. it is unconditionally included, references a named
+        function and isn't split over or combined"""
+        kwargs = self.function_args
+        return bool(
+            self.include
+            and not self.conditional
+            and not self.splits
+            and not self.iterables
+            and not self.itersource
+            and not self.is_factory
+            and "function" in kwargs
+            and "input_names" in kwargs
+            and set(kwargs) <= {"function", "input_names", "output_names"}
+            and re.match(r"^\w+$", kwargs["function"])
+            and len(self.workflow_converter.nodes[self.name]) == 1
+        )
+
+
+@attrs.define(kw_only=True)
+class FusedFunctionInterfaceStatement(AddFunctionInterfaceStatement):
+    """A chain of single-consumer function nodes that have been fused into a single
+    FunctionTask, which takes the name and outputs of the final node in the chain and
+    the inputs of the first. As the fused functions run one after the other, the
+    resources requested for the fused node are the maximum of those of the chain"""
+
+    fused: ty.List[AddFunctionInterfaceStatement] = attrs.field()
+
+    @property
+    def include(self) -> bool:
+        # Only chains of included nodes are fused
+        return True
+
+    @property
+    def func_name(self) -> str:
+        return f"{self.name}_fused"
+
+    @property
+    def arg_name_vals(self):
+        head, tail = self.fused[0], self.fused[-1]
+        return [
+            ("func", self.func_name),
+            (
+                "input_spec",
+                "SpecInfo(name='FunctionIn', bases=(BaseSpec,), fields="
+                f"{to_fields_spec(str(head.input_names))[1]})",
+            ),
+            (
+                "output_spec",
+                "SpecInfo(name='FunctionOut', bases=(BaseSpec,), fields="
+                f"{to_fields_spec(str(tail.output_names))[1]})",
+            ),
+        ]
+
+    @property
+    def func_code(self) -> str:
+        """The nested function that composes the functions of the fused nodes"""
+        indent = self.indent + "    "
+        head = self.fused[0]
+        head_inputs = head.input_names
+        code_str = f"{self.indent}def {self.func_name}({', '.join(head_inputs)}):\n"
+        kwargs = {n: n for n in head_inputs}
+        for node, consumer in zip(self.fused, self.fused[1:] + [None]):
+            call = f"{node.function_args['function']}(" + ", ".join(
+                f"{n}={v}" for n, v in kwargs.items()
+            )
+            if consumer is None:
+                code_str += f"{indent}return {call})\n"
+                break
+            out_vars = [f"{node.name}_{o}" for o in node.output_names]
+            code_str += f"{indent}{', '.join(out_vars)} = {call})\n"
+            kwargs = {
+                c.target_in: f"{node.name}_{c.source_out}"
+                for c in sorted(consumer.in_conns, key=attrgetter("target_in"))
+                if c.include
+            }
+        return code_str
+
+    def __str__(self):
+        return f"\n{self.func_code}\n" + super().__str__()
+
+    @classmethod
+    def fuse(
+        cls, chain: ty.List[AddFunctionInterfaceStatement]
+    ) -> "FusedFunctionInterfaceStatement":
+        head, tail = chain[0], chain[-1]
+        return cls(
+            name=tail.name,
+            interface=tail.interface,
+            args=tail.args,
+            iterables=[],
+            itersource=None,
+            indent=tail.indent,
+            workflow_converter=tail.workflow_converter,
+            in_conns=head.in_conns,
+            out_conns=tail.out_conns,
+            index=tail.index,
+            n_procs=cls._max_resource([n.n_procs for n in chain]),
+            mem_gb=cls._max_resource([n.mem_gb for n in chain]),
+            fused=chain,
+        )
+
+    @staticmethod
+    def _max_resource(values: ty.List[ty.Optional[str]]) -> ty.Optional[str]:
+        """Combines the resource requirements (code expressions) of the fused nodes
+        into an expression for the maximum of them"""
+        values = list(dict.fromkeys(v for v in values if v))
+        if len(values) > 1:
+            return f"max({', '.join(values)})"
+        return values[0] if values else None
+
 
 @attrs.define
 class AddIdentityInterfaceStatement(AddInterfaceStatement):
@@ -1,4 +1,4 @@
-from functools import cached_property
+from functools import cached_property, lru_cache
 import re
 import typing as ty
 import inspect
@@ -148,16 +148,12 @@ class ConnectionStatement:
     target_in: ty.Union[str, VarField] = attrs.field()
     indent: str = attrs.field()
     workflow_converter: "WorkflowConverter" = attrs.field(repr=False)
-    include: bool = attrs.field(default=False)
     # wf_in: bool = False
     # wf_out: bool = False
 
     @classmethod
-    def match_re(cls, workflow_variable: str) -> bool:
-        return re.compile(
-            r"(\s*)" + workflow_variable + r"\.connect\(",
-            flags=re.MULTILINE | re.DOTALL,
-        )
+    def match_re(cls, workflow_variable: str) -> re.Pattern:
+        return _connect_re(workflow_variable)
 
     @classmethod
     def matches(cls, stmt, workflow_variable: str) -> bool:
@@ -197,6 +193,12 @@ class ConnectionStatement:
     def conditional(self):
         return len(self.indent) != 4
 
+    @property
+    def include(self) -> bool:
+        """Whether the connection is included in the converted workflow, as determined
+        by the pruning of the workflow"""
+        return self.workflow_converter.pruning[self]
+
     @property
     def lzouttable(self) -> bool:
         return (
@@ -218,10 +220,55 @@ class ConnectionStatement:
     def wf_out_name(self):
         return self.workflow_converter.get_output_from_conn(self).name
 
+    @property
+    def emitted(self) -> bool:
+        """Whether the connection is written to the converted workflow"""
+        return self.include and not (
+            self.wf_in
+            and not self.workflow_converter.pruning[
+                self.workflow_converter.inputs[self.source_out]
+            ]
+        )
+
+    @property
+    def dynamic_task_key(self) -> ty.Optional[ty.Tuple[str, str, str]]:
+        """The callable, source node and source output of a connection from a
+        dynamic field, which identify the task that applies the callable. None if the
+        connection isn't from a dynamic field or the task can't be shared with other
+        connections because the connection is conditional"""
+        if not isinstance(self.source_out, DynamicField) or self.conditional:
+            return None
+        if not re.match(r"^[\w\.]+$", self.source_out.callable):
+            return None
+        return (self.source_out.callable, self.source_name, self.source_out.varname)
+
+    @property
+    def shared_dynamic_conns(self) -> ty.List["ConnectionStatement"]:
+        """The emitted connections in the workflow that apply the same callable to the
+        same source output, and therefore share a single task, in statement order"""
+        key = self.dynamic_task_key
+        if key is None:
+            return []
+        return [
+            s
+            for s in self.workflow_converter.parsed_statements
+            if isinstance(s, ConnectionStatement)
+            and s.dynamic_task_key == key
+            and s.emitted
+        ]
+
+    @property
+    def dynamic_task_name(self) -> str:
+        if self.dynamic_task_key is None:
+            return (
+                f"{self.source_name}_{self.source_out.varname}_to_"
+                f"{self.target_name}_{self.target_in}_callable"
+            )
+        callable_name = self.source_out.callable.replace(".", "_").strip("_")
+        return f"{self.source_name}_{self.source_out.varname}_{callable_name}_callable"
+
     def __str__(self):
-        if not self.include or (
-            self.wf_in and not self.workflow_converter.inputs[self.source_out].include
-        ):
+        if not self.emitted:
             return f"{self.indent}pass" if self.conditional else ""
         code_str = ""
         # Get source lazy-field
@@ -231,14 +278,15 @@ class ConnectionStatement:
             src = f"{self.workflow_variable}.{self.source_name}.lzout.{self.source_out}"
         if isinstance(self.source_out, DynamicField):
             base_task_name = f"{self.source_name}_{self.source_out.varname}_to_{self.target_name}_{self.target_in}"
-            intf_name = f"{base_task_name}_callable"
-            code_str += (
-                f"\n{self.indent}@pydra.mark.task\n"
-                f"{self.indent}def {intf_name}(in_: ty.Any) -> ty.Any:\n"
-                f"{self.indent}    return {self.source_out.callable}(in_)\n\n"
-                f"{self.indent}{self.workflow_variable}.add("
-                f'{intf_name}(in_={src}, name="{intf_name}"))\n\n'
-            )
+            intf_name = self.dynamic_task_name
+            if not self.shared_dynamic_conns or self.shared_dynamic_conns[0] is self:
+                code_str += (
+                    f"\n{self.indent}@pydra.mark.task\n"
+                    f"{self.indent}def {intf_name}(in_: ty.Any) -> ty.Any:\n"
+                    f"{self.indent}    return {self.source_out.callable}(in_)\n\n"
+                    f"{self.indent}{self.workflow_variable}.add("
+                    f'{intf_name}(in_={src}, name="{intf_name}"))\n\n'
+                )
             src = f"{self.workflow_variable}.{intf_name}.lzout.out"
             dynamic_src = True
         else:
@@ -335,7 +383,6 @@ class AddNodeStatement:
     workflow_converter: "WorkflowConverter" = attrs.field(repr=False)
     in_conns: ty.List[ConnectionStatement] = attrs.field(factory=list)
     out_conns: ty.List[ConnectionStatement] = attrs.field(factory=list)
-    include: bool = attrs.field(default=False)
     index: int = attrs.field()
 
     @index.default
@@ -346,6 +393,12 @@ class AddNodeStatement:
     def conditional(self):
         return len(self.indent) != 4
 
+    @property
+    def include(self) -> bool:
+        """Whether the node is included in the converted workflow, as determined by
+        the pruning of the workflow"""
+        return self.workflow_converter.pruning[self]
+
     @cached_property
     def workflow_variable(self):
         return self.workflow_converter.workflow_variable
@@ -418,6 +471,8 @@ class AddInterfaceStatement(AddNodeStatement):
     )
 
     is_factory: bool = attrs.field(default=False)
+    n_procs: ty.Optional[str] = attrs.field(default=None)
+    mem_gb: ty.Optional[str] = attrs.field(default=None)
 
     @property
     def inputs(self):
@@ -481,6 +536,7 @@ class AddInterfaceStatement(AddNodeStatement):
                 + ", ".join(self.split_args)
                 + ")"
             )
+        code_str += self.resource_hints
         if self.iterables:
             raise NotImplementedError(
                 f"iterables not yet implemented (see {self.name} node) in "
@@ -493,6 +549,36 @@ class AddInterfaceStatement(AddNodeStatement):
             )
         return code_str
 
+    @property
+    def resource_hints(self) -> str:
+        """Statements that carry the resource requirements of the nipype node over to
+        the pydra node. Pydra's SGE worker reads the number of slots and memory to
+        request from the `qsub_args` attribute of the task. The SLURM and Dask workers
+        don't support per-task requests and `run_without_submitting` has no pydra
+        equivalent, so they are dropped (see "Limitations" in the README and the help
+        of the convert command). The node is looked up by name so that
+        node names that clash with `Workflow` methods (e.g. "add" or "split") don't
+        resolve to the method instead"""
+        code_str = ""
+        if self.is_factory:
+            node = self.name
+        else:
+            node = f'{self.workflow_variable}.name2obj["{self.name}"]'
+        qsub_args, qsub_vals = [], []
+        if self.n_procs:
+            qsub_args.append("-pe smp {}")
+            qsub_vals.append(self.n_procs)
+        if self.mem_gb:
+            qsub_args.append("-l mem_free={}M")
+            qsub_vals.append(f"int(({self.mem_gb}) * 1000)")
+        if qsub_args:
+            code_str += (
+                f'\n{self.indent}{node}.qsub_args = "{" ".join(qsub_args)}".format('
+                + ", ".join(qsub_vals)
+                + ")"
+            )
+        return code_str
+
     SIGNATURE = [
         "interface",
         "name",
@@ -536,6 +622,13 @@ class AddInterfaceStatement(AddNodeStatement):
             iterables = []
 
         splits = node_kwargs["iterfield"] if match.group(3) else None
+        if node_kwargs.get("run_without_submitting", "False") != "False":
+            logger.warning(
+                "'%s' node of '%s' workflow is flagged to run without submitting, which "
+                "has no pydra equivalent, so it will be submitted like any other task",
+                varname,
+                workflow_converter.name,
+            )
         if intf_name.endswith("("):  # strip trailing parenthesis
             intf_name = intf_name[:-1]
         try:
@@ -562,6 +655,8 @@ class AddInterfaceStatement(AddNodeStatement):
             workflow_converter=workflow_converter,
             indent=indent,
             is_factory=is_factory,
+            n_procs=node_kwargs.get("n_procs"),
+            mem_gb=node_kwargs.get("mem_gb"),
         )
 
 
@@ -598,11 +693,8 @@ class AddNestedWorkflowStatement(AddNodeStatement):
         return f"{self.indent}{self.workflow_variable}.add({self.workflow_name}({args_str}))"
 
     @classmethod
-    def match_re(cls, workflow_symbols: ty.List[str]):
-        return re.compile(
-            r"(\s+)(\w+) = (" + "|".join(workflow_symbols) + r")\(",
-            flags=re.MULTILINE,
-        )
+    def match_re(cls, workflow_symbols: ty.List[str]) -> re.Pattern:
+        return _nested_workflow_re(tuple(workflow_symbols))
 
     @classmethod
     def matches(cls, stmt, workflow_symbols: ty.List[str]) -> bool:
@@ -619,7 +711,11 @@ class AddNestedWorkflowStatement(AddNodeStatement):
         return AddNestedWorkflowStatement(
             name=varname,
             workflow_name=wf_name,
-            nested_workflow=workflow_converter.nested_workflows.get(wf_name),
+            # Factories called via the module they are imported from, e.g.
+            # "anat.init_anat_wf(...)", are looked up by their name
+            nested_workflow=workflow_converter.nested_workflows.get(
+                wf_name, workflow_converter.nested_workflows.get(wf_name.split(".")[-1])
+            ),
             args=extract_args(statement)[1],
             indent=indent,
             workflow_converter=workflow_converter,
@@ -785,10 +881,7 @@ class NodeAssignmentStatement:
 
     @classmethod
     def match_re(cls, node_names: ty.List[str]) -> re.Pattern:
-        return re.compile(
-            r"(\s*)(" + "|".join(node_names) + r")\b([\w\.]+)\s*=\s*(.*)",
-            flags=re.MULTILINE | re.DOTALL,
-        )
+        return _node_assignment_re(tuple(node_names))
 
     @classmethod
     def matches(cls, stmt, node_names: ty.List[str]) -> bool:
@@ -831,8 +924,8 @@ class WorkflowInitStatement:
     workflow_converter: "WorkflowConverter"
 
     match_re = re.compile(
-        r"\s+(\w+)\s*=.*\bWorkflow\(.*name\s*=\s*([^,=\)]+)",
-        flags=re.MULTILINE,
+        r"\s+(\w+)\s*=.*?\bWorkflow\(.*?\bname\s*=\s*([^,=\)\s]+)",
+        flags=re.MULTILINE | re.DOTALL,
     )
 
     @classmethod
@@ -877,6 +970,30 @@ class WorkflowInitStatement:
         )
 
 
+@lru_cache(maxsize=None)
+def _connect_re(workflow_variable: str) -> re.Pattern:
+    return re.compile(
+        r"(\s*)" + workflow_variable + r"\.connect\(",
+        flags=re.MULTILINE | re.DOTALL,
+    )
+
+
+@lru_cache(maxsize=None)
+def _nested_workflow_re(workflow_symbols: ty.Tuple[str, ...]) -> re.Pattern:
+    return re.compile(
+        r"(\s+)(\w+)\s*=\s*((?:\w+\.)*(?:" + "|".join(workflow_symbols) + r"))\(",
+        flags=re.MULTILINE,
+    )
+
+
+@lru_cache(maxsize=None)
+def _node_assignment_re(node_names: ty.Tuple[str, ...]) -> re.Pattern:
+    return re.compile(
+        r"(\s*)(" + "|".join(node_names) + r")\b([\w\.]+)\s*=\s*(.*)",
+        flags=re.MULTILINE | re.DOTALL,
+    )
+
+
 def match_kwargs(args: ty.List[str], sig: ty.List[str]) -> ty.Dict[str, str]:
     """Matches up the args with given signature"""
     kwargs = {}
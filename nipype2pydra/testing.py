@@ -3,11 +3,24 @@ def for_testing_line_number_of_function():
     return 1
 
 
+import os  # noqa: E402
+import re  # noqa: E402
+import shlex  # noqa: E402
+import time  # noqa: E402
+import signal  # noqa: E402
 import logging  # noqa: E402
 import asyncio  # noqa: E402
+import typing as ty  # noqa: E402
+import weakref  # noqa: E402
+import functools  # noqa: E402
+import multiprocessing as mp  # noqa: E402
+from copy import copy  # noqa: E402
 from pydra.engine.core import Result, TaskBase  # noqa: E402
-from pydra.engine.workers import ConcurrentFuturesWorker  # noqa: E402
-
+from pydra.engine.workers import (  # noqa: E402
+    Worker,
+    ConcurrentFuturesWorker,
+    load_and_run,
+)
 
 logger = logging.getLogger("pydra")
 
@@ -49,3 +62,196 @@ class PassAfterTimeoutWorker(ConcurrentFuturesWorker):
                 self.timeout,
             )
         return result
+
+
+class ProcessGroupTimeoutWorker(Worker):
+    """A worker used to test the start-up phase of long running tasks, which runs
+    multiple tasks concurrently, each in its own process group so that the tool and any
+    processes it has spawned can be killed together once the timeout is reached.
+
+    If the task completes before the timeout then results are returned as normal, if
+    not, then None is returned instead. The time each task took to start, i.e. from when
+    it was submitted to when it began executing in its own process, is logged and
+    recorded in `start_times`.
+
+    Instances are callable (returning themselves), so a single instance can be passed as
+    the plugin to multiple tasks, e.g. from a session-scoped fixture, and reused
+    between them. Call `shutdown` once it is no longer required to kill any remaining
+    processes.
+
+    Parameters
+    ----------
+    timeout : float
+        the time (s) to wait for each task before killing it and assuming it has run
+        successfully. Set to 0 to wait until it completes
+    n_procs : int, optional
+        the maximum number of tasks to run concurrently, by default the number of CPUs
+    """
+
+    plugin_name = "process-group-timeout"
+
+    def __init__(self, timeout: float = 10, n_procs: ty.Optional[int] = None):
+        super().__init__()
+        self.timeout = timeout
+        self.n_procs = n_procs if n_procs is not None else (os.cpu_count() or 1)
+        self.start_times: ty.Dict[str, float] = {}
+        self._processes: ty.Set[mp.Process] = set()
+        # Submitters each run their own event loop, which the semaphores are bound to
+        self._semaphores = weakref.WeakKeyDictionary()
+
+    def __call__(self, timeout: ty.Optional[float] = None, **kwargs):
+        """Returns the worker (or a copy of it sharing the same processes with a different
+        timeout) when it is passed as the plugin to a task"""
+        if timeout is None or timeout == self.timeout:
+            return self
+        worker = copy(self)
+        worker.timeout = timeout
+        return worker
+
+    def run_el(self, runnable, rerun=False, environment=None, **kwargs):
+        """Run a task."""
+        return self.exec_with_timeout(runnable, rerun=rerun, environment=environment)
+
+    async def exec_with_timeout(self, runnable, rerun=False, environment=None):
+        if isinstance(runnable, TaskBase):
+            name = runnable.name
+            func, args = runnable._run, (rerun, environment)
+        else:  # it could be tuple that includes pickle files with tasks and inputs
+            ind, task_main_pkl, task_orig = runnable
+            name = f"{task_orig.name}[{ind}]"
+            func, args = load_and_run, (task_main_pkl, ind, rerun, environment)
+        try:
+            semaphore = self._semaphores[self.loop]
+        except KeyError:
+            semaphore = self._semaphores[self.loop] = asyncio.Semaphore(self.n_procs)
+        async with semaphore:
+            submitted = time.time()
+            receiver, sender = mp.Pipe(duplex=False)
+            process = mp.Process(
+                target=_run_in_process_group, args=(sender, func, args), daemon=True
+            )
+            process.start()
+            sender.close()
+            self._processes.add(process)
+            try:
+                return await self._receive_result(name, process, receiver, submitted)
+            finally:
+                self._kill(process)
+                receiver.close()
+
+    async def _receive_result(self, name, process, receiver, submitted):
+        recv = functools.partial(self.loop.run_in_executor, None, receiver.recv)
+        try:
+            _, started = await recv()
+        except EOFError:
+            raise RuntimeError(
+                f"Process running '{name}' task exited before it started"
+            ) from None
+        self.start_times[name] = started - submitted
+        logger.info("'%s' task started after %.3f seconds", name, started - submitted)
+        try:
+            status, value = await asyncio.wait_for(
+                recv(), timeout=(self.timeout or None)
+            )
+        except asyncio.TimeoutError:
+            logger.debug(
+                "Killing '%s' task after timeout of %s seconds and assuming it has "
+                "run successfully",
+                name,
+                self.timeout,
+            )
+            return Result(output=None, runtime=None, errored=False)
+        except EOFError:
+            raise RuntimeError(
+                f"Process running '{name}' task exited unexpectedly with exit code "
+                f"{process.exitcode}"
+            ) from None
+        if status == "error":
+            raise value
+        logger.debug(
+            "'%s' task completed successfully within the timeout period of %s seconds",
+            name,
+            self.timeout,
+        )
+        return value
+
+    def _kill(self, process: mp.Process):
+        """Kills the process group of a task, i.e. the tool it ran and any processes
+        spawned by the tool"""
+        if process.is_alive():
+            try:
+                os.killpg(process.pid, signal.SIGKILL)
+            except (ProcessLookupError, PermissionError):
+                pass
+        process.join()
+        self._processes.discard(process)
+
+    def close(self):
+        """Processes are killed as each task completes or times out, so there is
+        nothing to do when the submitter is closed (see `shutdown`)"""
+
+    def shutdown(self):
+        """Kills any remaining processes"""
+        for process in list(self._processes):
+            self._kill(process)
+        logger.info(
+            "Tasks took %.3f seconds to start on average",
+            sum(self.start_times.values()) / max(len(self.start_times), 1),
+        )
+
+
+def _run_in_process_group(sender, func, args):
+    """Runs a task in a new process group, sending the time it started and then its
+    result (or the exception it raised) back to the parent process"""
+    os.setsid()
+    sender.send(("started", time.time()))
+    try:
+        result = ("result", func(*args))
+    except Exception as e:
+        result = ("error", e)
+    sender.send(result)
+
+
+def cmdline_matches(cmdline: str, expected: str, ellipsis: bool = False) -> bool:
+    """Checks whether the command line constructed by a task matches the one expected
+    by a Nipype doctest, ignoring the directories of any file paths within them.
+
+    Pydra passes file paths to the tool as absolute paths (e.g. in the directory the
+    file was mocked in or the output directory of the task), so the directories are
+    stripped from any file paths in both command lines before they are compared. The
+    order of the arguments and the file extensions still have to match.
+
+    Parameters
+    ----------
+    cmdline : str
+        the command line constructed by the task
+    expected : str
+        the command line expected by the doctest
+    ellipsis : bool
+        whether the expected command line can contain '...' (i.e. the doctest has the
+        ELLIPSIS directive), which matches any part of the command line as it does in
+        doctests
+
+    Returns
+    -------
+    bool
+        whether the command lines match
+    """
+    normalised = " ".join(_normalise_cmdline(cmdline))
+    expected = " ".join(_normalise_cmdline(expected))
+    if not ellipsis:
+        return normalised == expected
+    pattern = ".*".join(re.escape(p) for p in expected.split("..."))
+    return re.fullmatch(pattern, normalised, flags=re.DOTALL) is not None
+
+
+def _normalise_cmdline(cmdline: str) -> ty.List[str]:
+    """Splits a command line into its arguments, stripping the directories from any
+    file paths within them"""
+    try:
+        args = shlex.split(cmdline)
+    except ValueError:
+        args = cmdline.split()
+    # Paths can be arguments on their own or values within them, e.g. '--in=<path>'
+    # or comma-separated lists of paths
+    return [re.sub(r"(?<![^=,:'\"])[^\s=,:'\"]*/(?=[^/\s=,:'\"])", "", a) for a in args]
@@ -0,0 +1,170 @@
+import json
+from nipype2pydra.cli import bench_import, bench_convert, bench_compare
+from nipype2pydra.benchmark import (
+    parse_importtime,
+    find_package_modules,
+    compare_benchmarks,
+    MemoryProfile,
+)
+from nipype2pydra.utils import show_cli_trace
+from conftest import EXAMPLE_SPECS_DIR
+
+IMPORTTIME_STDERR = """import time: self [us] | cumulative | imported package
+import time:       120 |        120 |   _io
+import time:      1500 |       1500 |     yaml.error
+import time:      2500 |       4000 |   yaml
+import time:       300 |       4420 | pydra.tasks.dummy
+"""
+
+
+def test_parse_importtime():
+    assert parse_importtime(IMPORTTIME_STDERR) == {
+        "_io": 0.00012,
+        "yaml": 0.004,
+        "pydra": 0.0003,
+    }
+
+
+def make_dummy_package(root):
+    pkg_dir = root / "pydra" / "tasks" / "dummy"
+    (pkg_dir / "auto" / "tests").mkdir(parents=True)
+    (pkg_dir / "__init__.py").write_text("from .auto import task\n")
+    (pkg_dir / "auto" / "__init__.py").write_text("import json\n")
+    (pkg_dir / "auto" / "task.py").write_text("import yaml\n")
+    (pkg_dir / "auto" / "tests" / "test_task.py").write_text("")
+    return pkg_dir
+
+
+def test_find_package_modules(tmp_path):
+    make_dummy_package(tmp_path)
+    assert find_package_modules(tmp_path) == [
+        "pydra.tasks.dummy",
+        "pydra.tasks.dummy.auto",
+        "pydra.tasks.dummy.auto.task",
+    ]
+
+
+def test_bench_import(tmp_path, cli_runner):
+    make_dummy_package(tmp_path)
+    budget_file = tmp_path / "budget.yaml"
+    budget_file.write_text("pydra.tasks.dummy.auto.*:\n  warm_time: 100\n")
+    json_file = tmp_path / "results.json"
+    result = cli_runner(
+        bench_import,
+        [
+            str(tmp_path),
+            "--repeat",
+            "1",
+            "--budget",
+            str(budget_file),
+            "--json",
+            str(json_file),
+        ],
+    )
+    assert result.exit_code == 0, show_cli_trace(result)
+    results = json.loads(json_file.read_text())
+    assert [r["module"] for r in results] == [
+        "pydra.tasks.dummy",
+        "pydra.tasks.dummy.auto",
+        "pydra.tasks.dummy.auto.task",
+    ]
+    assert "yaml" in results[0]["dependencies"]
+
+    budget_file.write_text("pydra.tasks.dummy:\n  warm_time: 0\n")
+    result = cli_runner(
+        bench_import,
+        [
+            str(tmp_path),
+            "--top-level-only",
+            "--repeat",
+            "1",
+            "--budget",
+            str(budget_file),
+        ],
+        catch_exceptions=True,
+    )
+    assert result.exit_code == 1
+    assert "Import budget exceeded" in result.output
+
+
+def benchmark_results(**medians):
+    return {
+        "metadata": {},
+        "benchmarks": {
+            name: {
+                "times": [median] if median else [],
+                "best": median,
+                "median": median,
+                "error": None if median else "RuntimeError: failed",
+            }
+            for name, median in medians.items()
+        },
+    }
+
+
+def test_compare_benchmarks():
+    report, regressions = compare_benchmarks(
+        benchmark_results(a=1.0, b=1.0, c=1.0, d=1.0),
+        benchmark_results(a=1.05, b=1.5, c=0.5, d=None, e=1.0),
+        threshold=0.1,
+    )
+    assert len(report.splitlines()) == 6
+    assert regressions == [
+        "b: 1.5000s vs 1.0000s (1.50x)",
+        "d: failed (RuntimeError: failed)",
+    ]
+
+
+def test_bench_convert(tmp_path, cli_runner):
+    json_file = tmp_path / "results.json"
+    result = cli_runner(
+        bench_convert,
+        [
+            "--specs-dir",
+            str(EXAMPLE_SPECS_DIR),
+            "--filter",
+            "micro.*",
+            "--repeat",
+            "1",
+            "--json",
+            str(json_file),
+        ],
+    )
+    assert result.exit_code == 0, show_cli_trace(result)
+    results = json.loads(json_file.read_text())
+    assert set(results["benchmarks"]) == {
+        "micro.split_source_into_statements",
+        "micro.extract_args",
+        "micro.parse_imports",
+        "micro.UsedSymbols.find",
+        "micro.ImportStatement.collate",
+        "micro.replace_undefined",
+    }
+    assert all(len(r["times"]) == 1 for r in results["benchmarks"].values())
+
+    result = cli_runner(bench_compare, [str(json_file), str(json_file)])
+    assert result.exit_code == 0, show_cli_trace(result)
+
+    slower_file = tmp_path / "slower.json"
+    for r in results["benchmarks"].values():
+        r["median"] *= 2
+    slower_file.write_text(json.dumps(results))
+    result = cli_runner(
+        bench_compare, [str(json_file), str(slower_file)], catch_exceptions=True
+    )
+    assert result.exit_code == 1
+    assert "Conversion performance regressed" in result.output
+
+
+def test_memory_profile():
+    profile = MemoryProfile(n_top=2)
+    with profile.stage("allocate"):
+        held = [bytearray(1024) for _ in range(1024)]  # noqa: F841
+    with profile.stage("nothing"):
+        pass
+    allocate, nothing = profile.stages
+    assert allocate.traced_peak >= 1
+    assert len(allocate.top_allocations) == 2
+    assert "test_benchmark.py" in allocate.top_allocations[0][0]
+    assert nothing.traced_peak < allocate.traced_peak
+    assert "allocate" in profile.report()
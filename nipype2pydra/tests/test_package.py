@@ -1,11 +1,20 @@
 import sys
+import json
 import shutil
+from importlib import import_module
 import subprocess as sp
 import pytest
 import toml
-from nipype2pydra.cli import pkg_gen, convert
-from nipype2pydra.utils import show_cli_trace
-from conftest import EXAMPLE_WORKFLOWS_DIR, EXAMPLE_PKG_GEN_DIR
+import yaml
+from nipype2pydra.cli import pkg_gen, convert, convert_batch
+from nipype2pydra.utils import show_cli_trace, UsedSymbols
+from nipype2pydra.package import PackageConverter
+from nipype2pydra.statements import parse_imports
+from conftest import (
+    EXAMPLE_WORKFLOWS_DIR,
+    EXAMPLE_PKG_GEN_DIR,
+    EXAMPLE_INTERFACES_DIR,
+)
 
 
 ADDITIONAL_PACKAGES = {
@@ -111,3 +120,272 @@ def test_package_complete(package_spec, cli_runner, tmp_path, tasks_template_arg
     assert (
         p.returncode
     ), f"Tests for pydra-{pkg_name} package (\n{' '.join(pip_cmd)}) failed:\n\n{pytest_output}"
+
+
+def test_write_pkg_inits_lazy(tmp_path):
+    pkg = PackageConverter(name="lazypkg", nipype_name="nipype")
+    for mod_name, func_name in [("a", "func_a"), ("b", "func_b")]:
+        mod_dir = tmp_path / "lazypkg" / "sub"
+        mod_dir.mkdir(parents=True, exist_ok=True)
+        (mod_dir / f"{mod_name}.py").write_text(f"def {func_name}():\n    return 1\n")
+        pkg.write_pkg_inits(
+            tmp_path,
+            f"lazypkg.sub.{mod_name}",
+            names=[func_name],
+            depth=1,
+            auto_import_depth=1,
+            lazy=True,
+        )
+    init_code = (tmp_path / "lazypkg" / "__init__.py").read_text()
+    assert "from .sub import func_a, func_b" in init_code
+    assert init_code.count("def __getattr__(") == 1
+    sys.path.insert(0, str(tmp_path))
+    try:
+        lazypkg = import_module("lazypkg")
+        assert "lazypkg.sub.a" not in sys.modules
+        assert "func_a" in dir(lazypkg)
+        assert lazypkg.func_a() == 1
+        assert "lazypkg.sub.a" in sys.modules
+        assert "lazypkg.sub.b" not in sys.modules
+        with pytest.raises(AttributeError):
+            lazypkg.func_c
+    finally:
+        sys.path.remove(str(tmp_path))
+        for mod in [m for m in sys.modules if m.startswith("lazypkg")]:
+            del sys.modules[mod]
+
+
+def test_write_to_module_local_imports(tmp_path):
+    pkg = PackageConverter(
+        name="localpkg", nipype_name="nipype", local_import_modules=["xml"]
+    )
+    converted_code = '''
+@pydra.mark.task
+def plot(in_file: File) -> Path:
+    """Plots the file"""
+    out = minidom.parseString(in_file)
+    return json.dumps(out)
+
+
+def parse(in_str: str, dom: ElementTree.Element = None):
+    return minidom.parseString(in_str), dom
+'''
+    pkg.write_to_module(
+        package_root=tmp_path,
+        module_name="localpkg.plotting",
+        used=UsedSymbols(
+            module_name="nipype.plotting",
+            imports=set(
+                parse_imports(
+                    [
+                        "import json",
+                        "from xml.dom import minidom",
+                        "from xml.etree import ElementTree",
+                    ]
+                )
+            ),
+        ),
+        converted_code=converted_code,
+    )
+    code = (tmp_path / "localpkg" / "plotting.py").read_text()
+    assert "\nimport json\n" in code
+    # Referenced in a signature so has to stay at module level
+    assert "\nfrom xml.etree import ElementTree\n" in code
+    assert "\nfrom xml.dom import minidom\n" not in code
+    assert (
+        '    """Plots the file"""\n'
+        "    from xml.dom import minidom\n"
+        "    out = minidom.parseString(in_file)"
+    ) in code
+    assert "):\n    from xml.dom import minidom\n    return minidom" in code
+
+
+def test_convert_batch(tmp_path, cli_runner):
+    batch = []
+    for pkg_name in ["batcha", "batchb"]:
+        specs_dir = tmp_path / pkg_name / "specs"
+        (specs_dir / "interfaces").mkdir(parents=True)
+        (specs_dir / "package.yaml").write_text(
+            f"name: pydra.tasks.{pkg_name}\n"
+            "nipype_name: nipype.interfaces.afni\n"
+            "interface_only: true\n"
+        )
+        for fname in ["autobox.yaml", "autobox_callables.py"]:
+            shutil.copy(
+                EXAMPLE_INTERFACES_DIR / "afni" / fname, specs_dir / "interfaces"
+            )
+        pkg_root = tmp_path / pkg_name / "repo"
+        (pkg_root / "pydra" / "tasks" / pkg_name / "auto").mkdir(parents=True)
+        batch.append(f"- specs_dir: {pkg_name}/specs\n  package_root: {pkg_name}/repo")
+    # A package whose specs don't exist, which shouldn't stop the others converting
+    batch.append("- specs_dir: missing/specs\n  package_root: missing/repo")
+    batch_file = tmp_path / "batch.yaml"
+    batch_file.write_text("\n".join(batch) + "\n")
+    json_file = tmp_path / "results.json"
+    result = cli_runner(
+        convert_batch,
+        ["--batch-file", str(batch_file), "--json", str(json_file)],
+        catch_exceptions=True,
+    )
+    assert result.exit_code == 1
+    assert "Failed to convert 1 of 3 packages" in result.output
+    results = json.loads(json_file.read_text())
+    assert [r["error"] is None for r in results] == [True, True, False]
+    if results[0]["peak_rss"] is not None:
+        # The peak RSS of the process can only grow over the batch
+        assert [r["peak_rss"] for r in results] == sorted(
+            r["peak_rss"] for r in results
+        )
+        assert all(0 <= r["rss_growth"] <= r["peak_rss"] for r in results)
+    assert "process peak RSS (MB)" in result.output
+    for pkg_name in ["batcha", "batchb"]:
+        pkg_dir = tmp_path / pkg_name / "repo" / "pydra" / "tasks" / pkg_name
+        assert (pkg_dir / "auto" / "utils" / "autobox.py").exists()
+
+
+@pytest.mark.parametrize("include_helper", [False, True])
+def test_write_to_include_closure(tmp_path, include_helper):
+    pkg = PackageConverter(
+        name="pydra.tasks.closure",
+        nipype_name="nipype.interfaces.afni",
+        interface_only=True,
+    )
+    for name in ["autobox", "automask"]:
+        with open(EXAMPLE_INTERFACES_DIR / "afni" / f"{name}.yaml") as f:
+            spec = yaml.safe_load(f)
+        pkg.add_interface_from_spec(
+            spec=spec,
+            callables_file=EXAMPLE_INTERFACES_DIR / "afni" / f"{name}_callables.py",
+        )
+    pkg.add_function_from_spec(
+        {
+            "name": "no_afni",
+            "nipype_name": "no_afni",
+            "nipype_module": "nipype.interfaces.afni.base",
+        }
+    )
+    to_include = ["nipype.interfaces.afni.utils.Autobox"]
+    if include_helper:
+        to_include.append("nipype.interfaces.afni.base.no_afni")
+    pkg.write(tmp_path, to_include)
+    auto_dir = tmp_path / "pydra" / "tasks" / "closure" / "auto"
+    assert (auto_dir / "utils" / "autobox.py").exists()
+    # Neither the interface nor the helper function are dependencies of Autobox
+    assert not (auto_dir / "preprocess" / "automask.py").exists()
+    assert (auto_dir / "base.py").exists() == include_helper
+
+
+def test_write_to_include_referenced_interface(tmp_path, monkeypatch):
+    from nipype.interfaces.afni.preprocess import Automask
+    from nipype2pydra.interface import ShellCommandInterfaceConverter
+
+    generate_code = ShellCommandInterfaceConverter.generate_code
+
+    def generate_code_referencing_automask(self, *args, **kwargs):
+        code, used = generate_code(self, *args, **kwargs)
+        if self.task_name == "Autobox":
+            used.intra_pkg_classes.append(("Automask", Automask))
+        return code, used
+
+    # Only Autobox is included, but it references Automask, which has to be converted
+    # too as it would otherwise be a dangling import
+    monkeypatch.setattr(
+        ShellCommandInterfaceConverter,
+        "generate_code",
+        generate_code_referencing_automask,
+    )
+    pkg = PackageConverter(
+        name="pydra.tasks.referenced",
+        nipype_name="nipype.interfaces.afni",
+        interface_only=True,
+    )
+    for name in ["autobox", "automask", "bandpass"]:
+        with open(EXAMPLE_INTERFACES_DIR / "afni" / f"{name}.yaml") as f:
+            spec = yaml.safe_load(f)
+        pkg.add_interface_from_spec(
+            spec=spec,
+            callables_file=EXAMPLE_INTERFACES_DIR / "afni" / f"{name}_callables.py",
+        )
+    pkg.write(tmp_path, ["nipype.interfaces.afni.utils.Autobox"])
+    auto_dir = tmp_path / "pydra" / "tasks" / "referenced" / "auto"
+    assert (auto_dir / "utils" / "autobox.py").exists()
+    assert (auto_dir / "preprocess" / "automask.py").exists()
+    assert not (auto_dir / "preprocess" / "bandpass.py").exists()
+
+
+def test_write_shards_merge(tmp_path):
+    def afni_converter():
+        pkg = PackageConverter(
+            name="pydra.tasks.sharded",
+            nipype_name="nipype.interfaces.afni",
+            interface_only=True,
+        )
+        for name in ["autobox", "automask", "bandpass", "copy"]:
+            with open(EXAMPLE_INTERFACES_DIR / "afni" / f"{name}.yaml") as f:
+                spec = yaml.safe_load(f)
+            pkg.add_interface_from_spec(
+                spec=spec,
+                callables_file=EXAMPLE_INTERFACES_DIR / "afni" / f"{name}_callables.py",
+            )
+        pkg.add_function_from_spec(
+            {
+                "name": "no_afni",
+                "nipype_name": "no_afni",
+                "nipype_module": "nipype.interfaces.afni.base",
+            }
+        )
+        return pkg
+
+    afni_converter().write(tmp_path / "unsharded")
+    shard_roots = []
+    for i in range(2):
+        shard_root = tmp_path / f"shard-{i + 1}-of-2"
+        afni_converter().write(shard_root, shard=(i, 2))
+        shard_roots.append(shard_root)
+    afni_converter().merge_shards(tmp_path / "merged", shard_roots)
+
+    def read_tree(root):
+        return {
+            str(p.relative_to(root)): p.read_text()
+            for p in root.rglob("*.py")
+            if "__pycache__" not in p.parts
+        }
+
+    unsharded = read_tree(tmp_path / "unsharded")
+    assert set(read_tree(shard_roots[0])) != set(read_tree(shard_roots[1]))
+    assert read_tree(tmp_path / "merged") == unsharded
+    assert "pydra/tasks/sharded/auto/base.py" in unsharded
+
+
+def test_merge_shard_modules(tmp_path):
+    dest_fspath = tmp_path / "helpers.py"
+    dest_fspath.write_text(
+        "import os\n\n\n"
+        'SUFFIX = "_out"\n\n\n'
+        "def fname(name):\n"
+        "    return os.path.join(name, SUFFIX)  # join\n"
+    )
+    src_fspath = tmp_path / "shard.py"
+    src_fspath.write_text(
+        "import os\nimport re\n\n\n"
+        "SUFFIX = '_out'\n\n\n"
+        "def fname(name):\n"
+        "    return os.path.join(\n"
+        "        name, SUFFIX\n"
+        "    )\n\n\n"
+        "@staticmethod\n"
+        "def strip(name):\n"
+        '    return re.sub("_out$", "", name)\n'
+    )
+    converter = PackageConverter(name="pydra.tasks.merged", nipype_name="merged")
+    converter._merge_module(src_fspath, dest_fspath, "pydra.tasks.merged.helpers")
+    merged = dest_fspath.read_text()
+    # Differently formatted versions of the same definitions aren't duplicated
+    assert merged.count("SUFFIX = ") == 1
+    assert merged.count("def fname(") == 1
+    assert "@staticmethod\ndef strip(name):" in merged
+    assert "import re" in merged
+
+    src_fspath.write_text("def fname(name):\n    return name\n")
+    with pytest.raises(RuntimeError, match=r"define \['fname'\] differently"):
+        converter._merge_module(src_fspath, dest_fspath, "pydra.tasks.merged.helpers")
@@ -0,0 +1,95 @@
+import os
+import time
+import pytest
+from pydra.engine import ShellCommandTask
+from nipype2pydra.testing import ProcessGroupTimeoutWorker, cmdline_matches
+
+
+def test_process_group_timeout_worker(tmp_path):
+    pid_file = tmp_path / "pid.txt"
+    script = tmp_path / "spawn.sh"
+    script.write_text(f"#!/bin/sh\nsleep 60 &\necho $! > {pid_file}\nsleep 60\n")
+    script.chmod(0o755)
+    worker = ProcessGroupTimeoutWorker(timeout=1)
+    start = time.time()
+    task = ShellCommandTask(name="spawn", executable=str(script), cache_dir=tmp_path)
+    assert task(plugin=worker) is None
+    assert time.time() - start < 30
+    # The process spawned in the background by the tool should also have been killed
+    spawned_pid = int(pid_file.read_text())
+    for _ in range(50):
+        try:
+            os.kill(spawned_pid, 0)
+        except ProcessLookupError:
+            break
+        time.sleep(0.1)
+    else:
+        assert False, f"Process {spawned_pid} spawned by the task is still running"
+    task = ShellCommandTask(
+        name="echo", executable="echo", args="hello", cache_dir=tmp_path
+    )
+    result = task(plugin=worker, plugin_kwargs={"timeout": 0})
+    assert result.output.stdout == "hello\n"
+    assert set(worker.start_times) == {"spawn", "echo"}
+    worker.shutdown()
+
+
+@pytest.mark.parametrize(
+    "expected,ellipsis,matches",
+    [
+        (
+            "3dAutobox -input structural.nii -npad 5 -prefix structural_autobox.nii",
+            0,
+            1,
+        ),
+        (
+            "3dAutobox -input structural.nii -npad 6 -prefix structural_autobox.nii",
+            0,
+            0,
+        ),
+        # The order of the arguments and the extensions have to match
+        (
+            "3dAutobox -input structural.nii -prefix structural_autobox.nii -npad 5",
+            0,
+            0,
+        ),
+        (
+            "3dAutobox -input structural_autobox.nii -npad 5 -prefix structural.nii",
+            0,
+            0,
+        ),
+        ("3dAutobox -input structural.nii -npad 5 -prefix structural_autobox", 0, 0),
+        (
+            "3dAutobox -input structural.nii.gz -npad 5 -prefix structural_autobox.nii",
+            0,
+            0,
+        ),
+        ("3dAutobox -input structural.nii -npad 5", 0, 0),
+        ("3dAutobox -input .../structural.nii -npad 5 -prefix ...", 1, 1),
+        ("3dAutobox -input .../structural.nii ...", 1, 1),
+        ("3dAutobox -input struct... -npad 5 -prefix structural_autobox...", 1, 1),
+        ("3dAutobox -input .../other.nii -npad 5 -prefix ...", 1, 0),
+        ("3dAutobox -input ... -prefix ... -npad 5", 1, 0),
+        ("3dAutobox -input structural.nii -npad 5", 1, 0),
+    ],
+)
+def test_cmdline_matches(expected, ellipsis, matches):
+    cmdline = (
+        "3dAutobox -input /tmp/structural.nii -npad 5 "
+        "-prefix /tmp/tmpr14gf59q/Autobox_2852eba/structural_autobox.nii"
+    )
+    assert cmdline_matches(cmdline, expected, ellipsis=bool(ellipsis)) == bool(matches)
+
+
+def test_cmdline_matches_values():
+    # Flags have to keep their values
+    assert cmdline_matches("3dcalc -add 1 -mul 2", "3dcalc -add 1 -mul 2")
+    assert not cmdline_matches("3dcalc -add 1 -mul 2", "3dcalc -add 2 -mul 1")
+    assert not cmdline_matches(
+        "3dAutobox -input /tmp/a.nii -prefix /tmp/b.nii",
+        "3dAutobox -input b.nii -prefix a.nii",
+    )
+    # Directories are stripped from paths within arguments too
+    assert cmdline_matches(
+        "mri_convert --in=/tmp/a.mgz,/tmp/b.mgz", "mri_convert --in=a.mgz,b.mgz"
+    )
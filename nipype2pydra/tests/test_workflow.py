@@ -0,0 +1,373 @@
+import sys
+import attrs
+from importlib import import_module
+import pytest
+from nipype2pydra.package import PackageConverter
+from nipype2pydra.workflow import WorkflowConverter, WorkflowParseCache
+from nipype2pydra.statements import (
+    AddFunctionInterfaceStatement,
+    AddInterfaceStatement,
+    AddNestedWorkflowStatement,
+    AssignmentStatement,
+    CommentStatement,
+    ConnectionStatement,
+    DocStringStatement,
+    NodeAssignmentStatement,
+    OtherStatement,
+    ReturnStatement,
+    WorkflowInitStatement,
+)
+
+CHAIN_WF_SRC = """
+from nipype.pipeline import engine as pe
+from nipype.interfaces import utility as niu
+
+
+def _pop(in_files):
+    return in_files[0]
+
+
+def _double(in_file):
+    return in_file * 2
+
+
+def _split(in_val):
+    return in_val, in_val + 1
+
+
+def _add(a, b):
+    return a + b
+
+
+DEFAULT_MEMORY_MIN_GB = 0.01
+
+
+def init_chain_wf(name="chain_wf", omp_nthreads=1):
+    workflow = pe.Workflow(name=name)
+    inputnode = pe.Node(niu.IdentityInterface(fields=["in_files"]), name="inputnode")
+    outputnode = pe.Node(
+        niu.IdentityInterface(fields=["out", "doubled"]), name="outputnode"
+    )
+    pop = pe.Node(
+        niu.Function(function=_pop, input_names=["in_files"], output_names=["out"]),
+        name="pop",
+    )
+    double = pe.Node(
+        niu.Function(function=_double, input_names=["in_file"], output_names=["out"]),
+        name="double",
+    )
+    split = pe.Node(
+        niu.Function(function=_split, input_names=["in_val"], output_names=["a", "b"]),
+        name="split",
+        n_procs=omp_nthreads,
+        mem_gb=DEFAULT_MEMORY_MIN_GB * 2,
+    )
+    add = pe.Node(
+        niu.Function(function=_add, input_names=["a", "b"], output_names=["out"]),
+        name="add",
+        run_without_submitting=True,
+    )
+    workflow.connect([
+        (inputnode, pop, [("in_files", "in_files")]),
+        (pop, double, [("out", "in_file")]),
+        (double, split, [("out", "in_val")]),
+        (double, outputnode, [("out", "doubled")]),
+        (split, add, [("a", "a"), ("b", "b")]),
+        (add, outputnode, [("out", "out")]),
+    ])
+    return workflow
+
+
+def init_hinted_wf(name="hinted_wf", omp_nthreads=1):
+    workflow = pe.Workflow(name=name)
+    inputnode = pe.Node(niu.IdentityInterface(fields=["in_files"]), name="inputnode")
+    outputnode = pe.Node(niu.IdentityInterface(fields=["out"]), name="outputnode")
+    pop = pe.Node(
+        niu.Function(function=_pop, input_names=["in_files"], output_names=["out"]),
+        name="pop",
+        n_procs=2,
+        run_without_submitting=True,
+    )
+    double = pe.Node(
+        niu.Function(function=_double, input_names=["in_file"], output_names=["out"]),
+        name="double",
+        n_procs=omp_nthreads,
+        mem_gb=DEFAULT_MEMORY_MIN_GB * 2,
+    )
+    workflow.connect([
+        (inputnode, pop, [("in_files", "in_files")]),
+        (pop, double, [("out", "in_file")]),
+        (double, outputnode, [("out", "out")]),
+    ])
+    return workflow
+
+
+def init_dynamic_wf(name="dynamic_wf"):
+    workflow = pe.Workflow(name=name)
+    inputnode = pe.Node(niu.IdentityInterface(fields=["in_files"]), name="inputnode")
+    outputnode = pe.Node(
+        niu.IdentityInterface(fields=["out", "sum"]), name="outputnode"
+    )
+    source = pe.Node(
+        niu.Function(function=_pop, input_names=["in_files"], output_names=["out"]),
+        name="source",
+    )
+    double = pe.Node(
+        niu.Function(function=_double, input_names=["in_file"], output_names=["out"]),
+        name="double",
+    )
+    add = pe.Node(
+        niu.Function(function=_add, input_names=["a", "b"], output_names=["out"]),
+        name="add",
+    )
+    workflow.connect([
+        (inputnode, source, [("in_files", "in_files")]),
+        (source, double, [(("out", _pop), "in_file")]),
+        (source, add, [(("out", _pop), "a"), (("out", _double), "b")]),
+        (double, outputnode, [("out", "out")]),
+        (add, outputnode, [("out", "sum")]),
+    ])
+    return workflow
+"""
+
+
+@pytest.fixture(scope="module")
+def chain_wf_module(tmp_path_factory):
+    pkg_parent = tmp_path_factory.mktemp("nipype-pkg")
+    pkg_dir = pkg_parent / "chainpkg"
+    pkg_dir.mkdir()
+    (pkg_dir / "__init__.py").write_text("")
+    (pkg_dir / "workflows.py").write_text(CHAIN_WF_SRC)
+    sys.path.insert(0, str(pkg_parent))
+    yield "chainpkg.workflows"
+    sys.path.remove(str(pkg_parent))
+
+
+def chain_wf_converter(module_name, name="init_chain_wf", **kwargs):
+    package = PackageConverter(name="pydra.tasks.chainpkg", nipype_name="chainpkg")
+    converter = WorkflowConverter(
+        name=name,
+        nipype_name=name,
+        nipype_module=module_name,
+        input_node="inputnode",
+        output_node="outputnode",
+        package=package,
+        **kwargs,
+    )
+    package.workflows[converter.address] = converter
+    return converter
+
+
+def convert_chain_wf(module_name, name="init_chain_wf", **kwargs):
+    converter = chain_wf_converter(module_name, name=name, **kwargs)
+    converter.prepare_connections()
+    return converter.converted_code
+
+
+def test_workflow_classify_statements(chain_wf_module):
+    converter = chain_wf_converter(chain_wf_module)
+    converter.prepare()
+    assert isinstance(converter.parsed_statements[0], WorkflowInitStatement)
+    assert all(
+        isinstance(s, AddInterfaceStatement) for s in converter.parsed_statements[1:7]
+    )
+    assert isinstance(converter.parsed_statements[3], AddFunctionInterfaceStatement)
+    classify = converter._classify_statement
+    assert classify("    # a comment") is CommentStatement
+    assert classify("    if omp_nthreads > 1:") is None
+    assert classify("    split.inputs.in_val = 1") is NodeAssignmentStatement
+    assert classify("    a, b = 1, 2") is AssignmentStatement
+    assert classify("    a == 1") is None
+    assert classify("    workflow.connect(\n  pop, 'out', double, 'in_file')") is (
+        ConnectionStatement
+    )
+    assert OtherStatement.parse("    if omp_nthreads > 1:").statement == (
+        "if omp_nthreads > 1:"
+    )
+
+
+def test_workflow_classify_statements_body(chain_wf_module):
+    converter = chain_wf_converter(
+        chain_wf_module, external_nested_workflows=["init_sub_wf"]
+    )
+    body = (
+        "\n"
+        '    """Docstring"""\n'
+        "    workflow = pe.Workflow(name=name)\n"
+        "    # a comment\n"
+        "    pop = pe.Node(\n"
+        "        niu.Function(function=_pop),  # trailing\n"
+        "        # dropped\n"
+        "        name='pop',\n"
+        "    )\n"
+        "    if omp_nthreads > 1:\n"
+        "        sub = subwfs.init_sub_wf(\n"
+        "            name='sub')\n"
+        "    else:\n"
+        "        sub = init_sub_wf(name='sub')\n"
+        "    pop.inputs.in_files = \\\n"
+        "        []\n"
+        "\n"
+        "    @wraps(_pop)\n"
+        "    def _wrapped(x): return x\n"
+        "    workflow.connect([(pop, sub, [('out', 'in')])])\n"
+        "    return workflow\n"
+    )
+    assert converter._classify_statements(body) == (
+        ("", None),
+        ('    """Docstring"""', DocStringStatement),
+        ("    workflow = pe.Workflow(name=name)", WorkflowInitStatement),
+        ("    # a comment", CommentStatement),
+        (
+            "    pop = pe.Node(\n"
+            "        niu.Function(function=_pop),  # trailing\n"
+            "        name='pop',\n"
+            "    )",
+            AddInterfaceStatement,
+        ),
+        ("    if omp_nthreads > 1:", None),
+        (
+            "        sub = subwfs.init_sub_wf(\n            name='sub')",
+            AddNestedWorkflowStatement,
+        ),
+        ("    else:", None),
+        ("        sub = init_sub_wf(name='sub')", AddNestedWorkflowStatement),
+        ("    pop.inputs.in_files = " + " " * 9 + "[]", NodeAssignmentStatement),
+        ("", None),
+        ("    @wraps(_pop)", None),
+        ("    def _wrapped(x): return x", None),
+        (
+            "    workflow.connect([(pop, sub, [('out', 'in')])])",
+            ConnectionStatement,
+        ),
+        ("    return workflow", ReturnStatement),
+    )
+
+
+def test_workflow_parse_cache(chain_wf_module, tmp_path):
+    cache_path = tmp_path / "parse-cache.json"
+    parse_cache = WorkflowParseCache(cache_path)
+    converters = [chain_wf_converter(chain_wf_module) for _ in range(2)]
+    for converter in converters:
+        converter.package.parse_cache = parse_cache
+    # The parsed source is shared between the converters of the same workflow
+    assert converters[0].parsed_source is converters[1].parsed_source
+    assert len(parse_cache) == 1
+    parse_cache.save()
+
+    def parse():
+        raise AssertionError("unchanged workflow was parsed again")
+
+    reloaded = WorkflowParseCache(cache_path)
+    assert len(reloaded) == 1
+    converter = converters[0]
+    assert (
+        reloaded.get(
+            converter.address,
+            converter.func_src,
+            rules=[
+                converter.workflow_variable,
+                sorted(converter.nested_workflow_symbols),
+            ],
+            parse=parse,
+        )
+        == converter.parsed_source
+    )
+    # Changes to the source invalidate the cached parse
+    reparsed = reloaded.get(
+        converter.address, converter.func_src + "\n", rules=[], parse=lambda: []
+    )
+    assert reparsed.statements == ()
+    assert len(reloaded) == 1
+
+
+def test_workflow_pruning(chain_wf_module):
+    converter = chain_wf_converter(chain_wf_module)
+    converter.prepare_connections()
+    converter.converted_code
+    # The pruning decisions are kept in the converter's overlay and not set on the
+    # statements, which can be shared between converters
+    assert not any(
+        "include" in attrs.fields_dict(type(s)) for s in converter.parsed_statements
+    )
+    assert {
+        n.name
+        for nodes in converter.nodes.values()
+        for n in nodes
+        if converter.pruning[n]
+    } == {"pop", "double", "split", "add"}
+    assert [i.name for i in converter.used_inputs] == ["in_files"]
+    pruning = converter.pruning
+    converter.release()
+    assert converter.pruning is not pruning
+
+
+def test_workflow_fuse_function_nodes(chain_wf_module):
+    unfused = convert_chain_wf(chain_wf_module)
+    assert 'name="pop"' in unfused
+    assert "_fused" not in unfused
+
+    fused = convert_chain_wf(chain_wf_module, fuse_function_nodes=True)
+    # "double" feeds a workflow output as well as "split" so the chain is broken there
+    assert "def double_fused(in_files):" in fused
+    assert "def add_fused(in_val):" in fused
+    assert "split_a, split_b = _split(in_val=in_val)" in fused
+    assert "return _add(a=split_a, b=split_b)" in fused
+    assert 'name="pop"' not in fused
+    assert 'name="split"' not in fused
+    assert "in_val=workflow.double.lzout.out" in fused
+
+
+def exec_chain_wf(module_name, name, **kwargs):
+    """Execs the converted constructor of a workflow in the chain_wf module and returns
+    it, so the generated code can be checked against pydra"""
+    namespace = dict(vars(import_module(module_name)))
+    exec(
+        "import attrs\n"
+        "import typing as ty\n"
+        "from pydra.engine import Workflow\n"
+        "from pydra.engine.task import FunctionTask\n"
+        "from pydra.engine.specs import SpecInfo, BaseSpec\n"
+        + convert_chain_wf(module_name, name=name, **kwargs),
+        namespace,
+    )
+    return namespace[name]
+
+
+def test_workflow_resource_hints(chain_wf_module, caplog):
+    init_hinted_wf = exec_chain_wf(chain_wf_module, "init_hinted_wf")
+    workflow = init_hinted_wf(omp_nthreads=4)
+    assert workflow.name2obj["pop"].qsub_args == "-pe smp 2"
+    assert workflow.name2obj["double"].qsub_args == "-pe smp 4 -l mem_free=20M"
+    # There is no pydra equivalent of run_without_submitting, which is warned about
+    assert not hasattr(workflow.name2obj["pop"], "run_without_submitting")
+    assert "'pop' node of 'init_hinted_wf' workflow is flagged to run without " in (
+        caplog.text
+    )
+
+
+def test_workflow_shared_connection_callables(chain_wf_module):
+    code = convert_chain_wf(chain_wf_module, name="init_dynamic_wf")
+    assert code.count("def source_out_pop_callable(") == 1
+    assert code.count("def source_out_double_callable(") == 1
+    assert code.count("source_out_pop_callable(\n") == 1
+    assert (
+        "workflow.double.inputs.in_file = workflow.source_out_pop_callable.lzout.out"
+    ) in code
+    assert "workflow.add.inputs.a = workflow.source_out_pop_callable.lzout.out" in code
+    assert (
+        "workflow.add.inputs.b = workflow.source_out_double_callable.lzout.out" in code
+    )
+
+
+def test_workflow_fuse_hinted_function_nodes(chain_wf_module):
+    init_hinted_wf = exec_chain_wf(
+        chain_wf_module, "init_hinted_wf", fuse_function_nodes=True
+    )
+    for omp_nthreads, n_procs in [(1, 2), (4, 4)]:
+        workflow = init_hinted_wf(omp_nthreads=omp_nthreads)
+        assert [n.name for n in workflow.nodes] == ["double"]
+        # The fused node requests the largest of the resources of the chain
+        assert workflow.name2obj["double"].qsub_args == (
+            f"-pe smp {n_procs} -l mem_free=20M"
+        )
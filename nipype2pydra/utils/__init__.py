@@ -7,6 +7,7 @@ from .misc import (  # noqa: F401
     is_fileset,
     to_snake_case,
     add_exc_note,
+    release_cached_properties,
     extract_args,
     cleanup_function_body,
     insert_args_in_signature,
@@ -26,4 +27,5 @@ from .symbols import (  # noqa: F401
     get_local_functions,
     get_local_classes,
     get_local_constants,
+    localise_imports,
 )
@@ -156,6 +156,24 @@ def add_exc_note(e, note):
     return e
 
 
+def release_cached_properties(obj: object, names: ty.Iterable[str]):
+    """Drops the values of cached properties of an object so that they can be garbage
+    collected, they will be recomputed if they are accessed again
+
+    Parameters
+    ----------
+    obj : object
+        the object to release the cached property values of
+    names : Iterable[str]
+        the names of the cached properties
+    """
+    for name in names:
+        try:
+            delattr(obj, name)
+        except AttributeError:  # not computed yet
+            pass
+
+
 def extract_args(snippet) -> ty.Tuple[str, ty.List[str], str]:
     """Splits the code snippet at the first opening brackets into a 3-tuple
     consisting of the preceding text + opening bracket, the arguments/items
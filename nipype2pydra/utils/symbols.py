@@ -1,10 +1,12 @@
 import typing as ty
 import re
+import ast
 import keyword
 import types
 import inspect
 import builtins
 from operator import attrgetter
+from functools import lru_cache
 from collections import defaultdict
 from logging import getLogger
 from importlib import import_module
@@ -185,7 +187,6 @@ class UsedSymbols:
             pass
         used = cls(module_name=module.__name__)
         cls._cache[cache_key] = used
-        source_code = inspect.getsource(module)
         # Sort local func/classes/consts so they are iterated in a consistent order to
         # remove stochastic element of traversal and make debugging easier
         local_functions = sorted(
@@ -193,7 +194,7 @@ class UsedSymbols:
         )
         local_constants = sorted(get_local_constants(module))
         local_classes = sorted(get_local_classes(module), key=attrgetter("__name__"))
-        module_statements = split_source_into_statements(source_code)
+        module_statements = get_module_statements(module)
         imports: ty.List[ImportStatement] = []
         global_scope = True
         for stmt in module_statements:
@@ -536,6 +537,11 @@ def get_local_constants(mod) -> ty.List[ty.Tuple[str, str]]:
     """
     Get the constants defined in the module
     """
+    return list(_get_local_constants(mod))
+
+
+@lru_cache(maxsize=None)
+def _get_local_constants(mod) -> ty.Tuple[ty.Tuple[str, str], ...]:
     source_code = inspect.getsource(mod)
     source_code = source_code.replace("\\\n", " ")
     local_vars = []
@@ -543,4 +549,155 @@ def get_local_constants(mod) -> ty.List[ty.Tuple[str, str]]:
         match = re.match(r"^(\w+) *= *(.*)", stmt, flags=re.MULTILINE | re.DOTALL)
         if match:
             local_vars.append(tuple(match.groups()))
-    return local_vars
+    return tuple(local_vars)
+
+
+@lru_cache(maxsize=None)
+def get_module_statements(mod) -> ty.Tuple[str, ...]:
+    """Get the statements of the module's source code, which are split once per module
+    as it is relatively expensive for large modules and the same modules are searched
+    for the symbols used by many different functions
+
+    Parameters
+    ----------
+    mod : ModuleType
+        the module to split
+
+    Returns
+    -------
+    tuple[str, ...]
+        the statements of the module
+    """
+    return tuple(split_source_into_statements(inspect.getsource(mod)))
+
+
+def localise_imports(
+    code_str: str,
+    imports: ty.List[ImportStatement],
+    keep_local: ty.Callable[[ImportStatement], bool],
+    find_replace: ty.Optional[ty.List[ty.Tuple[str, str]]] = None,
+) -> ty.Tuple[str, ty.List[ImportStatement]]:
+    """Moves module-level imports into the bodies of the functions that use them, so
+    that (heavy) modules are only imported when the functions are called. Imports of
+    names that are referenced at module level (e.g. in decorators, signatures, base
+    classes or constants) are left where they are
+
+    Parameters
+    ----------
+    code_str : str
+        the source code of the module (without its module-level imports)
+    imports : list[ImportStatement]
+        the module-level import statements of the module
+    keep_local : callable
+        selects the import statements that should be moved into function bodies
+    find_replace : list[tuple[str, str]], optional
+        find-replace pairs to apply to the import statements inserted into the function
+        bodies
+
+    Returns
+    -------
+    code_str : str
+        the source code with the selected imports inserted into the function bodies
+    imports : list[ImportStatement]
+        the import statements that remain at module level
+    """
+    try:
+        tree = ast.parse(code_str)
+    except SyntaxError:
+        return code_str, imports
+
+    def names_in(nodes) -> ty.Set[str]:
+        return set(
+            n.id
+            for node in nodes
+            if node is not None
+            for n in ast.walk(node)
+            if isinstance(n, ast.Name)
+        )
+
+    # Functions (and methods of classes) defined at module level, along with the names
+    # referenced within their bodies and the names evaluated when the module is loaded
+    functions = {}
+    global_names = set()
+
+    def visit(nodes):
+        for node in nodes:
+            if isinstance(node, (ast.FunctionDef, ast.AsyncFunctionDef)):
+                global_names.update(
+                    names_in(node.decorator_list + [node.args, node.returns])
+                )
+                arg_names = set(
+                    a.arg for a in ast.walk(node.args) if isinstance(a, ast.arg)
+                )
+                functions[node] = names_in(node.body) - arg_names
+            elif isinstance(node, ast.ClassDef):
+                global_names.update(
+                    names_in(node.decorator_list + node.bases + node.keywords)
+                )
+                visit(node.body)
+            else:
+                global_names.update(names_in([node]))
+
+    visit(tree.body)
+
+    to_insert = defaultdict(list)
+    remaining = []
+    for stmt in imports:
+        if stmt.conditional or not keep_local(stmt):
+            remaining.append(stmt)
+            continue
+        roots = {n: n.split(".")[0] for n in stmt}
+        if global_names.intersection(roots.values()):
+            remaining.append(stmt)
+            continue
+        users = []
+        for func, func_names in functions.items():
+            func_stmt = stmt.only_include(
+                [n for n, r in roots.items() if r in func_names]
+            )
+            if func_stmt:
+                users.append((func, func_stmt))
+        # Leave imports that aren't used by any function, or are used by functions
+        # defined on a single line, where they can't be inserted, at module level
+        if not users or any(f.body[0].lineno == f.lineno for f, _ in users):
+            remaining.append(stmt)
+            continue
+        for func, func_stmt in users:
+            to_insert[func].append(func_stmt)
+
+    def first_lineno(node) -> int:
+        # Decorated (nested) definitions start at their first decorator
+        return min(
+            [node.lineno] + [d.lineno for d in getattr(node, "decorator_list", [])]
+        )
+
+    lines = code_str.splitlines()
+    for func, stmts in sorted(to_insert.items(), key=lambda f: -f[0].lineno):
+        body = func.body
+        # Insert after the docstring if present
+        if (
+            isinstance(body[0], ast.Expr)
+            and isinstance(body[0].value, ast.Constant)
+            and isinstance(body[0].value.value, str)
+        ):
+            if len(body) > 1:
+                insert_at = first_lineno(body[1]) - 1
+                indent = " " * body[1].col_offset
+            else:
+                insert_at = body[0].end_lineno
+                indent = " " * body[0].col_offset
+        else:
+            insert_at = first_lineno(body[0]) - 1
+            indent = " " * body[0].col_offset
+        func_lines = set(ln.strip() for ln in lines[func.lineno - 1 : func.end_lineno])
+        import_lines = []
+        for import_stmt in sorted(stmts):
+            import_str = str(import_stmt)
+            for find, replace in find_replace or []:
+                import_str = re.sub(
+                    find, replace, import_str, flags=re.MULTILINE | re.DOTALL
+                )
+            if import_str not in func_lines:
+                import_lines.append(indent + import_str)
+        lines[insert_at:insert_at] = import_lines
+    return "\n".join(lines) + ("\n" if code_str.endswith("\n") else ""), remaining
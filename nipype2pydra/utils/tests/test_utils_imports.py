@@ -1,5 +1,6 @@
+import ast
 import pytest
-from nipype2pydra.utils.symbols import UsedSymbols
+from nipype2pydra.utils.symbols import UsedSymbols, localise_imports
 from nipype2pydra.statements.imports import ImportStatement, parse_imports
 import nipype.interfaces.utility
 
@@ -118,3 +119,27 @@ def test_get_imported_object_fail2():
     used = UsedSymbols(module_name="test_module", imports=parse_imports(import_stmts))
     with pytest.raises(ImportError, match="Could not find object named"):
         used.get_imported_object("IdentityBoo")
+
+
+@pytest.mark.parametrize("docstring", [False, True])
+def test_localise_imports_decorated_nested_def(docstring):
+    code_str = (
+        "def outer(x):\n"
+        + ('    """Docstring"""\n' if docstring else "")
+        + "    @functools.wraps(x)\n"
+        "    def inner():\n"
+        "        return np.zeros(3)\n"
+        "    return inner\n"
+    )
+    imports = parse_imports(["import functools", "import numpy as np"])
+    localised, remaining = localise_imports(
+        code_str, imports, keep_local=lambda s: True
+    )
+    ast.parse(localised)
+    assert remaining == []
+    assert (
+        "    import functools\n"
+        "    import numpy as np\n"
+        "    @functools.wraps(x)\n"
+        "    def inner():\n"
+    ) in localised
@@ -1,7 +1,12 @@
 from importlib import import_module
+import ast
 from functools import cached_property, partial
 import inspect
+import hashlib
+import json
+import os
 import re
+import tempfile
 import typing as ty
 from copy import copy
 import logging
@@ -22,6 +27,7 @@ from .utils import (
     multiline_comment,
     from_named_dicts_converter,
     unwrap_nested_type,
+    release_cached_properties,
 )
 from .statements import (
     ImportStatement,
@@ -36,6 +42,8 @@ from .statements import (
     WorkflowInitStatement,
     AssignmentStatement,
     OtherStatement,
+    AddFunctionInterfaceStatement,
+    FusedFunctionInterfaceStatement,
 )
 import nipype2pydra.package
 
@@ -170,18 +178,6 @@ class WorkflowInput(WorkflowInterfaceField):
         },
     )
 
-    include: bool = attrs.field(
-        default=False,
-        eq=False,
-        hash=False,
-        metadata={
-            "help": (
-                "Whether the input is required for the workflow once the unused nodes "
-                "have been filtered out"
-            )
-        },
-    )
-
     def __hash__(self):
         return super().__hash__()
 
@@ -205,6 +201,232 @@ class WorkflowOutput(WorkflowInterfaceField):
         return super().__hash__()
 
 
+# The statement classes that workflow statements are classified as, by name, so that
+# the classifications can be persisted
+CLASSIFIED_STATEMENTS = {
+    c.__name__: c
+    for c in (
+        CommentStatement,
+        DocStringStatement,
+        ImportStatement,
+        WorkflowInitStatement,
+        AddInterfaceStatement,
+        AddNestedWorkflowStatement,
+        ConnectionStatement,
+        ReturnStatement,
+        NodeAssignmentStatement,
+        AssignmentStatement,
+    )
+}
+
+
+@attrs.frozen
+class ParsedWorkflowSource:
+    """The statements of a workflow constructor split from its source and classified,
+    which are immutable so they can be shared between all the converters of the
+    workflow (see `WorkflowParseCache`)
+
+    Parameters
+    ----------
+    address : str
+        the address of the workflow constructor function
+    source_hash : str
+        the hash of the source of the function
+    rules_hash : str
+        the hash of the rules of the package the statements were classified with,
+        i.e. the workflow variable and the symbols of the nested workflows
+    statements : tuple[tuple[str, str or None], ...]
+        the source of each statement and the name of the statement class it is to be
+        parsed with, None if it is to be left as an OtherStatement
+    """
+
+    address: str
+    source_hash: str
+    rules_hash: str
+    statements: ty.Tuple[ty.Tuple[str, ty.Optional[str]], ...] = attrs.field(
+        converter=lambda stmts: tuple((s, c) for s, c in stmts)
+    )
+
+    @property
+    def key(self) -> ty.Tuple[str, str, str]:
+        return (self.address, self.source_hash, self.rules_hash)
+
+    @property
+    def classified(self) -> ty.List[ty.Tuple[str, ty.Optional[type]]]:
+        """The statements along with the statement classes they are to be parsed with"""
+        return [
+            (s, CLASSIFIED_STATEMENTS[c] if c else None) for s, c in self.statements
+        ]
+
+
+@attrs.define
+class WorkflowParseCache:
+    """Parsed workflow sources keyed by the address of the workflow function, the hash
+    of its source and the hash of the package rules they were parsed with, so that
+    each workflow is only parsed once no matter how many times it is converted (e.g.
+    after it has been released, or by each package of a batch that references it).
+
+    If a path is provided, the parsed sources are loaded from it and saved back to it
+    (see `save`) so that unchanged workflows aren't parsed again in subsequent runs.
+    Only the most recent source of each workflow is kept
+
+    Parameters
+    ----------
+    path : Path, optional
+        the JSON file to persist the parsed sources to
+    """
+
+    FORMAT_VERSION = 1
+
+    path: ty.Optional[Path] = attrs.field(
+        default=None, converter=lambda p: Path(p) if p is not None else None
+    )
+    _entries: ty.Dict[ty.Tuple[str, str, str], ParsedWorkflowSource] = attrs.field(
+        factory=dict, init=False, repr=False
+    )
+    _modified: bool = attrs.field(default=False, init=False, repr=False)
+
+    def __attrs_post_init__(self):
+        if self.path is not None:
+            self._entries.update(self._load(self.path))
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def get(
+        self,
+        address: str,
+        source: str,
+        rules: ty.Sequence[ty.Any],
+        parse: ty.Callable[[], ty.Iterable[ty.Tuple[str, ty.Optional[type]]]],
+    ) -> ParsedWorkflowSource:
+        """Returns the parsed source of a workflow, parsing it if it isn't in the cache
+
+        Parameters
+        ----------
+        address : str
+            the address of the workflow constructor function
+        source : str
+            the source of the function
+        rules : Sequence
+            the (JSON-serialisable) package rules the source is parsed with
+        parse : Callable
+            parses the source, returning the source of each statement and the class
+            it is to be parsed with
+
+        Returns
+        -------
+        ParsedWorkflowSource
+            the parsed source
+        """
+        key = (
+            address,
+            hashlib.sha256(source.encode()).hexdigest(),
+            hashlib.sha256(json.dumps(rules).encode()).hexdigest(),
+        )
+        try:
+            return self._entries[key]
+        except KeyError:
+            pass
+        parsed = ParsedWorkflowSource(
+            *key,
+            statements=[(s, c.__name__ if c else None) for s, c in parse()],
+        )
+        # Drop the entries of previous versions of the source, which are stale
+        for stale in [k for k in self._entries if k[0] == address and k[1] != key[1]]:
+            del self._entries[stale]
+        self._entries[key] = parsed
+        self._modified = True
+        return parsed
+
+    def save(self):
+        """Saves the parsed sources to the path of the cache (if provided), merging
+        them with those saved to it by other processes in the meantime"""
+        if self.path is None or not self._modified:
+            return
+        entries = self._load(self.path)
+        for key in self._entries:
+            for stale in [k for k in entries if k[0] == key[0] and k[1] != key[1]]:
+                del entries[stale]
+        entries.update(self._entries)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        # Written to a temporary file first so that concurrent readers never see a
+        # partially written cache
+        fd, tmp_path = tempfile.mkstemp(
+            dir=self.path.parent, prefix=self.path.name, suffix=".tmp"
+        )
+        try:
+            with os.fdopen(fd, "w") as f:
+                json.dump(
+                    {
+                        "format_version": self.FORMAT_VERSION,
+                        "nipype2pydra_version": nipype2pydra.__version__,
+                        "workflows": [attrs.asdict(e) for e in entries.values()],
+                    },
+                    f,
+                )
+            os.replace(tmp_path, self.path)
+        finally:
+            if os.path.exists(tmp_path):
+                os.unlink(tmp_path)
+        self._modified = False
+
+    @classmethod
+    def _load(
+        cls, path: Path
+    ) -> ty.Dict[ty.Tuple[str, str, str], ParsedWorkflowSource]:
+        """Loads the parsed sources saved to the path, ignoring them if they were saved
+        by a different version of nipype2pydra (which may parse them differently)"""
+        if not path.exists():
+            return {}
+        try:
+            with open(path) as f:
+                saved = json.load(f)
+        except (OSError, ValueError) as e:
+            logger.warning("Ignoring unreadable workflow parse cache %s: %s", path, e)
+            return {}
+        if saved.get("format_version") != cls.FORMAT_VERSION or saved.get(
+            "nipype2pydra_version"
+        ) != (nipype2pydra.__version__):
+            logger.info(
+                "Ignoring workflow parse cache %s saved by a different version", path
+            )
+            return {}
+        entries = (ParsedWorkflowSource(**e) for e in saved["workflows"])
+        return {e.key: e for e in entries}
+
+
+@attrs.define
+class WorkflowPruning:
+    """Which nodes, connections and inputs of a workflow are included in its converted
+    code, as determined by walking its graph from the inputs to the outputs. The
+    decisions are kept separate from the parsed statements, which they refer to, so
+    that the statements aren't modified when the workflow is pruned. Anything that
+    hasn't been visited by the walk is excluded
+
+    Parameters
+    ----------
+    used_inputs : set[WorkflowInput]
+        the inputs of the workflow that are connected to its outputs
+    """
+
+    used_inputs: ty.Set[WorkflowInput] = attrs.field(factory=set)
+    # Keyed by the id of the statements/inputs, which are stored alongside the
+    # decisions so the ids can't be reused while the pruning is alive
+    _decisions: ty.Dict[int, ty.Tuple[ty.Any, ty.Optional[bool]]] = attrs.field(
+        factory=dict, repr=False
+    )
+
+    def __getitem__(self, obj: ty.Any) -> ty.Optional[bool]:
+        try:
+            return self._decisions[id(obj)][1]
+        except KeyError:
+            return False
+
+    def __setitem__(self, obj: ty.Any, include: ty.Optional[bool]):
+        self._decisions[id(obj)] = (obj, include)
+
+
 @attrs.define
 class WorkflowConverter:
     """Specifies how the semi-automatic conversion from Nipype to Pydra should
@@ -343,15 +565,22 @@ class WorkflowConverter:
             "i.e. all inputs and outputs are to be exported"
         },
     )
+    fuse_function_nodes: bool = attrs.field(
+        default=False,
+        metadata={
+            "help": (
+                "Whether to fuse linear chains of function nodes, where each node is "
+                "the sole consumer of the previous node's outputs, into a single "
+                "function task"
+            )
+        },
+    )
     nodes: ty.Dict[str, ty.List[AddInterfaceStatement]] = attrs.field(
         factory=dict, repr=False
     )
     _unprocessed_connections: ty.List[ConnectionStatement] = attrs.field(
         factory=list, repr=False
     )
-    used_inputs: ty.Optional[ty.Set[WorkflowInput]] = attrs.field(
-        default=None, repr=False
-    )
 
     def __attrs_post_init__(self):
         if self.workflow_variable is None:
@@ -644,6 +873,18 @@ class WorkflowConverter:
         preamble, args, post = extract_args(self.func_src)
         return post.split(":", 1)[1]
 
+    @cached_property
+    def parsed_source(self) -> ParsedWorkflowSource:
+        """The statements of the workflow function split and classified, which are
+        shared via the parse cache of the package with the other converters of the
+        function that are parsed with the same rules"""
+        return self.package.parse_cache.get(
+            self.address,
+            self.func_src,
+            rules=[self.workflow_variable, sorted(self.nested_workflow_symbols)],
+            parse=lambda: self._classify_statements(self.func_body),
+        )
+
     @cached_property
     def nested_workflows(self):
         potential_funcs = {
@@ -744,6 +985,7 @@ class WorkflowConverter:
             depth=self.package.init_depth,
             auto_import_depth=self.package.auto_import_init_depth,
             import_find_replace=self.package.import_find_replace,
+            lazy=self.package.lazy_init_imports,
         )
 
         # Write test code
@@ -775,34 +1017,23 @@ class WorkflowConverter:
         all_used.update(self.test_used)
         return all_used
 
+    @property
+    def used_inputs(self) -> ty.Set[WorkflowInput]:
+        """The inputs of the workflow that are connected to its outputs"""
+        return self.pruning.used_inputs
+
     @cached_property
-    def _converted_code(self) -> ty.Tuple[str, ty.List[str]]:
-        """Convert the Nipype workflow function to a Pydra workflow function and determine
-        the configuration parameters that are used
+    def pruning(self) -> WorkflowPruning:
+        """Walks through the DAG of the workflow to determine which nodes and
+        connections are connected to the inputs of the workflow and then on to its
+        outputs, and are therefore included in the converted workflow
 
         Returns
         -------
-        function_code : str
-            the converted function code
-        used_configs : list[str]
-            the names of the used configs
+        WorkflowPruning
+            the nodes, connections and inputs that are included
         """
-
-        for nested_workflow in self.nested_workflows.values():
-            # processing nested workflows first so we know which inputs are required
-            nested_workflow._converted_code
-
-        declaration, func_args, post = extract_args(self.func_src)
-        return_types = post[1:].split(":", 1)[0]  # Get the return type
-
-        nonstd_types = set()
-
-        def add_nonstd_types(tp):
-            if ty.get_origin(tp) in (list, ty.Union):
-                for tp_arg in ty.get_args(tp):
-                    add_nonstd_types(tp_arg)
-            elif tp.__module__ not in ["builtins", "pathlib", "typing"]:
-                nonstd_types.add(tp)
+        pruning = WorkflowPruning()
 
         # Walk through the DAG and include all nodes and connections that are connected to
         # the input nodes and their connections up until the output nodes
@@ -810,7 +1041,6 @@ class WorkflowConverter:
 
         for inpt in self.inputs.values():
             conn_stack.extend(inpt.out_conns)
-            add_nonstd_types(inpt.type)
 
         while conn_stack:
             conn = conn_stack.pop()
@@ -818,52 +1048,84 @@ class WorkflowConverter:
             # from input->output traversal nodes and conns are flagged as include=None,
             # because this coerces to False but is differentiable from False when we
             # come to do the traversal in the other direction
-            conn.include = None
+            pruning[conn] = None
             if conn.target_name:
                 sibling_target_nodes = self.nodes[conn.target_name]
                 exclude = True
                 for target_node in sibling_target_nodes:
-                    # Check to see if the input is required, so we can change its include
-                    # flag back to false if not
-                    if (
-                        not isinstance(target_node, AddNestedWorkflowStatement)
-                        or target_node.nested_workflow.inputs[conn.target_in].include
-                    ):
-                        target_node.include = None
+                    # Check to see if the input is required by the nested workflow (as
+                    # determined by its own pruning), so we can change its include flag
+                    # back to false if not
+                    if not isinstance(
+                        target_node, AddNestedWorkflowStatement
+                    ) or target_node.nested_workflow.pruning[
+                        target_node.nested_workflow.inputs[conn.target_in]
+                    ]:
+                        pruning[target_node] = None
                         conn_stack.extend(target_node.out_conns)
                         exclude = False
                 if exclude:
-                    conn.include = False
+                    pruning[conn] = False
 
         # Walk through the graph backwards from the outputs and trim any unnecessary
         # connections
         assert not conn_stack
         for outpt in self.outputs.values():
             conn_stack.extend(outpt.in_conns)
-            add_nonstd_types(outpt.type)
-
-        nonstd_types.discard(ty.Any)
-
-        self.used_inputs = set()
 
         while conn_stack:
             conn = conn_stack.pop()
             # if included forward from inputs and backwards from outputs
-            if conn.include is None:
-                conn.include = True
+            if pruning[conn] is None:
+                pruning[conn] = True
             else:
                 continue
             if conn.source_name:
                 sibling_source_nodes = self.nodes[conn.source_name]
                 for source_node in sibling_source_nodes:
                     # if included forward from inputs and backwards from outputs
-                    if source_node.include is None:
-                        source_node.include = True
+                    if pruning[source_node] is None:
+                        pruning[source_node] = True
                         conn_stack.extend(source_node.in_conns)
             else:
                 inpt = self.inputs[conn.source_out]
-                inpt.include = True
-                self.used_inputs.add(inpt)
+                pruning[inpt] = True
+                pruning.used_inputs.add(inpt)
+        return pruning
+
+    @cached_property
+    def _converted_code(self) -> ty.Tuple[str, ty.List[str]]:
+        """Convert the Nipype workflow function to a Pydra workflow function and determine
+        the configuration parameters that are used
+
+        Returns
+        -------
+        function_code : str
+            the converted function code
+        used_configs : list[str]
+            the names of the used configs
+        """
+
+        for nested_workflow in self.nested_workflows.values():
+            # processing nested workflows first so we know which inputs are required
+            nested_workflow._converted_code
+        self.pruning
+
+        declaration, func_args, post = extract_args(self.func_src)
+        return_types = post[1:].split(":", 1)[0]  # Get the return type
+
+        nonstd_types = set()
+
+        def add_nonstd_types(tp):
+            if ty.get_origin(tp) in (list, ty.Union):
+                for tp_arg in ty.get_args(tp):
+                    add_nonstd_types(tp_arg)
+            elif tp.__module__ not in ["builtins", "pathlib", "typing"]:
+                nonstd_types.add(tp)
+
+        for field in itertools.chain(self.inputs.values(), self.outputs.values()):
+            add_nonstd_types(field.type)
+        nonstd_types.discard(ty.Any)
 
         preamble = ""
         statements = copy(self.parsed_statements)
@@ -874,6 +1136,9 @@ class WorkflowConverter:
         ):
             preamble += str(statements.pop(0)) + "\n"
 
+        if self.fuse_function_nodes:
+            statements = self._fuse_function_nodes(statements)
+
         # Write out the statements to the code string
         code_str = ""
         for statement in statements:
@@ -925,7 +1190,7 @@ class WorkflowConverter:
     @cached_property
     def parsed_statements(self):
         # Parse the statements in the function body into converter objects and strings
-        return self._parse_statements(self.func_body)
+        return self._parse_statements(self.parsed_source.classified)
 
     @property
     def test_code(self):
@@ -956,6 +1221,35 @@ def test_{self.name}():
         so that they can detect inputs/outputs in each other"""
         self.parsed_statements
 
+    def release(self):
+        """Drops the state derived during the conversion (parsed statements, nodes,
+        used symbols, converted code, etc...) once the workflow and all the workflows
+        that nest it have been written so it can be garbage collected. The workflow
+        needs to be prepared again (see `prepare_connections`) before it can be
+        rewritten"""
+        release_cached_properties(
+            self,
+            [
+                "used_symbols",
+                "input_output_imports",
+                "func_src",
+                "func_body",
+                "nested_workflows",
+                "nested_workflow_symbols",
+                "nested_workflow_statements",
+                "_converted_code",
+                "pruning",
+                "parsed_statements",
+                "parsed_source",
+            ],
+        )
+        self.nodes = {}
+        self._unprocessed_connections = []
+        for inpt in self.inputs.values():
+            inpt.out_conns = []
+        for outpt in self.outputs.values():
+            outpt.in_conns = []
+
     def prepare_connections(self):
         """Prepare workflow connections by assigning all connections to inputs and outputs
         of each node statement, inputs and outputs of the workflow are also assigned"""
@@ -1023,7 +1317,9 @@ def test_{self.name}():
                 conn.target_in = outpt.name
                 outpt.in_conns.append(conn)
 
-    def _parse_statements(self, func_body: str) -> ty.Tuple[
+    def _parse_statements(
+        self, classified: ty.Sequence[ty.Tuple[str, ty.Optional[type]]]
+    ) -> ty.Tuple[
         ty.List[
             ty.Union[
                 str,
@@ -1045,8 +1341,9 @@ def test_{self.name}():
 
         Parameters
         ----------
-        func_body : str
-            the function body to parse
+        classified : Sequence[tuple[str, type or None]]
+            the statements of the function body and the classes they are to be parsed
+            with (see `_classify_statements`)
 
         Returns
         -------
@@ -1056,23 +1353,23 @@ def test_{self.name}():
             the workflow init statement
         """
 
-        statements = split_source_into_statements(func_body)
+        statements = [stmt for stmt, _ in classified]
 
         parsed = []
         output_names = []
         workflow_init = None
         workflow_init_index = None
         assignments = defaultdict(list)
-        for i, statement in enumerate(statements):
+        for i, (statement, stmt_cls) in enumerate(classified):
             if not statement.strip():
                 continue
-            if CommentStatement.matches(statement):  # comments
+            if stmt_cls is CommentStatement:  # comments
                 parsed_stmt = CommentStatement.parse(statement)
                 parsed.append(parsed_stmt)
-            elif DocStringStatement.matches(statement):  # docstrings
+            elif stmt_cls is DocStringStatement:  # docstrings
                 parsed_stmt = DocStringStatement.parse(statement)
                 parsed.append(parsed_stmt)
-            elif ImportStatement.matches(statement):
+            elif stmt_cls is ImportStatement:
                 parsed_imports = parse_imports(
                     statement,
                     relative_to=self.nipype_module.__name__,
@@ -1080,7 +1377,7 @@ def test_{self.name}():
                 )
                 parsed.extend(parsed_imports)
                 parsed_stmt = parsed_imports[-1]
-            elif WorkflowInitStatement.matches(statement):
+            elif stmt_cls is WorkflowInitStatement:
                 workflow_init = parsed_stmt = WorkflowInitStatement.parse(
                     statement, self
                 )
@@ -1088,21 +1385,19 @@ def test_{self.name}():
                     parsed.append(parsed_stmt)
                 else:
                     parsed.insert(workflow_init_index, parsed_stmt)
-            elif AddInterfaceStatement.matches(statement):
+            elif stmt_cls is AddInterfaceStatement:
                 if workflow_init_index is None:
                     workflow_init_index = i
                 parsed_stmt = AddInterfaceStatement.parse(statement, self)
                 self._add_node_converter(parsed_stmt)
                 parsed.append(parsed_stmt)
-            elif AddNestedWorkflowStatement.matches(
-                statement, self.nested_workflow_symbols
-            ):
+            elif stmt_cls is AddNestedWorkflowStatement:
                 if workflow_init_index is None:
                     workflow_init_index = i
                 parsed_stmt = AddNestedWorkflowStatement.parse(statement, self)
                 self._add_node_converter(parsed_stmt)
                 parsed.append(parsed_stmt)
-            elif ConnectionStatement.matches(statement, self.workflow_variable):
+            elif stmt_cls is ConnectionStatement:
                 if workflow_init_index is None:
                     workflow_init_index = i
                 conn_stmts = ConnectionStatement.parse(statement, self, assignments)
@@ -1119,15 +1414,15 @@ def test_{self.name}():
                     elif not conn_stmt.lzouttable:
                         parsed.append(conn_stmt)
                 parsed_stmt = conn_stmts[-1]
-            elif ReturnStatement.matches(statement):
+            elif stmt_cls is ReturnStatement:
                 parsed_stmt = ReturnStatement.parse(statement)
                 parsed.append(parsed_stmt)
-            elif NodeAssignmentStatement.matches(statement, list(self.nodes)):
+            elif stmt_cls is NodeAssignmentStatement:
                 if workflow_init_index is None:
                     workflow_init_index = i
                 parsed_stmt = NodeAssignmentStatement.parse(statement, self)
                 parsed.append(parsed_stmt)
-            elif AssignmentStatement.matches(statement):
+            elif stmt_cls is AssignmentStatement:
                 parsed_stmt = AssignmentStatement.parse(statement)
                 for varname, value in parsed_stmt.items():
                     assignments[varname].append(value)
@@ -1149,6 +1444,319 @@ def test_{self.name}():
 
         return parsed
 
+    def _fuse_function_nodes(self, statements: ty.List[ty.Any]) -> ty.List[ty.Any]:
+        """Replaces linear chains of function nodes, in which each node is the sole
+        consumer of the outputs of the previous node and the previous node is the sole
+        source of its inputs, with a single fused function node. Nodes that are split,
+        conditional or modified by node-assignment statements are left untouched
+
+        Parameters
+        ----------
+        statements : list
+            the parsed statements of the workflow after the include flags have been set
+
+        Returns
+        -------
+        list
+            the statements with the fused nodes substituted for the chains
+        """
+        assigned = set()
+        for stmt in statements:
+            if isinstance(stmt, NodeAssignmentStatement):
+                assigned.update(n.name for n in stmt.nodes)
+
+        def fusable(node) -> bool:
+            return (
+                isinstance(node, AddFunctionInterfaceStatement)
+                and node.name not in assigned
+                and node.fusable
+            )
+
+        def in_conns_lzouttable(node) -> bool:
+            return all(c.lzouttable for c in node.in_conns if c.include)
+
+        def sole_consumer(node) -> ty.Optional[AddFunctionInterfaceStatement]:
+            out_conns = [c for c in node.out_conns if c.include]
+            if not out_conns or any(
+                c.target_name is None or not c.lzouttable for c in out_conns
+            ):
+                return None
+            target_names = set(c.target_name for c in out_conns)
+            if len(target_names) != 1:
+                return None
+            target = self.nodes[target_names.pop()][0]
+            if not fusable(target) or not in_conns_lzouttable(target):
+                return None
+            if any(c.source_name != node.name for c in target.in_conns if c.include):
+                return None
+            return target
+
+        consumers = {}
+        for stmt in statements:
+            if fusable(stmt) and in_conns_lzouttable(stmt):
+                consumer = sole_consumer(stmt)
+                if consumer is not None:
+                    consumers[stmt.name] = consumer
+        consumed = set(c.name for c in consumers.values())
+
+        fused = {}
+        for stmt in statements:
+            if not fusable(stmt) or stmt.name not in consumers:
+                continue
+            if stmt.name in consumed:
+                continue
+            chain = [stmt]
+            while chain[-1].name in consumers:
+                chain.append(consumers[chain[-1].name])
+            fused_node = FusedFunctionInterfaceStatement.fuse(chain)
+            logger.info(
+                "Fusing function nodes %s into '%s' node in '%s' workflow",
+                [n.name for n in chain],
+                fused_node.name,
+                self.name,
+            )
+            for node in chain[:-1]:
+                fused[node.name] = None
+            fused[chain[-1].name] = fused_node
+
+        if not fused:
+            return statements
+        fused_statements = []
+        for stmt in statements:
+            if isinstance(stmt, AddFunctionInterfaceStatement) and stmt.name in fused:
+                if fused[stmt.name] is not None:
+                    fused_statements.append(fused[stmt.name])
+            else:
+                fused_statements.append(stmt)
+        return fused_statements
+
+    def _classify_statements(
+        self, func_body: str
+    ) -> ty.Tuple[ty.Tuple[str, ty.Optional[type]], ...]:
+        """Splits the function body into statements and classifies each of them.
+
+        The body is parsed once, and the source of each statement is sliced from the
+        line ranges of the nodes in the syntax tree. The statements are split in the
+        same way as `split_source_into_statements`, i.e. the headers of compound
+        statements (e.g. if/for/with blocks), the statements within their bodies,
+        comments and blank lines are all separate statements. If the body can't be
+        parsed, it falls back to `split_source_into_statements` and parsing each
+        statement separately
+
+        Parameters
+        ----------
+        func_body : str
+            the function body to split
+
+        Returns
+        -------
+        tuple[tuple[str, type or None], ...]
+            the source of each statement and the statement class it is to be parsed with
+        """
+        try:
+            # Parsed as the body of a stub function so the line numbers of the nodes
+            # match the lines of the body, the first of which is the remainder of the
+            # line the function is defined on
+            tree = ast.parse("def _():" + func_body)
+        except SyntaxError:
+            classified = []
+            node_names = set()
+            for statement in split_source_into_statements(func_body):
+                stmt_cls = None
+                if statement.strip():
+                    stmt_cls = self._classify_statement(statement, node_names)
+                    if stmt_cls in (AddInterfaceStatement, AddNestedWorkflowStatement):
+                        node_names.add(re.match(r"\s*(\w+)", statement).group(1))
+                classified.append((statement, stmt_cls))
+            return tuple(classified)
+
+        lines = func_body.splitlines()
+        # The line ranges (1-based, inclusive) of each statement and the node of the
+        # simple statements within them
+        ranges: ty.List[ty.List[ty.Any]] = []
+
+        def add_range(start: int, end: int, node: ty.Optional[ast.AST]):
+            if ranges and start <= ranges[-1][1]:
+                # Multiple statements on the same line, e.g. separated by ';'
+                ranges[-1][1] = max(end, ranges[-1][1])
+                ranges[-1][2] = None
+            else:
+                ranges.append([start, end, node])
+
+        def first_lineno(node: ast.AST) -> int:
+            # match-case clauses don't have line numbers of their own, and decorated
+            # definitions start at their first decorator
+            return min(
+                [getattr(node, "lineno", None) or node.pattern.lineno]
+                + [d.lineno for d in getattr(node, "decorator_list", [])]
+            )
+
+        def visit(nodes: ty.List[ast.AST]):
+            for node in nodes:
+                start = getattr(node, "lineno", None) or node.pattern.lineno
+                for decorator in getattr(node, "decorator_list", []):
+                    add_range(decorator.lineno, decorator.end_lineno, None)
+                if isinstance(node, ast.Try) or type(node).__name__ == "TryStar":
+                    blocks = [node.body, *([h] for h in node.handlers)]
+                    blocks.extend([node.orelse, node.finalbody])
+                elif type(node).__name__ == "Match":
+                    blocks = [[c] for c in node.cases]
+                elif hasattr(node, "body") and isinstance(node.body, list):
+                    blocks = [node.body, getattr(node, "orelse", [])]
+                else:
+                    add_range(node.lineno, node.end_lineno, node)
+                    continue
+                children = [n for block in blocks for n in block]
+                first_child = min(first_lineno(n) for n in children)
+                if first_child == start:  # e.g. "if x: y = 1"
+                    end = getattr(node, "end_lineno", None) or node.body[-1].end_lineno
+                    add_range(start, end, None)
+                    continue
+                # Header of the compound statement, excluding any comments or blank
+                # lines between it and the first statement in its body
+                header_end = first_child - 1
+                while header_end > start and (
+                    not lines[header_end - 1].strip()
+                    or lines[header_end - 1].lstrip().startswith("#")
+                ):
+                    header_end -= 1
+                add_range(start, header_end, None)
+                for block in blocks:
+                    visit(block)
+
+        visit(tree.body[0].body)
+
+        classified = []
+        node_names = set()
+        line_no = 1
+        for start, end, node in ranges + [[len(lines) + 1, None, None]]:
+            # Lines that aren't part of any statement, e.g. comments, blank lines and
+            # else/finally clauses
+            for line in lines[line_no - 1 : start - 1]:
+                stmt_cls = None
+                if line.lstrip().startswith("#"):
+                    stmt_cls = CommentStatement
+                classified.append((line, stmt_cls))
+            if end is None:
+                break
+            statement = "\n".join(
+                ln
+                for i, ln in enumerate(lines[start - 1 : end])
+                if not i or not re.match(r"\s*#", ln)  # drop within-statement comments
+            ).replace("\\\n", " ")
+            stmt_cls = None
+            if node is not None:
+                stmt_cls = self._classify_node(node, node_names)
+                if stmt_cls in (AddInterfaceStatement, AddNestedWorkflowStatement):
+                    node_names.add(node.targets[0].id)
+            classified.append((statement, stmt_cls))
+            line_no = end + 1
+        return tuple(classified)
+
+    def _classify_statement(
+        self, statement: str, node_names: ty.Optional[ty.Iterable[str]] = None
+    ) -> ty.Optional[type]:
+        """Classifies a single statement of the workflow constructor (see
+        `_classify_node`). Statements that can't be parsed in isolation (e.g. the
+        headers of if/for/with blocks) are left unclassified
+
+        Parameters
+        ----------
+        statement : str
+            the source code of the statement
+        node_names : Iterable[str], optional
+            the names of the nodes added to the workflow before the statement, by
+            default the nodes that have been parsed so far
+
+        Returns
+        -------
+        type or None
+            the statement class to parse the statement with, or None if it is to be
+            left as an OtherStatement
+        """
+        try:
+            tree = ast.parse(statement.lstrip())
+        except SyntaxError:
+            return None
+        if not tree.body:
+            return CommentStatement if statement.lstrip().startswith("#") else None
+        return self._classify_node(tree.body[0], node_names)
+
+    def _classify_node(
+        self, node: ast.AST, node_names: ty.Optional[ty.Iterable[str]] = None
+    ) -> ty.Optional[type]:
+        """Classifies a statement of the workflow constructor by the shape of its
+        syntax tree, rather than by matching it against each of the statement regexes
+        in turn
+
+        Parameters
+        ----------
+        node : ast.AST
+            the syntax tree of the statement
+        node_names : Iterable[str], optional
+            the names of the nodes added to the workflow before the statement, by
+            default the nodes that have been parsed so far
+
+        Returns
+        -------
+        type or None
+            the statement class to parse the statement with, or None if it is to be
+            left as an OtherStatement
+        """
+        if node_names is None:
+            node_names = self.nodes
+        if isinstance(node, ast.Expr):
+            if isinstance(node.value, ast.Constant) and isinstance(
+                node.value.value, str
+            ):
+                return DocStringStatement
+            if (
+                isinstance(node.value, ast.Call)
+                and isinstance(node.value.func, ast.Attribute)
+                and node.value.func.attr == "connect"
+                and isinstance(node.value.func.value, ast.Name)
+                and node.value.func.value.id == self.workflow_variable
+            ):
+                return ConnectionStatement
+        elif isinstance(node, (ast.Import, ast.ImportFrom)):
+            return ImportStatement
+        elif isinstance(node, ast.Return):
+            return ReturnStatement
+        elif isinstance(node, ast.Assign) and len(node.targets) == 1:
+            target = node.targets[0]
+            if isinstance(target, ast.Name) and isinstance(node.value, ast.Call):
+                func = node.value.func
+                func_name = (
+                    func.attr
+                    if isinstance(func, ast.Attribute)
+                    else (func.id if isinstance(func, ast.Name) else None)
+                )
+                if func_name == "Workflow" and any(
+                    k.arg == "name" for k in node.value.keywords
+                ):
+                    return WorkflowInitStatement
+                if func_name in ("Node", "MapNode"):
+                    return AddInterfaceStatement
+                # Nested workflow factories, called directly or via the module they
+                # are imported from, e.g. "anat.init_anat_wf(...)"
+                if func_name in self.nested_workflow_symbols or (
+                    isinstance(func, ast.Attribute)
+                    and ast.unparse(func) in self.nested_workflow_symbols
+                ):
+                    return AddNestedWorkflowStatement
+            if isinstance(target, ast.Attribute):
+                root = target
+                while isinstance(root, ast.Attribute):
+                    root = root.value
+                if isinstance(root, ast.Name) and root.id in node_names:
+                    return NodeAssignmentStatement
+            if isinstance(target, ast.Name) or (
+                isinstance(target, ast.Tuple)
+                and all(isinstance(e, ast.Name) for e in target.elts)
+            ):
+                return AssignmentStatement
+        return None
+
     def _add_node_converter(
         self, converter: ty.Union[AddInterfaceStatement, AddNestedWorkflowStatement]
     ):
@@ -1205,7 +1813,7 @@ def test_{self.name}():
         )
         dct = attrs.asdict(conv)
         dct["nipype_module"] = dct["nipype_module"].__name__
-        for n in ["package", "nodes", "used_inputs", "_unprocessed_connections"]:
+        for n in ["package", "nodes", "_unprocessed_connections"]:
             del dct[n]
         for k in dct:
             if not dct[k]: